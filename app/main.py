@@ -1,6 +1,7 @@
 import os
 import sys
-from flask import Flask, jsonify, request, render_template, redirect, session, flash, url_for
+from flask import (Flask, Response, abort, jsonify, request, render_template, redirect, session, flash, url_for,
+                   send_from_directory)
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
@@ -8,20 +9,26 @@ import sqlite3
 import time
 import uuid
 from datetime import datetime
-import pickle
+import base64
+import binascii
+import hmac
+import io
 from flask_wtf.csrf import CSRFProtect
+from PIL import Image
 
 # Ajouter le répertoire parent au chemin de recherche Python
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Configuration de Matplotlib pour utiliser un backend non-interactif
-import matplotlib
-matplotlib.use('Agg')  # Utiliser le backend Agg qui ne nécessite pas de GUI
-
 # --- Local imports ---
-from src.retrieval import load_features, search
-from src.config import IMAGE_DATASET_PATH, MODELS_TO_INDEX
-from src.evaluation import get_image_class, calculate_average_precision
+from src.retrieval import load_features, search, search_batch, supported_metrics
+from src.config import IMAGE_DATASET_PATH, MODELS_TO_INDEX, API_MAX_IMAGES, THUMBNAIL_PATH, THUMBNAIL_MAX_AGE
+from src.engine import SUPPORTED_METRICS
+from src.evaluation import average_precision_from_labels
+from src.metadata import get_metadata
+from src.result_store import get_result_store
+from src.sidecar import SidecarBusy, SidecarUnavailable, get_sidecar_client
+from src.telemetry import end_request, get_metrics_registry, server_timing_header, span, start_request
+from src.thumbnails import get_thumbnail_index
 
 UPLOAD_FOLDER = os.path.join("app", "static", "uploads")
 
@@ -32,6 +39,12 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'changez-moi-en-production')
+# Jeton des services appelant l'API (en-tête « Authorization: Bearer <jeton> ») ;
+# sans jeton configuré, seule une session connectée donne accès à l'API
+API_TOKEN = os.environ.get('API_TOKEN')
+# Jeton exigé par /metrics (même en-tête) ; sans jeton configuré, la route doit
+# rester derrière le proxy (non exposée publiquement)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg'}
 
@@ -89,6 +102,46 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def bearer_token_valid(expected):
+    """Vérifie l'en-tête « Authorization: Bearer <jeton> » de la requête."""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return bool(expected) and scheme.lower() == 'bearer' and hmac.compare_digest(token.strip(), expected)
+
+def api_auth_required(f):
+    """Accès à l'API : session connectée ou jeton API, réponse JSON 401 sinon."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session and not bearer_token_valid(API_TOKEN):
+            return jsonify({'error': 'Authentification requise.'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+@app.before_request
+def start_timing():
+    start_request()
+
+@app.after_request
+def add_server_timing(response):
+    """
+    Durée de chaque étape de la requête (en-tête Server-Timing, visible dans les
+    outils de développement du navigateur) ; les routes /static et /metrics ne
+    sont pas comptées dans l'histogramme des requêtes.
+    """
+    endpoint = request.endpoint or 'unknown'
+    timings, total = end_request(endpoint, record=endpoint not in ('static', 'metrics'))
+    response.headers['Server-Timing'] = server_timing_header(timings, total)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """
+    Histogrammes des étapes et indicateurs de l'inférence, agrégés sur tous les
+    workers (format Prometheus). Si METRICS_TOKEN est défini, le jeton est exigé.
+    """
+    if METRICS_TOKEN and not bearer_token_valid(METRICS_TOKEN):
+        return Response('Authentification requise.\n', status=401, mimetype='text/plain')
+    return Response(get_metrics_registry().render(), mimetype='text/plain; version=0.0.4')
+
 init_db()
 print("Chargement des descripteurs en mémoire...")
 ALL_FEATURES = load_features()
@@ -164,6 +217,122 @@ def logout():
 def search_page():
     return render_template('index.html')
 
+def static_image_url(path):
+    """URL servie par Flask d'une image de la base ; les autres chemins sont retournés tels quels."""
+    # Si le chemin contient 'image.orig', le convertir en URL statique
+    if 'image.orig' in path:
+        return url_for('static', filename=f'image.orig/{os.path.basename(path)}')
+    return path
+
+def thumbnail_url(path):
+    """URL de la vignette d'une image de la base, ou de l'image elle-même si elle n'en a pas."""
+    name = get_thumbnail_index().name_of(path)
+    if name is None:
+        return static_image_url(path)
+    return url_for('thumbnail', filename=name)
+
+@app.route('/thumbnails/<path:filename>')
+def thumbnail(filename):
+    """
+    Vignette d'une image de la base. Son nom dépend du contenu : elle est mise en
+    cache par le navigateur sans jamais être revalidée (immutable), et l'ETag
+    permet de répondre 304 aux requêtes conditionnelles.
+    """
+    if filename == 'index.json':
+        abort(404)
+    etag = os.path.splitext(os.path.basename(filename))[0]
+    response = send_from_directory(os.path.abspath(THUMBNAIL_PATH), filename,
+                                   max_age=THUMBNAIL_MAX_AGE, etag=etag)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def rank_query(query_path, model, similarity, top_n, depth):
+    """
+    Classement (identifiants, distances) des meilleurs résultats, calculé par le
+    service d'inférence partagé s'il est disponible, sinon dans le worker : les
+    max(`top_n`, `depth`) premiers résultats du classement exact (pour une image de la
+    base, le graphe des voisins ne suffit que jusqu'à sa profondeur ; au-delà, les
+    distances à toute la base sont calculées).
+    Le service reçoit la ligne d'une image de la base, ou le contenu de toute autre
+    image, et l'empreinte du store du worker : s'il n'est pas lancé ou n'a pas chargé
+    le même store (réindexation sans redémarrage), la recherche est faite dans le
+    worker. S'il ne répond pas, SidecarBusy est propagée (erreur 503) : le worker ne
+    charge pas ses propres modèles.
+    """
+    client = get_sidecar_client()
+    if client is not None and model in ALL_FEATURES:
+        dataset_features = ALL_FEATURES[model]
+        try:
+            with span('sidecar'):
+                row = dataset_features.row_of(query_path)
+                if row is None:
+                    with open(query_path, 'rb') as f:
+                        query = f.read()
+                else:
+                    query = row
+                return client.search(query, model, similarity, top_n, depth, dataset_features.fingerprint)
+        except SidecarUnavailable as e:
+            print(f"{e} Recherche dans le worker.")
+    ranking = search(query_path, model, ALL_FEATURES, distance_metric=similarity, top_n=top_n)
+    with span('sort'):
+        return ranking.top_ids(max(top_n, depth))
+
+def rank_images(images_data, model, similarity, top_n):
+    """Un classement (identifiants, distances) par image requête, comme `rank_query`."""
+    client = get_sidecar_client()
+    if client is not None and model in ALL_FEATURES:
+        try:
+            with span('sidecar'):
+                return client.search_images(images_data, model, similarity, top_n, ALL_FEATURES[model].fingerprint)
+        except SidecarUnavailable as e:
+            print(f"{e} Recherche dans le worker.")
+    rankings = search_batch(images_data, model, ALL_FEATURES, distance_metric=similarity, top_n=top_n)
+    with span('sort'):
+        return [ranking.top_ids(top_n) for ranking in rankings]
+
+def metric_applicable(model, similarity):
+    """Vérifie que la métrique s'applique aux descripteurs du modèle (message affiché sinon)."""
+    if model in ALL_FEATURES and similarity not in supported_metrics(model):
+        flash(f"La similarité '{similarity}' ne s'applique pas aux descripteurs réduits par ACP du modèle {model}. "
+              "Choisissez la distance euclidienne, le cosinus ou la corrélation.", 'danger')
+        return False
+    return True
+
+def run_search(save_path, image_source, image_class, model, similarity, top_n):
+    """
+    Lance la recherche, stocke ses résultats et enregistre les informations
+    nécessaires à la page de résultats dans la session.
+    """
+    # Recherche des images similaires : une seule extraction et un seul calcul des distances.
+    # On garde tous les résultats pour la courbe R/P (jusqu'à 1000), issus du même classement
+    # exact : identifiants des images (lignes du store) et distances. La courbe et la
+    # précision moyenne ne dépendent donc pas de l'existence du graphe des voisins.
+    all_ids, all_scores = rank_query(save_path, model, similarity, top_n, 1000)
+
+    # La classe d'une image de la base est connue par les métadonnées de l'index
+    metadata = get_metadata(model, ALL_FEATURES[model])
+    image_id = metadata.id_of(save_path)
+    if image_id is not None:
+        image_class = metadata.label_of(image_id)
+    
+    # Créer un identifiant unique pour cette recherche
+    search_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}"
+    
+    # Stocker les informations minimales dans la session
+    session['query_path'] = save_path
+    session['model'] = model
+    session['similarity'] = similarity
+    session['top_n'] = top_n
+    session['search_id'] = search_id
+    session['image_class'] = image_class  # Stocker la classe de l'image pour la courbe R/P
+    session['image_source'] = image_source  # Stocker la source de l'image
+    
+    # Les résultats ne sont pas gardés dans la session mais dans le stockage des
+    # résultats (mémoire du worker + base partagée), sous forme de tableaux compacts
+    with span('store'):
+        get_result_store().put(search_id, all_ids, all_scores, ALL_FEATURES[model].fingerprint)
+
 @app.route('/search', methods=['POST'])
 @login_required
 def search_images():
@@ -172,6 +341,13 @@ def search_images():
         image_source = request.form.get('image_source', 'external')
         image_class = int(request.form.get('image_class', 0))
         
+        # Récupération des paramètres de recherche
+        model = request.form.get('model', 'resnet50')
+        similarity = request.form.get('similarity', 'cosine')
+        top_n = int(request.form.get('top_n', 5))
+        if not metric_applicable(model, similarity):
+            return render_template('index.html'), 400
+        
         # Traitement différent selon la source de l'image
         if image_source == 'external':
             # Récupération du fichier image externe
@@ -194,7 +370,8 @@ def search_images():
             # Créer un nom de fichier unique avec timestamp pour éviter les collisions
             unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}_{filename}"
             save_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(save_path)
+            with span('upload'):
+                file.save(save_path)
             
         else:  # image_source == 'database'
             # Récupération de l'image de la base de données
@@ -212,74 +389,148 @@ def search_images():
                 flash(f'Image {image_number}.jpg non trouvée dans la base de données', 'danger')
                 return redirect(url_for('search_page'))
         
-        # Récupération des paramètres de recherche
-        model = request.form.get('model', 'resnet50')
-        similarity = request.form.get('similarity', 'cosine')
-        top_n = int(request.form.get('top_n', 5))
-        
-        # Recherche des images similaires
-        results = search(save_path, model, ALL_FEATURES, distance_metric=similarity, top_n=top_n)
-        
-        # Stocker tous les résultats pour la courbe R/P (jusqu'à 1000)
-        all_results = search(save_path, model, ALL_FEATURES, distance_metric=similarity, top_n=1000)
-        
-        # Convertir les résultats complets en format sérialisable et corriger les chemins d'images
-        serializable_results = []
-        for path, score in results:
-            # Convertir les valeurs numpy en types Python natifs
-            if hasattr(score, 'item'):
-                score = score.item()
-            
-            # Corriger le chemin de l'image pour qu'il soit servi par Flask
-            # Si le chemin contient 'image.orig', le convertir en URL statique
-            if 'image.orig' in path:
-                # Extraire le nom du fichier
-                filename = os.path.basename(path)
-                # Créer un chemin relatif au dossier statique
-                corrected_path = url_for('static', filename=f'image.orig/{filename}')
-            else:
-                corrected_path = path
-                
-            serializable_results.append((corrected_path, float(score)))
-        
-        serializable_all_results = []
-        for path, score in all_results:
-            # Convertir les valeurs numpy en types Python natifs
-            if hasattr(score, 'item'):
-                score = score.item()
-            
-            # Pour all_results, on garde le chemin original pour l'évaluation
-            serializable_all_results.append((path, float(score)))
-        
-        # Au lieu de stocker tous les résultats dans la session, stockons-les dans un fichier temporaire
-        # et mettons juste le chemin du fichier dans la session
-        results_dir = os.path.join(app.static_folder, 'results')
-        os.makedirs(results_dir, exist_ok=True)
-        
-        # Créer un identifiant unique pour cette recherche
-        search_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}"
-        
-        # Stocker les informations minimales dans la session
-        session['query_path'] = save_path
-        session['model'] = model
-        session['similarity'] = similarity
-        session['top_n'] = top_n
-        session['search_id'] = search_id
-        session['image_class'] = image_class  # Stocker la classe de l'image pour la courbe R/P
-        session['image_source'] = image_source  # Stocker la source de l'image
+        run_search(save_path, image_source, image_class, model, similarity, top_n)
+        return redirect(url_for('results_page'))
         
-        # Stocker les résultats dans des fichiers temporaires
-        with open(os.path.join(results_dir, f"{search_id}_results.pkl"), 'wb') as f:
-            pickle.dump(serializable_results, f)
+    except SidecarBusy as e:
+        flash(f'Service de recherche surchargé, veuillez réessayer ({e})', 'warning')
+        return render_template('index.html'), 503
+    except Exception as e:
+        flash(f'Erreur lors de la recherche: {str(e)}', 'danger')
+        return render_template('index.html')
+
+@app.route('/similar/<int:image_number>')
+@login_required
+def similar_images(image_number):
+    """Recherche « plus comme ceci » à partir d'une image de la base affichée dans les résultats."""
+    try:
+        save_path = os.path.join(IMAGE_DATASET_PATH, f"{image_number}.jpg")
+        if not os.path.exists(save_path):
+            flash(f'Image {image_number}.jpg non trouvée dans la base de données', 'danger')
+            return redirect(url_for('search_page'))
         
-        with open(os.path.join(results_dir, f"{search_id}_all_results.pkl"), 'wb') as f:
-            pickle.dump(serializable_all_results, f)
+        # On reprend les paramètres de la recherche précédente
+        model = request.args.get('model', session.get('model', 'resnet50'))
+        similarity = request.args.get('similarity', session.get('similarity', 'cosine'))
+        top_n = int(request.args.get('top_n', session.get('top_n', 5)))
+        if not metric_applicable(model, similarity):
+            return render_template('index.html'), 400
         
+        run_search(save_path, 'database', image_number // 100, model, similarity, top_n)
         return redirect(url_for('results_page'))
         
+    except SidecarBusy as e:
+        flash(f'Service de recherche surchargé, veuillez réessayer ({e})', 'warning')
+        return render_template('index.html'), 503
     except Exception as e:
         flash(f'Erreur lors de la recherche: {str(e)}', 'danger')
-        return render_template('index.html')
+        return redirect(url_for('search_page'))
+
+def api_payload():
+    """Corps JSON d'une requête de l'API (objet vide s'il est absent ou illisible)."""
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return {}
+    if not isinstance(payload, dict):
+        raise ValueError("Le corps JSON doit être un objet.")
+    return payload
+
+def read_api_images():
+    """
+    Images envoyées à l'API : fichiers multipart (champ 'images') ou chaînes base64
+    (liste 'images' du corps JSON, préfixe « data:image/...;base64, » accepté).
+
+    Returns:
+        tuple: (noms, contenus) des images
+    """
+    if request.files:
+        files = request.files.getlist('images')
+        return [file.filename for file in files], [file.read() for file in files]
+
+    images = api_payload().get('images') or []
+    if not isinstance(images, list):
+        raise ValueError("Le champ 'images' doit être une liste.")
+    names, images_data = [], []
+    for i, image in enumerate(images):
+        name = None
+        if isinstance(image, dict):
+            name, image = image.get('name'), image.get('data')
+            if name is not None and not isinstance(name, str):
+                raise ValueError(f"Image {i} : nom invalide.")
+        if not isinstance(image, str):
+            raise ValueError(f"Image {i} : chaîne base64 attendue.")
+        try:
+            images_data.append(base64.b64decode(image.split(',', 1)[-1], validate=True))
+        except (binascii.Error, ValueError):
+            raise ValueError(f"Image {i} : encodage base64 invalide.")
+        names.append(name)
+    return names, images_data
+
+@app.route('/api/search', methods=['POST'])
+@csrf.exempt
+@api_auth_required
+def api_search():
+    """
+    Recherche par lot en JSON : toutes les images sont traitées par le modèle en un
+    seul batch et comparées à la base en une seule opération matricielle.
+    Paramètres (champs du formulaire multipart ou du corps JSON) : images, model,
+    similarity, top_n.
+    """
+    try:
+        params = request.form if request.files else api_payload()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    model = params.get('model', 'resnet50')
+    similarity = params.get('similarity', 'cosine')
+    try:
+        top_n = int(params.get('top_n', 5))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Paramètre top_n invalide.'}), 400
+    try:
+        names, images_data = read_api_images()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if model not in ALL_FEATURES:
+        return jsonify({'error': f"Modèle '{model}' non disponible."}), 400
+    if similarity not in SUPPORTED_METRICS:
+        return jsonify({'error': f"Similarité '{similarity}' non supportée."}), 400
+    if similarity not in supported_metrics(model):
+        return jsonify({'error': f"Similarité '{similarity}' non applicable aux descripteurs réduits par ACP de '{model}'."}), 400
+    if not 1 <= top_n <= 1000:
+        return jsonify({'error': 'top_n doit être compris entre 1 et 1000.'}), 400
+    if not 1 <= len(images_data) <= API_MAX_IMAGES:
+        return jsonify({'error': f"Entre 1 et {API_MAX_IMAGES} images attendues."}), 400
+
+    # Vérifier que chaque image est lisible avant de lancer le batch
+    for i, data in enumerate(images_data):
+        try:
+            Image.open(io.BytesIO(data)).verify()
+        except Exception:
+            return jsonify({'error': f"Image {i} : format d'image non reconnu."}), 400
+
+    try:
+        rankings = rank_images(images_data, model, similarity, top_n)
+    except SidecarBusy as e:
+        return jsonify({'error': f'Service de recherche surchargé, veuillez réessayer ({e})'}), 503
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors de la recherche: {str(e)}'}), 500
+
+    paths = ALL_FEATURES[model].paths
+    return jsonify({
+        'model': model,
+        'similarity': similarity,
+        'top_n': top_n,
+        'queries': [
+            {
+                'index': i,
+                'name': name,
+                'results': [{'path': static_image_url(paths[image_id]), 'score': float(score)}
+                            for image_id, score in zip(*ranking)],
+            }
+            for i, (name, ranking) in enumerate(zip(names, rankings))
+        ],
+    })
 
 @app.route('/results')
 @login_required
@@ -308,48 +559,43 @@ def results_page():
         }
         similarity_fr = similarity_translations.get(similarity, similarity)
         
-        # Récupérer les résultats depuis les fichiers temporaires
-        results_dir = os.path.join(app.static_folder, 'results')
-        
-        with open(os.path.join(results_dir, f"{search_id}_results.pkl"), 'rb') as f:
-            results = pickle.load(f)
+        # Récupérer le classement depuis le stockage des résultats
+        with span('load_results'):
+            # Un classement enregistré par un worker qui a chargé un autre store est expiré
+            stored = get_result_store().get(search_id, ALL_FEATURES[model].fingerprint) if model in ALL_FEATURES else None
+        if stored is None:
+            flash('Résultats expirés, veuillez relancer la recherche', 'warning')
+            return redirect(url_for('search_page'))
+        all_ids, all_scores = stored
         
-        with open(os.path.join(results_dir, f"{search_id}_all_results.pkl"), 'rb') as f:
-            all_results = pickle.load(f)
+        # Les `top_n` premiers résultats, avec les chemins corrigés pour être servis par Flask
+        # et la vignette affichée dans la grille
+        with span('results_build'):
+            metadata = get_metadata(model, ALL_FEATURES[model])
+            results = [(static_image_url(metadata.paths[image_id]), float(score), thumbnail_url(metadata.paths[image_id]))
+                       for image_id, score in zip(all_ids[:top_n], all_scores[:top_n])]
         
-        # Générer la courbe rappel-précision
-        pr_curve_path = None
+        # Calculer la courbe rappel-précision
+        pr_curve = None
         average_precision = None
         
         if image_class is not None:
-            # Calculer le nombre total d'images pertinentes pour cette classe
-            total_relevant_docs = 0
-            for filename in os.listdir(IMAGE_DATASET_PATH):
-                if filename.endswith('.jpg') and int(filename.split('.')[0]) // 100 == image_class:
-                    total_relevant_docs += 1
-            
-            # Calculer la courbe rappel-précision
-            ap, (recall_points, precision_points) = calculate_average_precision(all_results, image_class, total_relevant_docs)
-            average_precision = round(ap * 100, 2)  # Convertir en pourcentage et arrondir
+            with span('pr_curve'):
+                # Nombre total d'images pertinentes pour cette classe et classes des résultats :
+                # lus dans les métadonnées de l'index, sans parcourir le dossier des images
+                total_relevant_docs = metadata.class_count(image_class)
+                result_labels = metadata.labels[all_ids]
             
-            # Générer la courbe
-            import matplotlib.pyplot as plt
-            import time
+                # Calculer la courbe rappel-précision
+                ap, (recall_points, precision_points) = average_precision_from_labels(result_labels, image_class, total_relevant_docs)
+                average_precision = round(ap * 100, 2)  # Convertir en pourcentage et arrondir
             
-            plt.figure(figsize=(8, 6))
-            plt.plot(recall_points, precision_points, 'b-', linewidth=2)
-            plt.xlabel('Rappel')
-            plt.ylabel('Précision')
-            plt.title(f'Courbe Rappel/Précision - AP: {average_precision}%')
-            plt.grid(True)
-            plt.xlim([0.0, 1.0])
-            plt.ylim([0.0, 1.05])
-            
-            # Sauvegarder la courbe
-            pr_curve_filename = f"pr_curve_{search_id}.png"
-            pr_curve_path = os.path.join('results', pr_curve_filename)
-            plt.savefig(os.path.join(app.static_folder, pr_curve_path))
-            plt.close()
+                # Points de la courbe, tracée par le navigateur : pas de figure ni de
+                # fichier généré par le worker
+                pr_curve = {
+                    'recall': [round(float(recall), 4) for recall in recall_points],
+                    'precision': [round(float(precision), 4) for precision in precision_points],
+                }
         
         # Déterminer le nom de la classe à partir du numéro
         class_names = {
@@ -385,18 +631,19 @@ def results_page():
             else:
                 display_query_path = url_for('static', filename=os.path.basename(query_path))
         
-        return render_template(
-            'results.html',
-            results=results,
-            query_path=display_query_path,
-            model=model,
-            similarity=similarity_fr,
-            top_n=top_n,
-            pr_curve_path=pr_curve_path,
-            average_precision=average_precision,
-            image_class=image_class,
-            class_name=class_name
-        )
+        with span('render'):
+            return render_template(
+                'results.html',
+                results=results,
+                query_path=display_query_path,
+                model=model,
+                similarity=similarity_fr,
+                top_n=top_n,
+                pr_curve=pr_curve,
+                average_precision=average_precision,
+                image_class=image_class,
+                class_name=class_name
+            )
         
     except Exception as e:
         flash(f'Erreur lors de l\'affichage des résultats: {str(e)}', 'danger')
@@ -0,0 +1,175 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+import numpy as np
+# --- PyTorch specific imports ---
+import torch
+# --- Local imports ---
+from src import config
+
+# Format d'un rapport (JSON) :
+#   {"environment": {...}, "results": {nom: {"value", "unit", "lower_is_better", ...}}}
+# Les noms des mesures sont stables d'une exécution à l'autre (par exemple
+# "scoring/resnet50/cosine/n=10000") : ce sont les clés comparées par `compare`.
+
+# 1. MESURES
+# ==============================================================================
+def measure(fn, repeats=10, warmup=1):
+    """
+    Mesure la durée d'un appel de `fn` (en millisecondes), après `warmup` appels
+    non comptés (caches, allocations, chargement des modèles).
+
+    Returns:
+        dict: médiane (valeur comparée entre deux rapports), minimum, moyenne et 90e centile
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start_time) * 1000)
+    timings = np.asarray(timings)
+    return {
+        'value': float(np.median(timings)),
+        'unit': 'ms',
+        'lower_is_better': True,
+        'min': float(timings.min()),
+        'mean': float(timings.mean()),
+        'p90': float(np.percentile(timings, 90)),
+        'repeats': repeats,
+    }
+
+def throughput(count, duration, unit='images/s'):
+    """Débit (éléments par seconde) d'une mesure de `count` éléments en `duration` secondes."""
+    return {'value': count / duration if duration > 0 else 0.0, 'unit': unit, 'lower_is_better': False,
+            'count': count, 'duration_s': duration}
+
+def skipped(reason):
+    """Mesure non effectuée (ressources insuffisantes, dépendance absente...)."""
+    return {'skipped': reason}
+
+# 2. ENVIRONNEMENT
+# ==============================================================================
+def cpu_model():
+    """Nom du processeur (Linux : /proc/cpuinfo), ou à défaut celui donné par platform."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+def git_commit():
+    """Commit courant du dépôt, ou None hors d'un dépôt git."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment_info():
+    """Machine, versions et configuration ayant une influence sur les mesures."""
+    from src.models import get_device
+    available_cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'platform': platform.platform(),
+        'python': sys.version.split()[0],
+        'cpu': cpu_model(),
+        'cpu_count': os.cpu_count(),
+        'available_cores': available_cores,
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'device': str(get_device()),
+        'config': {
+            'INFERENCE_BACKENDS': config.INFERENCE_BACKENDS,
+            'INFERENCE_BATCHING': config.INFERENCE_BATCHING,
+            'PREPROCESS_DRAFT': config.PREPROCESS_DRAFT,
+            'QUANTIZED_MODELS': config.QUANTIZED_MODELS,
+            'REDUCTION_DIMS': config.REDUCTION_DIMS,
+            'SEARCH_EXACT': config.SEARCH_EXACT,
+            'EMBEDDING_CACHE_ENABLED': config.EMBEDDING_CACHE_ENABLED,
+        },
+    }
+
+# 3. RAPPORTS ET COMPARAISON
+# ==============================================================================
+def save_report(report, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+    return path
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(current, baseline, threshold=0.10):
+    """
+    Compare deux rapports mesure par mesure. Une mesure est une régression si
+    elle est moins bonne que la référence de plus de `threshold` (relatif) :
+    plus lente pour une durée, plus faible pour un débit. Pour une durée, le
+    minimum mesuré doit aussi dépasser la médiane de référence : un écart dû à
+    quelques répétitions bruitées n'est pas signalé.
+
+    Returns:
+        list: (nom, valeur de référence, valeur actuelle, variation relative,
+        régression ?) pour chaque mesure présente et effectuée dans les deux rapports
+    """
+    rows = []
+    for name, result in sorted(current['results'].items()):
+        reference = baseline['results'].get(name)
+        if reference is None or 'value' not in result or 'value' not in reference or not reference['value']:
+            continue
+        change = (result['value'] - reference['value']) / reference['value']
+        worse = change if result.get('lower_is_better', True) else -change
+        regression = worse > threshold
+        if regression and result.get('lower_is_better', True) and 'min' in result:
+            regression = result['min'] > reference['value']
+        rows.append((name, reference['value'], result['value'], change, regression))
+    return rows
+
+def missing_measures(current, baseline):
+    """
+    Mesures effectuées dans la référence mais absentes ou ignorées dans le rapport
+    actuel : elles ne peuvent pas être comparées, ce qui masquerait une régression.
+
+    Returns:
+        list: (nom, raison) pour chaque mesure manquante
+    """
+    missing = []
+    for name, reference in sorted(baseline['results'].items()):
+        if 'value' not in reference:
+            continue
+        result = current['results'].get(name)
+        if result is None:
+            missing.append((name, "absente du rapport"))
+        elif 'value' not in result:
+            missing.append((name, f"ignorée : {result.get('skipped', 'pas de valeur')}"))
+    return missing
+
+def print_comparison(rows, threshold, missing=()):
+    """
+    Affiche le tableau de comparaison et les mesures manquantes (voir missing_measures),
+    et retourne le nombre d'échecs (régressions et mesures manquantes).
+    """
+    print(f"{'mesure':<52} {'référence':>12} {'actuel':>12} {'variation':>10}")
+    for name, reference, value, change, regression in rows:
+        flag = '  RÉGRESSION' if regression else ''
+        print(f"{name:<52} {reference:>12.3f} {value:>12.3f} {change:>+10.1%}{flag}")
+    for name, reason in missing:
+        print(f"{name:<52} MANQUANTE ({reason})")
+    regressions = sum(regression for *_, regression in rows)
+    print(f"\n{len(rows)} mesure(s) comparée(s), {regressions} régression(s) (seuil : {threshold:.0%}), "
+          f"{len(missing)} mesure(s) de référence manquante(s).")
+    return regressions + len(missing)
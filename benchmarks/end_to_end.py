@@ -0,0 +1,64 @@
+import io
+import os
+# --- Local imports ---
+from benchmarks.common import measure, skipped
+
+def run(models, similarity='cosine', top_n=50, repeats=10, image_number=123):
+    """
+    Latence de bout en bout à travers le client de test Flask (sans réseau) :
+      - POST /search avec une image de la base (graphe des voisins / store) ;
+      - POST /search avec la même image envoyée comme fichier (passage du modèle,
+        puis cache des descripteurs après le premier appel) ;
+      - GET /results (lecture du classement stocké, vignettes, courbe R/P).
+    L'application est importée ici : ses descripteurs sont chargés au démarrage.
+    """
+    from app.main import ALL_FEATURES, UPLOAD_FOLDER, app
+    from src.config import IMAGE_DATASET_PATH
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    # Session connectée, sans créer d'utilisateur dans la base
+    with client.session_transaction() as session:
+        session['user_id'] = 'benchmark'
+
+    query_path = os.path.join(IMAGE_DATASET_PATH, f"{image_number}.jpg")
+    if not os.path.exists(query_path):
+        return {f"e2e/{model_name}/search_database": skipped(f"image {query_path} introuvable") for model_name in models}
+    with open(query_path, 'rb') as f:
+        image_data = f.read()
+    uploads_before = set(os.listdir(UPLOAD_FOLDER))
+
+    def post_search(model_name, image_source):
+        data = {'image_source': image_source, 'image_class': image_number // 100, 'model': model_name,
+                'similarity': similarity, 'top_n': top_n}
+        if image_source == 'database':
+            data['database_image'] = str(image_number)
+        else:
+            data['image'] = (io.BytesIO(image_data), f"{image_number}.jpg")
+        response = client.post('/search', data=data, content_type='multipart/form-data')
+        if response.status_code != 302:
+            raise RuntimeError(f"La recherche a échoué (code {response.status_code}).")
+
+    def get_results():
+        response = client.get('/results')
+        if response.status_code != 200:
+            raise RuntimeError(f"La page de résultats a échoué (code {response.status_code}).")
+
+    results = {}
+    try:
+        for model_name in models:
+            if model_name not in ALL_FEATURES:
+                results[f"e2e/{model_name}/search_database"] = skipped("aucun descripteur chargé")
+                continue
+            for image_source in ('database', 'external'):
+                name = f"e2e/{model_name}/search_{image_source}"
+                results[name] = measure(lambda: post_search(model_name, image_source), repeats=repeats)
+                print(f"  {name:<50} {results[name]['value']:>10.2f} ms")
+            name = f"e2e/{model_name}/results"
+            results[name] = measure(get_results, repeats=repeats)
+            print(f"  {name:<50} {results[name]['value']:>10.2f} ms")
+    finally:
+        # Les images envoyées pendant les mesures ne sont pas conservées
+        for filename in set(os.listdir(UPLOAD_FOLDER)) - uploads_before:
+            os.remove(os.path.join(UPLOAD_FOLDER, filename))
+    return results
@@ -0,0 +1,63 @@
+import time
+# --- Local imports ---
+from benchmarks.common import measure, skipped, throughput
+from src.config import EMBEDDING_CACHE_ENABLED, INDEXING_BATCH_SIZE, INDEXING_NUM_WORKERS
+from src.indexing import compute_features_multi, list_dataset_images
+from src.models import build_model, get_model
+from src.preprocessing import load_tensor
+from src.retrieval import compute_query_features, compute_query_features_batch, extract_query_features
+
+def run_queries(models, repeats=10, batch_size=16):
+    """
+    Latence de l'extraction des descripteurs d'une image requête, par modèle :
+      - sans cache (décodage, pré-traitement et passage du modèle) ;
+      - avec le cache des descripteurs (image déjà vue) ;
+      - pour un batch de `batch_size` images (API de recherche par lot).
+    Le chargement du modèle n'est pas compté (appel de préchauffage).
+    """
+    image_paths = list_dataset_images()
+    if not image_paths:
+        return {f"inference/{model_name}/single": skipped("aucune image dans le dataset") for model_name in models}
+    query_path = image_paths[0]
+    batch_paths = (image_paths * batch_size)[:batch_size]
+
+    results = {}
+    for model_name in models:
+        get_model(model_name)
+        results[f"inference/{model_name}/single"] = measure(
+            lambda: compute_query_features(query_path, model_name), repeats=repeats)
+        if EMBEDDING_CACHE_ENABLED:
+            results[f"inference/{model_name}/cached"] = measure(
+                lambda: extract_query_features(query_path, model_name), repeats=repeats)
+        else:
+            results[f"inference/{model_name}/cached"] = skipped("cache des descripteurs désactivé")
+        results[f"inference/{model_name}/batch{batch_size}"] = measure(
+            lambda: compute_query_features_batch(batch_paths, model_name), repeats=max(1, repeats // 4))
+        for name in (f"inference/{model_name}/single", f"inference/{model_name}/batch{batch_size}"):
+            print(f"  {name:<50} {results[name]['value']:>10.2f} ms")
+    return results
+
+def run_indexing(models, n_images=256, batch_size=INDEXING_BATCH_SIZE, num_workers=INDEXING_NUM_WORKERS):
+    """
+    Débit de l'indexation (images/s) sur les `n_images` premières images du
+    dataset : décodage et pré-traitement seuls, puis extraction complète par modèle.
+    """
+    image_paths = list_dataset_images()[:n_images]
+    if not image_paths:
+        return {"indexing/decode": skipped("aucune image dans le dataset")}
+
+    results = {}
+    start_time = time.perf_counter()
+    for path in image_paths:
+        load_tensor(path)
+    results["indexing/decode"] = throughput(len(image_paths), time.perf_counter() - start_time)
+
+    for model_name in models:
+        model = build_model(model_name)
+        start_time = time.perf_counter()
+        compute_features_multi({model_name: model}, image_paths, batch_size, num_workers)
+        results[f"indexing/{model_name}"] = throughput(len(image_paths), time.perf_counter() - start_time)
+        results[f"indexing/{model_name}"].update(batch_size=batch_size, num_workers=num_workers)
+    for name, result in results.items():
+        print(f"  {name:<50} {result['value']:>10.1f} images/s")
+    return results
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import numpy as np
+# --- Local imports ---
+from benchmarks.common import measure, skipped
+from src.engine import FeatureIndex, SUPPORTED_METRICS
+from src.feature_store import get_roots_paths, load_bhattacharyya_roots, save_bhattacharyya_roots
+from src.retrieval import search
+
+# Dimension des descripteurs de chaque modèle
+MODEL_DIMS = {'vgg16': 4096, 'resnet50': 2048, 'vit_b_16': 768}
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+# Nombre de lignes générées à la fois pour les grands corpus synthétiques
+BLOCK_ROWS = 65536
+
+def synthetic_index(n_images, dim, directory, seed=0):
+    """
+    Corpus synthétique de `n_images` descripteurs positifs (comme en sortie de
+    ReLU), écrit dans un fichier .npy puis ouvert en mmap comme un vrai store.
+    """
+    path = os.path.join(directory, f"synthetic_{n_images}_{dim}.npy")
+    rng = np.random.default_rng(seed)
+    matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(n_images, dim))
+    for start in range(0, n_images, BLOCK_ROWS):
+        block = rng.standard_normal((min(BLOCK_ROWS, n_images - start), dim), dtype=np.float32)
+        matrix[start:start + len(block)] = np.abs(block)
+    matrix.flush()
+    del matrix
+    paths = [f"synthetic/{i}.jpg" for i in range(n_images)]
+    return FeatureIndex(paths, np.load(path, mmap_mode='r'))
+
+def run(models, metrics=SUPPORTED_METRICS, sizes=DEFAULT_SIZES, top_n=1000, repeats=10, max_corpus_gb=4.0):
+    """
+    Durée de search() (calcul de toutes les distances et sélection des `top_n`
+    meilleurs résultats, comme pour la page de résultats) par modèle, métrique et
+    taille de corpus. La requête est une image du corpus sans graphe des voisins :
+    seule la recherche exhaustive est mesurée, sans passage du modèle.
+    Les corpus de plus de `max_corpus_gb` Go ne sont pas générés.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='benchmark_scoring_') as directory:
+        for model_name in models:
+            dim = MODEL_DIMS[model_name]
+            for n_images in sizes:
+                size_gb = n_images * dim * 4 / 1e9
+                names = [f"scoring/{model_name}/{metric}/n={n_images}" for metric in metrics]
+                if size_gb > max_corpus_gb:
+                    for name in names:
+                        results[name] = skipped(f"corpus de {size_gb:.1f} Go > {max_corpus_gb} Go")
+                    continue
+
+                index = synthetic_index(n_images, dim, directory)
+                if 'bhattacharyya' in metrics:
+                    # Racines pré-calculées comme à l'indexation
+                    save_bhattacharyya_roots('synthetic', index, directory)
+                    load_bhattacharyya_roots('synthetic', index, directory)
+                # Modèle fictif : aucun graphe des voisins ni index IVF n'est trouvé sur disque
+                all_features = {'synthetic': index}
+                query_path = index.paths[n_images // 2]
+                for name, metric in zip(names, metrics):
+                    results[name] = measure(
+                        lambda: search(query_path, 'synthetic', all_features, metric, top_n, exact=True).top_ids(top_n),
+                        repeats=repeats)
+                    results[name].update(n_images=n_images, dim=dim)
+                    print(f"  {name:<50} {results[name]['value']:>10.2f} ms")
+                del index, all_features
+                os.remove(os.path.join(directory, f"synthetic_{n_images}_{dim}.npy"))
+                for path in get_roots_paths('synthetic', directory):
+                    if os.path.exists(path):
+                        os.remove(path)
+    return results
@@ -0,0 +1,83 @@
+import argparse
+import os
+from datetime import datetime
+# --- Local imports ---
+from benchmarks.common import compare, environment_info, load_report, missing_measures, print_comparison, save_report
+from src.config import MODELS_TO_INDEX
+from src.engine import SUPPORTED_METRICS
+
+SUITES = ('scoring', 'inference', 'indexing', 'e2e')
+RESULTS_PATH = os.path.join('benchmarks', 'results')
+
+def main(suites, models, metrics, sizes, repeats, max_corpus_gb, n_images, output_path):
+    """Lance les suites demandées et écrit le rapport JSON (environnement + mesures)."""
+    report = {'environment': environment_info(), 'results': {}}
+    print(f"Benchmarks sur {report['environment']['cpu']} ({report['environment']['available_cores']} cœur(s), "
+          f"torch {report['environment']['torch']}, {report['environment']['device']})")
+
+    if 'scoring' in suites:
+        from benchmarks import scoring
+        print("\n--- Calcul des distances (corpus synthétiques) ---")
+        report['results'].update(scoring.run(models, metrics, sizes, repeats=repeats, max_corpus_gb=max_corpus_gb))
+    if 'inference' in suites:
+        from benchmarks import inference
+        print("\n--- Extraction des descripteurs des images requêtes ---")
+        report['results'].update(inference.run_queries(models, repeats=repeats))
+    if 'indexing' in suites:
+        from benchmarks import inference
+        print("\n--- Débit de l'indexation ---")
+        report['results'].update(inference.run_indexing(models, n_images=n_images))
+    if 'e2e' in suites:
+        from benchmarks import end_to_end
+        print("\n--- Recherche de bout en bout (/search + /results) ---")
+        report['results'].update(end_to_end.run(models, repeats=repeats))
+
+    save_report(report, output_path)
+    print(f"\nRapport sauvegardé : {output_path}")
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mesures de performance reproductibles du moteur de recherche.")
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES),
+                        help="Suites à lancer (par défaut : toutes)")
+    parser.add_argument('--models', nargs='+', default=list(MODELS_TO_INDEX.keys()),
+                        help="Modèles mesurés")
+    parser.add_argument('--metrics', nargs='+', choices=SUPPORTED_METRICS, default=list(SUPPORTED_METRICS),
+                        help="Métriques mesurées par la suite scoring")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help="Tailles des corpus synthétiques de la suite scoring")
+    parser.add_argument('--max-corpus-gb', type=float, default=4.0,
+                        help="Taille maximale d'un corpus synthétique (les plus grands sont ignorés)")
+    parser.add_argument('--images', type=int, default=256,
+                        help="Nombre d'images indexées par la suite indexing")
+    parser.add_argument('--repeats', type=int, default=10, help="Nombre de répétitions de chaque mesure")
+    parser.add_argument('--output', default=None,
+                        help="Fichier JSON du rapport (par défaut : benchmarks/results/<date>.json)")
+    parser.add_argument('--compare', metavar='REFERENCE.json',
+                        help="Compare le rapport à une référence et signale les régressions et les mesures "
+                             "de référence manquantes (code de sortie 1)")
+    parser.add_argument('--input', metavar='RAPPORT.json',
+                        help="Avec --compare : compare ce rapport existant au lieu de lancer les mesures")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Dégradation relative au-delà de laquelle une mesure est une régression")
+    args = parser.parse_args()
+
+    if args.input:
+        if not args.compare:
+            parser.error("--input s'utilise avec --compare")
+        report = load_report(args.input)
+    else:
+        output_path = args.output or os.path.join(RESULTS_PATH, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+        report = main(args.suites, args.models, args.metrics, args.sizes, args.repeats,
+                      args.max_corpus_gb, args.images, output_path)
+
+    if args.compare:
+        baseline = load_report(args.compare)
+        print(f"\n--- Comparaison avec {args.compare} ---")
+        for key in ('cpu', 'available_cores', 'torch', 'device'):
+            if baseline['environment'].get(key) != report['environment'].get(key):
+                print(f"Attention : environnement différent ({key} : {baseline['environment'].get(key)} "
+                      f"-> {report['environment'].get(key)}), les écarts ne sont pas directement comparables.")
+        if print_comparison(compare(report, baseline, args.threshold), args.threshold,
+                            missing_measures(report, baseline)):
+            raise SystemExit(1)
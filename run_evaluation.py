@@ -1,15 +1,148 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import os
 import time
-from tqdm import tqdm # Une belle barre de progression
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+from PIL import Image
+import torch
 
 # --- Local imports ---
-from src.config import MODELS_TO_INDEX, IMAGE_DATASET_PATH
-from src.retrieval import load_features, search
-from src.evaluation import get_image_class, calculate_average_precision
+from src.config import (MODELS_TO_INDEX, IMAGE_DATASET_PATH, IVF_METRICS, QUANTIZATION_RERANK, REDUCTION_WHITEN,
+                        PREPROCESS_MIN_COSINE)
+from src.backends import BACKENDS, build_backend
+from src.engine import SUPPORTED_METRICS, top_k
+from src.feature_store import feature_store_exists, load_feature_store
+from src.ivf import IVFIndex
+from src.metadata import get_metadata
+from src.models import build_model, get_device, get_model
+from src.preprocessing import REFERENCE_TRANSFORM, compare_with_reference, load_tensor, preprocess_batch
+from src.quantization import QUANTIZATION_MODES, QuantizedFeatureIndex
+from src.reduction import Projection
+from src.retrieval import load_features, extract_query_features
+from src.evaluation import (get_image_classes, rank_rows, relevance_matrix, average_precisions, r_precisions,
+                            precision_recall_points, interpolated_precisions)
 
-def main():
+def get_query_image_paths():
+    """
+    Images requêtes utilisées pour l'évaluation.
+    Pour un bon score, on prend plusieurs images de chaque classe.
+    On prend 10 images par classe pour une meilleure représentativité
+    """
+    query_image_paths = []
+    for class_start in range(0, 1000, 100):  # Pour chaque classe (0, 100, 200, ...)
+        for offset in range(0, 100, 10):      # Prendre 10 images par classe (0, 10, 20, ..., 90)
+            img_path = os.path.join(IMAGE_DATASET_PATH, f"{class_start + offset}.jpg")
+            if os.path.exists(img_path):
+                query_image_paths.append(img_path)
+    return query_image_paths
+
+def get_query_features(query_path, model_name, dataset_features):
+    """Descripteur d'une image requête : celui du store si elle est indexée, sinon extrait par le modèle."""
+    row = dataset_features.row_of(query_path)
+    if row is not None:
+        return np.asarray(dataset_features.matrix[row])
+    return extract_query_features(query_path, model_name)
+
+def mean_average_precision(distances, query_classes, corpus_classes, depth=1000):
+    """MAP d'une matrice de distances requêtes x base (une ligne par requête)."""
+    relevant = relevance_matrix(rank_rows(np.asarray(distances), depth), query_classes, corpus_classes)
+    return float(average_precisions(relevant).mean())
+
+def candidates_mean_average_precision(results, query_classes, corpus_classes, depth=1000):
+    """
+    MAP de recherches limitées à des candidats (index IVF) : chaque requête est
+    classée parmi ses seules lignes candidates (liste de (lignes, distances)). La
+    précision est moyennée sur toutes les images pertinentes de la base (au plus
+    `depth`) : celles des listes non sondées comptent comme non retrouvées.
+    """
+    class_counts = {label: count for label, count in zip(*np.unique(corpus_classes, return_counts=True))}
+    aps = []
+    for (rows, distances), query_class in zip(results, query_classes):
+        total_relevant = min(class_counts.get(query_class, 0), depth) if query_class >= 0 else 0
+        if total_relevant == 0:
+            aps.append(0.0)
+            continue
+        ranking = rows[top_k(distances, depth)]
+        ranks = np.flatnonzero(corpus_classes[ranking] == query_class) + 1
+        aps.append(float((np.arange(1, len(ranks) + 1) / ranks).sum() / total_relevant))
+    return float(np.mean(aps)) if aps else 0.0
+
+# Données partagées avec les processus d'évaluation, par modèle :
+# (index, requêtes, classes des requêtes, classes des images de la base)
+_grid_data = {}
+
+def _init_grid_worker(grid_data):
+    _grid_data.update(grid_data)
+
+def evaluate_combination(model_name, similarity, depth=1000, total_relevant_docs=100):
+    """
+    Évalue une combinaison modèle x métrique : une matrice de distances requêtes x
+    base, puis AP, MAP et R-précision calculées en numpy sur les classes.
+    """
+    index, queries, query_classes, corpus_classes = _grid_data[model_name]
+    start_time = time.perf_counter()
+    distances = index.scores(queries, similarity)
+    relevant = relevance_matrix(rank_rows(distances, depth), query_classes, corpus_classes)
+    aps = average_precisions(relevant)
+    return {
+        'map': float(aps.mean()),
+        'r_precision': float(r_precisions(relevant, total_relevant_docs).mean()),
+        'average_precisions': aps,
+        'relevant': relevant,
+        'duration': time.perf_counter() - start_time,
+    }
+
+def evaluate_grid(all_features, query_image_paths, similarity_metrics, jobs=None):
+    """
+    Évalue toutes les combinaisons modèle x métrique. Les descripteurs des requêtes
+    sont calculés une seule fois par modèle (ceux des images de la base sont lus
+    dans le store) ; les combinaisons sont réparties sur `jobs` processus.
+
+    Returns:
+        dict: {(modèle, métrique): résultats de `evaluate_combination`}
+    """
+    grid_data = {}
+    for model_name in MODELS_TO_INDEX.keys():
+        if model_name not in all_features:
+            continue
+        index = all_features[model_name]
+        queries = np.stack([get_query_features(path, model_name, index) for path in query_image_paths])
+        grid_data[model_name] = (index, queries, get_image_classes(query_image_paths), get_metadata(model_name, index).labels)
+
+    combinations = [(model_name, similarity) for model_name in grid_data for similarity in similarity_metrics]
+    if jobs == 1:
+        _init_grid_worker(grid_data)
+        results = [evaluate_combination(*combination) for combination in combinations]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_grid_worker, initargs=(grid_data,)) as executor:
+            results = list(executor.map(evaluate_combination, *zip(*combinations)))
+    return dict(zip(combinations, results))
+
+def render_query_curves(model_name, similarity, query_curves, output_path):
+    """
+    Trace la courbe Rappel/Précision de chaque requête d'une combinaison modèle x
+    métrique, une page par requête, dans un seul fichier PDF.
+    """
+    with PdfPages(output_path) as pdf:
+        for query_id, (recalls, precisions) in query_curves.items():
+            fig = plt.figure(figsize=(10, 8))
+            if recalls and precisions:
+                plt.plot(recalls, precisions, marker='o', linestyle='--',
+                         label=f'{model_name.upper()} - {similarity}')
+                plt.legend(fontsize=12)
+            plt.xlabel('Rappel (Recall)', fontsize=14)
+            plt.ylabel('Précision (Precision)', fontsize=14)
+            plt.title(f'Courbe Rappel/Précision pour la requête "{query_id}.jpg"', fontsize=16)
+            plt.grid(True)
+            plt.xlim([0.0, 1.0])
+            plt.ylim([0.0, 1.05])
+            pdf.savefig(fig)
+            plt.close(fig)
+    return output_path
+
+def main(jobs=None, n_points=11, plots=False):
     """
     Script principal pour évaluer et comparer les modèles en utilisant la MAP et tracer les courbes R/P.
     """
@@ -21,21 +154,14 @@ def main():
     print("Descripteurs chargés.")
 
     # 2. Définir les images requêtes pour l'évaluation
-    # Pour un bon score, on prend plusieurs images de chaque classe.
-    # On prend 10 images par classe pour une meilleure représentativité
-    query_image_paths = []
-    for class_start in range(0, 1000, 100):  # Pour chaque classe (0, 100, 200, ...)
-        for offset in range(0, 100, 10):      # Prendre 5 images par classe (0, 10, 20, 30, 40)
-            img_path = os.path.join(IMAGE_DATASET_PATH, f"{class_start + offset}.jpg")
-            if os.path.exists(img_path):
-                query_image_paths.append(img_path)
+    query_image_paths = get_query_image_paths()
     
     print(f"Évaluation sur {len(query_image_paths)} images requêtes")
     
-    # 3. Boucler sur chaque modèle pour l'évaluer
+    # 3. Évaluer chaque combinaison modèle x métrique
     final_results = {}
-    # Dictionnaire pour stocker les points des courbes pour chaque requête
-    all_curves = {}
+    # Courbes R/P interpolées moyennes, par combinaison
+    mean_curves = {}
     
     # Définir les méthodes de similarité à évaluer
     similarity_metrics = ['euclidean', 'chi_square', 'correlation', 'bhattacharyya', 'cosine']
@@ -44,88 +170,47 @@ def main():
     if not os.path.exists('results'):
         os.makedirs('results')
 
-    for model_name in MODELS_TO_INDEX.keys():
-        print(f"\n--- Évaluation du modèle : {model_name} ---")
-        
-        # Stocker les résultats pour chaque métrique de similarité
-        for similarity in similarity_metrics:
-            model_similarity_key = f"{model_name}_{similarity}"
-            print(f"  Utilisation de la métrique : {similarity}")
-            
-            average_precisions = []
-            start_time = time.time()
-            
-            # Stocker les courbes pour chaque requête
-            query_curves = {}
-            
-            # Utiliser tqdm pour une barre de progression
-            for i, query_path in enumerate(tqdm(query_image_paths, desc=f"Requêtes pour {model_name} ({similarity})")):
-                # Lancer une recherche pour la requête sur TOUTE la base de données
-                ranked_results = search(query_path, model_name, all_features, distance_metric=similarity, top_n=1000)
-
-                # Obtenir la vérité terrain
-                query_class = get_image_class(query_path)
-                total_relevant_docs = 100 # Il y a 100 images dans chaque classe
-
-                # Calculer l'AP pour cette requête ET récupérer les points de la courbe
-                ap, pr_points = calculate_average_precision(ranked_results, query_class, total_relevant_docs)
-                average_precisions.append(ap)
-                
-                # Sauvegarder la courbe pour cette requête
-                query_id = os.path.basename(query_path).split('.')[0]
-                query_curves[query_id] = pr_points
-            
-            # Calculer la MAP (Mean Average Precision)
-            map_score = np.mean(average_precisions)
-            end_time = time.time()
-
-            final_results[model_similarity_key] = {
-                'map': map_score,
-                'duration': end_time - start_time
-            }
-            
-            all_curves[model_similarity_key] = query_curves
-            
-            # Générer une courbe pour chaque requête
-            for query_id, pr_points in query_curves.items():
-                plt.figure(figsize=(10, 8))
-                recalls, precisions = pr_points
-                
-                if recalls and precisions:
-                    plt.plot(recalls, precisions, marker='o', linestyle='--', 
-                             label=f'{model_name.upper()} - {similarity}')
-                    
-                    plt.xlabel('Rappel (Recall)', fontsize=14)
-                    plt.ylabel('Précision (Precision)', fontsize=14)
-                    plt.title(f'Courbe Rappel/Précision pour la requête "{query_id}.jpg"', fontsize=16)
-                    plt.legend(fontsize=12)
-                    plt.grid(True)
-                    plt.xlim([0.0, 1.0])
-                    plt.ylim([0.0, 1.05])
-                    
-                    output_path = f'results/pr_curve_{model_name}_{similarity}_{query_id}.png'
-                    plt.savefig(output_path)
-                    plt.close()
+    # Toutes les combinaisons modèle x métrique sont évaluées en parallèle, chacune
+    # par une seule matrice de distances requêtes x base
+    start_time = time.time()
+    grid_results = evaluate_grid(all_features, query_image_paths, similarity_metrics, jobs)
+    print(f"{len(grid_results)} combinaisons évaluées en {time.time() - start_time:.2f} secondes")
+    total_relevant_docs = 100 # Il y a 100 images dans chaque classe
+
+    for combination, result in grid_results.items():
+        final_results[combination] = {
+            'map': result['map'],
+            'r_precision': result['r_precision'],
+            'duration': result['duration']
+        }
+        # Précision interpolée sur N niveaux de rappel, moyennée sur les requêtes
+        recall_levels, precisions = interpolated_precisions(result['relevant'], total_relevant_docs, n_points)
+        mean_curves[combination] = (recall_levels, precisions.mean(axis=0))
+
+    # Courbes de chaque requête (optionnel) : un PDF par combinaison, tracés en parallèle
+    if plots:
+        query_ids = [os.path.basename(query_path).split('.')[0] for query_path in query_image_paths]
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(render_query_curves, model_name, similarity,
+                                dict(zip(query_ids, precision_recall_points(result['relevant'], total_relevant_docs))),
+                                f'results/pr_curves_{model_name}_{similarity}.pdf')
+                for (model_name, similarity), result in grid_results.items()]
+            for future in futures:
+                print(f"Courbes par requête sauvegardées dans : {future.result()}")
 
     # 4. Afficher les résultats finaux
     print("\n\n--- Résultats finaux de l'évaluation ---")
     print("-----------------------------------------")
-    for result_key, scores in final_results.items():
-        # Correction pour gérer les clés avec plusieurs underscores
-        parts = result_key.split('_')
-        model = parts[0]
-        similarity = '_'.join(parts[1:])  # Combine les parties restantes pour la similarité
+    for (model, similarity), scores in final_results.items():
         print(f"Modèle : {model.upper()} - Similarité : {similarity}")
         print(f"  - Score MAP      : {scores['map']:.4f}")
+        print(f"  - R-précision    : {scores['r_precision']:.4f}")
         print(f"  - Durée totale   : {scores['duration']:.2f} secondes")
         print("-----------------------------------------")
     
-    best_result = max(final_results, key=lambda m: final_results[m]['map'])
-    # Correction pour gérer les clés avec plusieurs underscores
-    parts = best_result.split('_')
-    best_model = parts[0]
-    best_similarity = '_'.join(parts[1:])
-    print(f"\nLa meilleure combinaison est : {best_model.upper()} avec {best_similarity} - Score MAP de {final_results[best_result]['map']:.4f}")
+    best_model, best_similarity = max(final_results, key=lambda m: final_results[m]['map'])
+    print(f"\nLa meilleure combinaison est : {best_model.upper()} avec {best_similarity} - Score MAP de {final_results[(best_model, best_similarity)]['map']:.4f}")
 
     # 5. Générer un graphique comparatif des courbes Rappel/Précision moyennes
     print("\nGénération du graphique comparatif des courbes Rappel/Précision moyennes...")
@@ -142,56 +227,19 @@ def main():
     # Marqueurs variés
     markers = ['o', 's', '^', 'D', '*', 'x', '+']
     
-    color_idx = 0
-    for result_key, query_curves in all_curves.items():
-        # Correction pour gérer les clés avec plusieurs underscores
-        parts = result_key.split('_')
-        model = parts[0]
-        similarity = '_'.join(parts[1:])
-        
-        # Calculer les courbes moyennes pour toutes les requêtes
-        avg_recalls = []
-        avg_precisions = []
-        
-        # Collecter tous les points de rappel uniques à travers toutes les requêtes
-        all_recall_points = set()
-        for query_id, (recalls, _) in query_curves.items():
-            all_recall_points.update(recalls)
-        
-        all_recall_points = sorted(list(all_recall_points))
-        
-        # Pour chaque point de rappel, calculer la précision moyenne
-        for recall_point in all_recall_points:
-            precisions_at_recall = []
-            
-            for query_id, (recalls, precisions) in query_curves.items():
-                # Trouver l'index du point de rappel le plus proche
-                if recalls:  # Vérifier que la liste n'est pas vide
-                    closest_idx = min(range(len(recalls)), key=lambda i: abs(recalls[i] - recall_point))
-                    # Si le rappel est suffisamment proche, ajouter la précision correspondante
-                    if abs(recalls[closest_idx] - recall_point) < 0.05:  # Tolérance de 0.05
-                        precisions_at_recall.append(precisions[closest_idx])
-            
-            # S'il y a des précisions à ce point de rappel, calculer la moyenne
-            if precisions_at_recall:
-                avg_recalls.append(recall_point)
-                avg_precisions.append(sum(precisions_at_recall) / len(precisions_at_recall))
-        
-        # Tracer la courbe moyenne si nous avons des points
-        if avg_recalls and avg_precisions:
-            # Utiliser une combinaison unique de couleur, style et marqueur
-            plt.plot(avg_recalls, avg_precisions, 
-                     color=colors[color_idx % len(colors)],
-                     linestyle=styles[(color_idx // len(colors)) % len(styles)],
-                     marker=markers[(color_idx // (len(colors) * len(styles))) % len(markers)],
-                     markersize=4,  # Réduire la taille des marqueurs
-                     linewidth=2,   # Augmenter l'épaisseur des lignes
-                     label=f'{model.upper()} - {similarity}')
-            color_idx += 1
+    for color_idx, ((model, similarity), (recall_levels, avg_precisions)) in enumerate(mean_curves.items()):
+        # Utiliser une combinaison unique de couleur, style et marqueur
+        plt.plot(recall_levels, avg_precisions, 
+                 color=colors[color_idx % len(colors)],
+                 linestyle=styles[(color_idx // len(colors)) % len(styles)],
+                 marker=markers[(color_idx // (len(colors) * len(styles))) % len(markers)],
+                 markersize=4,  # Réduire la taille des marqueurs
+                 linewidth=2,   # Augmenter l'épaisseur des lignes
+                 label=f'{model.upper()} - {similarity}')
     
     plt.xlabel('Rappel (Recall)', fontsize=14)
-    plt.ylabel('Précision (Precision)', fontsize=14)
-    plt.title(f'Comparaison des courbes Rappel/Précision moyennes', fontsize=16)
+    plt.ylabel('Précision interpolée (Precision)', fontsize=14)
+    plt.title(f'Comparaison des courbes Rappel/Précision moyennes ({n_points} points)', fontsize=16)
     plt.legend(fontsize=12, loc='lower left', bbox_to_anchor=(0, 0), ncol=2)  # Légende plus lisible
     plt.grid(True, alpha=0.3)  # Grille plus discrète
     plt.xlim([0.0, 1.0])
@@ -202,5 +250,242 @@ def main():
     print(f"Graphique comparatif sauvegardé dans : {output_path}")
 
 
+def evaluate_ann(nprobes=(1, 2, 4, 8, 16, 32), k=10):
+    """
+    Rapport rappel@k / latence / MAP de la recherche approximative IVF par rapport
+    à la recherche exhaustive, pour différentes valeurs de nprobe.
+    """
+    print("--- Évaluation de la recherche approximative (IVF) ---")
+    all_features = load_features()
+    query_image_paths = get_query_image_paths()
+    query_classes = get_image_classes(query_image_paths)
+
+    for model_name, dataset_features in all_features.items():
+        corpus_classes = get_metadata(model_name, dataset_features).labels
+        for similarity in IVF_METRICS:
+            ivf = IVFIndex.load(model_name, similarity, dataset_features.fingerprint, dataset_features.dim)
+            if ivf is None:
+                print(f"\nAucun index IVF à jour pour {model_name} ({similarity}) : lancez 'python run_indexing.py --ivf'.")
+                continue
+
+            queries = [get_query_features(path, model_name, dataset_features) for path in query_image_paths]
+
+            # Référence : recherche exhaustive
+            start_time = time.perf_counter()
+            exact_distances = [dataset_features.scores(query, similarity) for query in queries]
+            exact_top = [set(top_k(distances, k).tolist()) for distances in exact_distances]
+            exact_latency = (time.perf_counter() - start_time) / len(queries)
+            exact_map = mean_average_precision(exact_distances, query_classes, corpus_classes)
+
+            print(f"\nModèle : {model_name.upper()} - Similarité : {similarity} - {ivf.n_lists} listes")
+            print(f"  {'nprobe':>8} {'rappel@' + str(k):>10} {'latence (ms)':>13} {'MAP':>8}")
+            print(f"  {'exact':>8} {1.0:>10.4f} {exact_latency * 1000:>13.3f} {exact_map:>8.4f}")
+
+            for nprobe in nprobes:
+                if nprobe > ivf.n_lists:
+                    break
+                start_time = time.perf_counter()
+                approx_results = [ivf.search(dataset_features, query, nprobe) for query in queries]
+                approx_top = [rows[top_k(distances, k)].tolist() for rows, distances in approx_results]
+                latency = (time.perf_counter() - start_time) / len(queries)
+
+                recall = np.mean([len(exact & set(approx)) / len(exact) for exact, approx in zip(exact_top, approx_top)])
+                map_score = candidates_mean_average_precision(approx_results, query_classes, corpus_classes)
+                print(f"  {nprobe:>8} {recall:>10.4f} {latency * 1000:>13.3f} {map_score:>8.4f}")
+
+def evaluate_quantization(modes=QUANTIZATION_MODES, rerank=QUANTIZATION_RERANK):
+    """
+    Rapport de la perte de MAP due au stockage quantifié des descripteurs, par
+    métrique, avec et sans re-classement exact des `rerank` meilleurs candidats.
+    """
+    print("--- Évaluation du stockage quantifié des descripteurs ---")
+    all_features = load_features()
+    query_image_paths = get_query_image_paths()
+    query_classes = get_image_classes(query_image_paths)
+
+    for model_name, dataset_features in all_features.items():
+        # Référence float32, même si un store quantifié est configuré pour ce modèle
+        exact_index = getattr(dataset_features, 'exact_index', None) or dataset_features
+        queries = np.stack([get_query_features(path, model_name, exact_index) for path in query_image_paths])
+        corpus_classes = get_metadata(model_name, exact_index).labels
+        quantized = {mode: QuantizedFeatureIndex.from_index(exact_index, mode, rerank=0) for mode in modes}
+        size_mb = exact_index.matrix.nbytes / 1e6
+
+        print(f"\nModèle : {model_name.upper()} - {size_mb:.1f} Mo en float32")
+        header = "".join(f"{mode:>12}{mode + '+rerank':>16}" for mode in modes)
+        print(f"  {'métrique':<14}{'float32':>10}{header}")
+        for similarity in SUPPORTED_METRICS:
+            reference = mean_average_precision(exact_index.scores(queries, similarity), query_classes, corpus_classes)
+            row = f"  {similarity:<14}{reference:>10.4f}"
+            for mode, index in quantized.items():
+                index.rerank = 0
+                plain = mean_average_precision(index.scores(queries, similarity), query_classes, corpus_classes) - reference
+                index.rerank = rerank
+                reranked = mean_average_precision(index.scores(queries, similarity), query_classes, corpus_classes) - reference
+                row += f"{plain:>+12.4f}{reranked:>+16.4f}"
+            print(row)
+
+def evaluate_reduction(dims=(64, 128, 256, 512), whiten=REDUCTION_WHITEN, metrics=('euclidean', 'cosine', 'correlation')):
+    """
+    Rapport MAP / latence par requête de la recherche exhaustive après réduction
+    ACP des descripteurs, pour chaque dimension cible. Les métriques d'histogrammes
+    (chi-carré, Bhattacharyya) ne s'appliquent pas aux composantes ACP, qui peuvent
+    être négatives.
+    """
+    print(f"--- Évaluation de la réduction de dimension (ACP{', blanchie' if whiten else ''}) ---")
+    query_image_paths = get_query_image_paths()
+    query_classes = get_image_classes(query_image_paths)
+
+    for model_name in MODELS_TO_INDEX.keys():
+        if not feature_store_exists(model_name):
+            print(f"\nAttention : aucun store de descripteurs pour '{model_name}'")
+            continue
+        # Descripteurs d'origine, même si une réduction est déjà configurée pour ce modèle
+        full_index = load_feature_store(model_name)
+        full_queries = np.stack([get_query_features(path, model_name, full_index) for path in query_image_paths])
+        corpus_classes = get_metadata(model_name, full_index).labels
+
+        print(f"\nModèle : {model_name.upper()}")
+        print(f"  {'dimension':>10} {'latence (ms)':>13}" + "".join(f" {metric:>12}" for metric in metrics))
+        for dim in [None] + [dim for dim in dims if dim < full_index.dim]:
+            if dim is None:
+                index, queries = full_index, full_queries
+            else:
+                projection = Projection.fit(full_index, dim, whiten)
+                index, queries = projection.transform_index(full_index), projection.transform(full_queries)
+
+            row = ""
+            latency = 0.0
+            for metric in metrics:
+                start_time = time.perf_counter()
+                all_distances = [index.scores(query, metric) for query in queries]
+                latency += (time.perf_counter() - start_time) / len(queries) / len(metrics)
+                map_score = mean_average_precision(all_distances, query_classes, corpus_classes)
+                row += f" {map_score:>12.4f}"
+            print(f"  {dim or index.dim:>10} {latency * 1000:>13.3f}" + row)
+
+def evaluate_preprocessing(n_images=50, min_cosine=PREPROCESS_MIN_COSINE):
+    """
+    Vérifie que le pré-traitement rapide (décodage JPEG réduit, tenseurs uint8,
+    normalisation fusionnée) donne des descripteurs proches de ceux du pipeline
+    torchvision d'origine, et compare le temps de pré-traitement par image.
+
+    Returns:
+        bool: True si tous les modèles restent dans la tolérance `min_cosine`
+    """
+    print("--- Vérification du pré-traitement des images ---")
+    query_image_paths = get_query_image_paths()
+    sample = query_image_paths[::max(1, len(query_image_paths) // n_images)][:n_images]
+
+    timings = {}
+    for name, preprocess in (('torchvision', lambda path: REFERENCE_TRANSFORM(Image.open(path).convert('RGB'))),
+                             ('rapide', load_tensor)):
+        start_time = time.perf_counter()
+        for path in sample:
+            preprocess(path)
+        timings[name] = (time.perf_counter() - start_time) / len(sample)
+    print(f"Pré-traitement par image : {timings['torchvision'] * 1000:.2f} ms (torchvision), "
+          f"{timings['rapide'] * 1000:.2f} ms (rapide) sur {len(sample)} images")
+
+    within_tolerance = True
+    print(f"\n  {'modèle':<10} {'cos. min':>10} {'cos. moyen':>11} {'err. rel. max':>14}")
+    for model_name in MODELS_TO_INDEX.keys():
+        report = compare_with_reference(get_model(model_name), sample)
+        ok = report['min_cosine'] >= min_cosine
+        within_tolerance &= ok
+        print(f"  {model_name:<10} {report['min_cosine']:>10.5f} {report['mean_cosine']:>11.5f} "
+              f"{report['max_relative_error']:>14.5f}  {'OK' if ok else 'HORS TOLÉRANCE'}")
+    return within_tolerance
+
+def evaluate_backends(backends=tuple(BACKENDS), batch_sizes=(1, 16), similarity='cosine', repeats=5):
+    """
+    Rapport par modèle et par backend d'inférence : latence d'un passage du
+    modèle (médiane, par taille de batch), écart relatif des descripteurs et
+    écart de MAP par rapport au backend eager. Les descripteurs des requêtes
+    calculés par chaque backend sont comparés au store existant.
+    """
+    print(f"--- Évaluation des backends d'inférence ({get_device()}, {torch.get_num_threads()} threads) ---")
+    query_image_paths = get_query_image_paths()
+    query_classes = get_image_classes(query_image_paths)
+    batch = preprocess_batch(query_image_paths)
+    # Le backend eager sert de référence : il est toujours évalué en premier
+    backends = ['eager'] + [name for name in backends if name != 'eager']
+
+    for model_name in MODELS_TO_INDEX.keys():
+        if not feature_store_exists(model_name):
+            print(f"\nAttention : aucun store de descripteurs pour '{model_name}'")
+            continue
+        index = load_feature_store(model_name)
+        corpus_classes = get_metadata(model_name, index).labels
+
+        print(f"\nModèle : {model_name.upper()}")
+        print(f"  {'backend':<12}" + "".join(f" {f'batch {size} (ms)':>15}" for size in batch_sizes)
+              + f" {'err. rel. max':>14} {'MAP':>8} {'écart MAP':>10}")
+        reference = reference_map = None
+        for backend_name in backends:
+            backend = build_backend(model_name, build_model(model_name), get_device(), backend_name)
+            if backend.name != backend_name:
+                continue
+
+            latencies = ""
+            for size in batch_sizes:
+                backend(batch[:size])  # Préchauffage
+                timings = []
+                for _ in range(repeats):
+                    start_time = time.perf_counter()
+                    backend(batch[:size])
+                    timings.append(time.perf_counter() - start_time)
+                latencies += f" {np.median(timings) * 1000:>15.1f}"
+
+            features = np.concatenate([backend(batch[start:start + max(batch_sizes)]).cpu().numpy()
+                                       for start in range(0, len(batch), max(batch_sizes))])
+            map_score = mean_average_precision(index.scores(features, similarity), query_classes, corpus_classes)
+            if reference is None:
+                reference, reference_map = features, map_score
+            error = np.max(np.linalg.norm(features - reference, axis=1) / (np.linalg.norm(reference, axis=1) + 1e-12))
+            print(f"  {backend_name:<12}{latencies} {error:>14.5f} {map_score:>8.4f} {map_score - reference_map:>+10.4f}")
+            del backend
+
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Évaluation des modèles de recherche d'images.")
+    parser.add_argument('--ann', action='store_true',
+                        help="Rapport rappel@k / latence de la recherche approximative IVF au lieu de l'évaluation complète")
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help="Valeurs de nprobe évaluées avec --ann")
+    parser.add_argument('--k', type=int, default=10, help="Profondeur du rappel@k évalué avec --ann")
+    parser.add_argument('--quantization', action='store_true',
+                        help="Écart de MAP des stores quantifiés (float16, int8) par rapport au float32")
+    parser.add_argument('--rerank', type=int, default=QUANTIZATION_RERANK,
+                        help="Nombre de candidats re-classés en float32 évalué avec --quantization")
+    parser.add_argument('--pca-dims', type=int, nargs='+',
+                        help="MAP et latence après réduction ACP vers chacune de ces dimensions")
+    parser.add_argument('--whiten', action='store_true', default=REDUCTION_WHITEN,
+                        help="Blanchiment de la projection évaluée avec --pca-dims")
+    parser.add_argument('--preprocessing', type=int, nargs='?', const=50, metavar='N',
+                        help="Vérifie sur N images que le pré-traitement rapide reste dans la tolérance "
+                             "du pipeline torchvision d'origine")
+    parser.add_argument('--backends', nargs='*', choices=list(BACKENDS), metavar='BACKEND',
+                        help="Latence et écart de MAP de chaque backend d'inférence "
+                             f"({', '.join(BACKENDS)} ; par défaut : tous)")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="Nombre de processus de l'évaluation complète (par défaut : nombre de cœurs)")
+    parser.add_argument('--points', type=int, default=11,
+                        help="Nombre de niveaux de rappel des courbes R/P interpolées")
+    parser.add_argument('--plots', action='store_true',
+                        help="Trace aussi la courbe de chaque requête (un PDF par modèle et métrique)")
+    args = parser.parse_args()
+
+    if args.ann:
+        evaluate_ann(args.nprobe, args.k)
+    elif args.quantization:
+        evaluate_quantization(rerank=args.rerank)
+    elif args.pca_dims:
+        evaluate_reduction(args.pca_dims, args.whiten)
+    elif args.backends is not None:
+        evaluate_backends(args.backends or tuple(BACKENDS))
+    elif args.preprocessing:
+        if not evaluate_preprocessing(args.preprocessing):
+            raise SystemExit(1)
+    else:
+        main(args.jobs, args.points, args.plots)
\ No newline at end of file
@@ -1,39 +1,132 @@
-import torch
-import torchvision.models as models
+import argparse
+import glob
+import os
 # --- Local imports ---
-from src.indexing import extract_features_pytorch
+from src.config import (FEATURES_PATH, MODELS_TO_INDEX, INDEXING_BATCH_SIZE, INDEXING_NUM_WORKERS,
+                        INDEXING_NUM_THREADS, IVF_METRICS, KNN_GRAPH_METRICS)
+from src.feature_store import convert_pickle, feature_store_exists, load_feature_store
+from src.indexing import (build_search_structures, extract_features_multi, extract_features_pytorch,
+                          list_dataset_images, update_features_pytorch)
+from src.ivf import build_ivf_indexes
+from src.knn_graph import build_knn_graphs
+from src.manifest import load_manifest, scan_images
+from src.models import build_model
+from src.reduction import applicable_metrics, load_reduced_store
+from src.thumbnails import build_thumbnails
 
-def main():
+def main(per_model=False, **loader_options):
     print("Début du processus d'indexation...")
 
-    # --- Modèle 1: VGG16 ---
-    model_vgg16 = models.vgg16(weights=models.VGG16_Weights.DEFAULT)
-    # On enlève la dernière couche (le classifieur) pour obtenir le vecteur de features
-    model_vgg16.classifier = torch.nn.Sequential(*list(model_vgg16.classifier.children())[:-1])
-    extract_features_pytorch(model_vgg16, 'vgg16')
+    if per_model:
+        # Une passe complète sur les images par modèle (un seul modèle en mémoire à la fois)
+        for model_name in MODELS_TO_INDEX.keys():
+            extract_features_pytorch(build_model(model_name), model_name, **loader_options)
+    else:
+        # Chaque image est décodée une seule fois pour tous les modèles (VGG16, ResNet50, ViT)
+        models = {model_name: build_model(model_name) for model_name in MODELS_TO_INDEX.keys()}
+        extract_features_multi(models, **loader_options)
 
-    # --- Modèle 2: ResNet50 ---
-    model_resnet50 = models.resnet50(weights=models.ResNet50_Weights.DEFAULT)
-    # On enlève la dernière couche (fully connected)
-    model_resnet50.fc = torch.nn.Identity()
-    extract_features_pytorch(model_resnet50, 'resnet50')
+    print("\nTous les modèles ont été indexés avec succès.")
 
-    # --- Modèle 3: Vision Transformer ---
-    model_vit = models.vit_b_16(weights=models.ViT_B_16_Weights.DEFAULT)
-    # On enlève la tête de classification
-    model_vit.heads.head = torch.nn.Identity()
-    extract_features_pytorch(model_vit, 'vit_b_16')
+def incremental(per_model=False, **loader_options):
+    print("Début de l'indexation incrémentale...")
+    if per_model:
+        for model_name in MODELS_TO_INDEX.keys():
+            update_features_pytorch([model_name], **loader_options)
+    else:
+        update_features_pytorch(list(MODELS_TO_INDEX.keys()), **loader_options)
+    print("\nTous les modèles sont à jour.")
 
-    print("\nTous les modèles ont été indexés avec succès.")
+def build_derived(knn=False, ivf=False, n_lists=None, reduce=False):
+    """
+    (Re)construit les graphes des plus proches voisins et/ou les index IVF à partir
+    des stores existants. Avec `reduce`, la projection ACP est ré-apprise et toutes
+    les structures dérivées sont reconstruites.
+    """
+    for model_name in MODELS_TO_INDEX.keys():
+        if not feature_store_exists(model_name):
+            print(f"Attention : aucun store de descripteurs pour '{model_name}'")
+            continue
+        if reduce:
+            build_search_structures(model_name)
+            continue
+        index = load_feature_store(model_name)
+        reduced, _ = load_reduced_store(model_name, index)
+        if reduced is not None:
+            index = reduced
+        if knn:
+            build_knn_graphs(model_name, index, applicable_metrics(KNN_GRAPH_METRICS, reduced is not None))
+        if ivf:
+            build_ivf_indexes(model_name, index, applicable_metrics(IVF_METRICS, reduced is not None), n_lists=n_lists)
+
+def thumbnails():
+    """(Re)génère les vignettes des images du dataset sans réindexer."""
+    # Les empreintes déjà calculées lors de l'indexation sont réutilisées
+    previous = {}
+    for model_name in MODELS_TO_INDEX.keys():
+        previous.update(load_manifest(model_name))
+    build_thumbnails(scan_images(list_dataset_images(), previous))
+
+def convert(conversions):
+    """
+    Convertit d'anciens fichiers .pkl vers le store mmap.
+    Chaque conversion est de la forme 'fichier.pkl=modèle' ; sans argument,
+    on convertit '{modèle}.pkl' pour chaque modèle de MODELS_TO_INDEX.
+    """
+    if not conversions:
+        conversions = [f"{os.path.join(FEATURES_PATH, model_name)}.pkl={model_name}"
+                       for model_name in MODELS_TO_INDEX.keys()]
+
+    for conversion in conversions:
+        pkl_path, _, model_name = conversion.rpartition('=')
+        if not pkl_path or not os.path.exists(pkl_path):
+            print(f"Attention : fichier .pkl introuvable pour la conversion '{conversion}'")
+            continue
+        output_path = convert_pickle(pkl_path, model_name)
+        print(f"{os.path.basename(pkl_path)} converti pour '{model_name}' : {output_path}")
+        build_search_structures(model_name)
 
 if __name__ == '__main__':
-    # Avant de lancer, supprime les anciens fichiers .pkl pour être propre
-    import os, glob
-    from src.config import FEATURES_PATH
-    old_files = glob.glob(os.path.join(FEATURES_PATH, '*.pkl'))
-    for f in old_files:
-        os.remove(f)
-        print(f"Ancien fichier {os.path.basename(f)} supprimé.")
+    parser = argparse.ArgumentParser(description="Indexation des images de la base.")
+    parser.add_argument('--convert', nargs='*', metavar='FICHIER.pkl=MODELE',
+                        help="Convertit d'anciens fichiers .pkl vers le store mmap au lieu de réindexer")
+    parser.add_argument('--incremental', action='store_true',
+                        help="N'extrait que les images nouvelles ou modifiées depuis la dernière indexation")
+    parser.add_argument('--knn', action='store_true',
+                        help="Reconstruit uniquement les graphes des plus proches voisins")
+    parser.add_argument('--ivf', action='store_true',
+                        help="Reconstruit uniquement les index approximatifs IVF")
+    parser.add_argument('--reduce', action='store_true',
+                        help="Ré-apprend la projection ACP (REDUCTION_DIMS) et reconstruit les structures dérivées")
+    parser.add_argument('--thumbnails', action='store_true',
+                        help="Génère uniquement les vignettes des images (pages de résultats)")
+    parser.add_argument('--n-lists', type=int, default=None,
+                        help="Nombre de listes des index IVF (par défaut : environ 4 * racine du nombre d'images)")
+    parser.add_argument('--per-model', action='store_true',
+                        help="Une passe sur les images par modèle, au lieu d'un seul décodage pour tous les modèles")
+    parser.add_argument('--batch-size', type=int, default=INDEXING_BATCH_SIZE,
+                        help="Nombre d'images traitées par le modèle à chaque passe")
+    parser.add_argument('--num-workers', type=int, default=INDEXING_NUM_WORKERS,
+                        help="Nombre de processus de décodage des images")
+    parser.add_argument('--num-threads', type=int, default=INDEXING_NUM_THREADS,
+                        help="Nombre de threads PyTorch")
+    args = parser.parse_args()
 
-    main()
+    loader_options = dict(per_model=args.per_model, batch_size=args.batch_size,
+                          num_workers=args.num_workers, num_threads=args.num_threads)
+    if args.convert is not None:
+        convert(args.convert)
+    elif args.thumbnails:
+        thumbnails()
+    elif args.knn or args.ivf or args.reduce:
+        build_derived(knn=args.knn, ivf=args.ivf, n_lists=args.n_lists, reduce=args.reduce)
+    elif args.incremental:
+        incremental(**loader_options)
+    else:
+        # Avant de lancer, supprime les anciens fichiers .pkl pour être propre
+        old_files = glob.glob(os.path.join(FEATURES_PATH, '*.pkl'))
+        for f in old_files:
+            os.remove(f)
+            print(f"Ancien fichier {os.path.basename(f)} supprimé.")
 
+        main(**loader_options)
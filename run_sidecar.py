@@ -0,0 +1,55 @@
+import argparse
+import os
+# --- PyTorch specific imports ---
+import torch
+# --- Local imports ---
+from src.config import MODELS_TO_INDEX, SIDECAR_INFERENCE_BATCHING, SIDECAR_SOCKET, SIDECAR_NUM_THREADS
+from src.models import get_model
+from src.retrieval import load_features, set_inference_batching
+from src.sidecar import SidecarServer
+
+def available_cores():
+    """Nombre de cœurs utilisables par le processus (tient compte de l'affinité CPU du conteneur)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def main(socket_path, num_threads=None, preload=()):
+    """
+    Lance le service d'inférence et de recherche partagé par les workers web :
+    il est le seul processus à charger les modèles et à calculer les distances.
+    """
+    # Un seul processus calcule : il peut utiliser tous les cœurs pour chaque passage du modèle
+    num_threads = num_threads or available_cores()
+    torch.set_num_threads(num_threads)
+    # Les requêtes de tous les workers arrivent ici : leurs images sont regroupées en batchs
+    set_inference_batching(SIDECAR_INFERENCE_BATCHING)
+
+    print("Chargement des descripteurs en mémoire...")
+    all_features = load_features()
+    for dataset_features in all_features.values():
+        dataset_features.prepare()
+    for model_name in preload:
+        get_model(model_name)
+
+    server = SidecarServer(socket_path, all_features)
+    print(f"Service d'inférence prêt sur {socket_path} (pid {os.getpid()}, {num_threads} threads PyTorch).")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Service d'inférence et de recherche partagé par les workers web.")
+    parser.add_argument('--socket', default=SIDECAR_SOCKET or os.path.join('app', 'cache', 'inference.sock'),
+                        help="Chemin de la socket Unix (à indiquer aux workers dans SIDECAR_SOCKET)")
+    parser.add_argument('--threads', type=int, default=SIDECAR_NUM_THREADS,
+                        help="Nombre de threads PyTorch (par défaut : nombre de cœurs disponibles)")
+    parser.add_argument('--preload', nargs='*', default=[], choices=list(MODELS_TO_INDEX.keys()),
+                        help="Modèles chargés dès le démarrage")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.socket)), exist_ok=True)
+    main(args.socket, args.threads, args.preload)
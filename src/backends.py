@@ -0,0 +1,149 @@
+import os
+import warnings
+import numpy as np
+# --- PyTorch specific imports ---
+import torch
+# --- Local imports ---
+from src.config import INFERENCE_BACKENDS, ONNX_MODELS_PATH
+from src.preprocessing import CROP_SIZE
+
+# Un backend enveloppe un backbone construit par build_model : il le prépare pour
+# un périphérique et s'appelle comme le modèle, sur un batch float32 normalisé
+# Nx3x224x224, en retournant un tenseur de descripteurs (une ligne par image).
+
+class EagerBackend:
+    """Modèle PyTorch tel quel (mode eager, float32)."""
+
+    name = 'eager'
+
+    def __init__(self, model, device):
+        self.device = device
+        self.model = self.prepare(model.to(device).eval())
+
+    def prepare(self, model):
+        return model
+
+    def __call__(self, batch):
+        with torch.inference_mode():
+            return self.model(batch.to(self.device)).reshape(len(batch), -1)
+
+class TorchScriptBackend(EagerBackend):
+    """
+    Modèle tracé puis figé par TorchScript (poids intégrés comme constantes,
+    fusion des convolutions et des batch norms), en mémoire channels_last, le
+    format des noyaux de convolution oneDNN sur CPU.
+    """
+
+    name = 'torchscript'
+
+    def prepare(self, model):
+        model = model.to(memory_format=torch.channels_last)
+        example = self._to_channels_last(torch.zeros(1, 3, CROP_SIZE, CROP_SIZE, device=self.device))
+        with torch.inference_mode(), warnings.catch_warnings():
+            # Avertissements de traçage des assertions de taille (ViT) : la taille d'entrée est
+            # fixe. Les API TorchScript sont aussi signalées comme obsolètes par PyTorch >= 2.9.
+            warnings.simplefilter('ignore', torch.jit.TracerWarning)
+            warnings.simplefilter('ignore', FutureWarning)
+            traced = torch.jit.trace(model, example, check_trace=False)
+            return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+    @staticmethod
+    def _to_channels_last(batch):
+        return batch.contiguous(memory_format=torch.channels_last)
+
+    def __call__(self, batch):
+        return super().__call__(self._to_channels_last(batch.to(self.device)))
+
+class Int8Backend(EagerBackend):
+    """
+    Quantification dynamique int8 des couches linéaires (poids int8, activations
+    quantifiées à la volée). Utile pour ViT et la tête de VGG16 ; ResNet50 n'a
+    plus de couche linéaire une fois sa tête retirée. CPU uniquement.
+    """
+
+    name = 'int8'
+
+    def __init__(self, model, device):
+        if device.type != 'cpu':
+            raise ValueError("La quantification dynamique int8 n'est disponible que sur CPU.")
+        super().__init__(model, device)
+
+    def prepare(self, model):
+        with warnings.catch_warnings():
+            # Tenseurs quantifiés signalés comme obsolètes par les versions récentes de PyTorch
+            warnings.simplefilter('ignore', UserWarning)
+            return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+class OnnxBackend:
+    """
+    Modèle exporté au format ONNX (une fois, dans ONNX_MODELS_PATH) et exécuté par
+    ONNX Runtime. Nécessite les paquets optionnels onnx et onnxruntime.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model, device, model_name='model', models_path=ONNX_MODELS_PATH):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("Le backend 'onnx' nécessite les paquets onnx et onnxruntime.")
+        self.device = device
+        path = self.export(model.cpu().eval(), model_name, models_path)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Même nombre de threads que PyTorch (INDEXING_NUM_THREADS, service d'inférence)
+        options.intra_op_num_threads = torch.get_num_threads()
+        providers = ['CPUExecutionProvider']
+        if device.type == 'cuda':
+            providers.insert(0, 'CUDAExecutionProvider')
+        self.session = onnxruntime.InferenceSession(path, options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    @staticmethod
+    def export(model, model_name, models_path):
+        """Exporte le modèle (batch de taille variable) s'il ne l'est pas déjà pour cette version de PyTorch."""
+        version = torch.__version__.split('+')[0]
+        path = os.path.join(models_path, f"{model_name}_torch{version}.onnx")
+        if not os.path.exists(path):
+            os.makedirs(models_path, exist_ok=True)
+            # Fichier temporaire propre au processus : plusieurs workers peuvent exporter en même temps
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with torch.no_grad():
+                torch.onnx.export(model, torch.zeros(1, 3, CROP_SIZE, CROP_SIZE), tmp_path,
+                                  input_names=['images'], output_names=['features'],
+                                  dynamic_axes={'images': {0: 'batch'}, 'features': {0: 'batch'}},
+                                  dynamo=False)
+            os.replace(tmp_path, path)
+        return path
+
+    def __call__(self, batch):
+        images = np.ascontiguousarray(batch.detach().cpu().numpy(), dtype=np.float32)
+        features = self.session.run(None, {self.input_name: images})[0]
+        return torch.from_numpy(features).reshape(len(batch), -1)
+
+BACKENDS = {backend.name: backend for backend in (EagerBackend, TorchScriptBackend, OnnxBackend, Int8Backend)}
+
+def configured_backend(model_name):
+    """Nom du backend configuré pour un modèle (INFERENCE_BACKENDS, 'eager' par défaut)."""
+    return INFERENCE_BACKENDS.get(model_name, 'eager')
+
+def build_backend(model_name, model, device, backend_name=None):
+    """
+    Prépare le backbone `model` avec le backend configuré pour ce modèle
+    (INFERENCE_BACKENDS, 'eager' par défaut). Si le backend demandé ne peut pas
+    être construit (dépendance absente, périphérique non supporté), le modèle est
+    utilisé en mode eager.
+    """
+    backend_name = backend_name or configured_backend(model_name)
+    if backend_name not in BACKENDS:
+        raise ValueError(f"Backend d'inférence non supporté : {backend_name}")
+    if backend_name == 'eager':
+        return EagerBackend(model, device)
+    try:
+        if backend_name == 'onnx':
+            return OnnxBackend(model, device, model_name)
+        return BACKENDS[backend_name](model, device)
+    except (ImportError, RuntimeError, ValueError) as e:
+        print(f"Attention : backend '{backend_name}' indisponible pour '{model_name}' ({e}). Mode eager utilisé.")
+        return EagerBackend(model, device)
@@ -0,0 +1,115 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+# --- Local imports ---
+from src.config import INFERENCE_MAX_BATCH_SIZE, INFERENCE_MAX_WAIT_MS
+
+class InferenceScheduler:
+    """
+    Regroupe les images requêtes soumises par des requêtes concurrentes en batchs :
+    un thread par modèle attend la première image, puis d'autres pendant au plus
+    `max_wait_ms` (ou jusqu'à `max_batch_size` images), et lance un seul passage
+    du modèle pour tout le batch. Chaque appelant reçoit son descripteur par un
+    Future.
+    """
+
+    def __init__(self, run_batch, max_batch_size=INFERENCE_MAX_BATCH_SIZE, max_wait_ms=INFERENCE_MAX_WAIT_MS):
+        """
+        Args:
+            run_batch (callable): run_batch(model_name, items) -> une ligne de
+                résultat par élément de `items`, dans le même ordre
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queues = {}
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def submit(self, model_name, item):
+        """Soumet un élément (image pré-traitée) au batch du modèle et retourne un Future."""
+        future = Future()
+        self._queue(model_name).put((item, future, time.perf_counter()))
+        with self._lock:
+            stats = self._stats[model_name]
+            stats['submitted'] += 1
+            stats['max_queue_depth'] = max(stats['max_queue_depth'], self._queues[model_name].qsize())
+        return future
+
+    def _queue(self, model_name):
+        # Les threads ne survivent pas au fork des workers gunicorn : ils sont (re)démarrés
+        # à la première soumission dans chaque processus
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queues = {}
+            if model_name not in self._queues:
+                self._queues[model_name] = queue.Queue()
+                self._stats.setdefault(model_name, {
+                    'submitted': 0, 'batches': 0, 'items': 0, 'errors': 0, 'max_queue_depth': 0,
+                    'batch_sizes': Counter(), 'total_wait': 0.0, 'max_wait': 0.0, 'total_inference': 0.0,
+                })
+                threading.Thread(target=self._worker, args=(model_name, self._queues[model_name]),
+                                 name=f'inference-{model_name}', daemon=True).start()
+            return self._queues[model_name]
+
+    def _worker(self, model_name, pending):
+        while True:
+            batch = [pending.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    batch.append(pending.get(timeout=timeout) if timeout > 0 else pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            started = time.perf_counter()
+            try:
+                outputs = self.run_batch(model_name, [item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                outputs = None
+            else:
+                for (_, future, _), output in zip(batch, outputs):
+                    future.set_result(output)
+
+            waits = [started - submitted for _, _, submitted in batch]
+            with self._lock:
+                stats = self._stats[model_name]
+                stats['batches'] += 1
+                stats['items'] += len(batch)
+                stats['errors'] += outputs is None
+                stats['batch_sizes'][len(batch)] += 1
+                stats['total_wait'] += sum(waits)
+                stats['max_wait'] = max(stats['max_wait'], max(waits))
+                stats['total_inference'] += time.perf_counter() - started
+
+    def metrics(self):
+        """
+        Indicateurs par modèle : profondeur de la file, taille des batchs, temps
+        d'attente avant le passage du modèle et durée des passages.
+        """
+        with self._lock:
+            snapshot = {}
+            for model_name, stats in self._stats.items():
+                batches, items = stats['batches'], stats['items']
+                pending = self._queues.get(model_name) if self._pid == os.getpid() else None
+                snapshot[model_name] = {
+                    'queue_depth': pending.qsize() if pending is not None else 0,
+                    'max_queue_depth': stats['max_queue_depth'],
+                    'submitted': stats['submitted'],
+                    'batches': batches,
+                    'errors': stats['errors'],
+                    'mean_batch_size': items / batches if batches else 0.0,
+                    'batch_sizes': dict(sorted(stats['batch_sizes'].items())),
+                    'mean_wait_ms': 1000 * stats['total_wait'] / items if items else 0.0,
+                    'max_wait_ms': 1000 * stats['max_wait'],
+                    'mean_inference_ms': 1000 * stats['total_inference'] / batches if batches else 0.0,
+                }
+            return snapshot
@@ -16,3 +16,145 @@ MODELS_TO_INDEX = {
     'resnet50': 'pytorch',
     'vit_b_16': 'pytorch' # Vision Transformer
 }
+
+# Backend d'inférence par modèle (voir src/backends.py) : 'eager' (par défaut),
+# 'torchscript' (tracé, figé, channels_last), 'onnx' (ONNX Runtime, dépendance
+# optionnelle) ou 'int8' (quantification dynamique des couches linéaires, CPU).
+# Exemple : INFERENCE_BACKENDS = {'resnet50': 'torchscript', 'vit_b_16': 'int8'}
+INFERENCE_BACKENDS = {}
+# Périphérique de calcul ('cpu', 'cuda', 'mps' ; par défaut : le meilleur disponible)
+INFERENCE_DEVICE = os.environ.get('INFERENCE_DEVICE')
+# Dossier des modèles exportés au format ONNX
+ONNX_MODELS_PATH = os.environ.get('ONNX_MODELS_PATH', os.path.join('app', 'cache', 'onnx'))
+
+# Nombre maximal de modèles gardés en mémoire simultanément par processus.
+# Au-delà, le modèle le moins récemment utilisé est libéré (LRU).
+MAX_RESIDENT_MODELS = int(os.environ.get('MAX_RESIDENT_MODELS', 2))
+
+# Taille du batch factice utilisé pour "chauffer" un modèle après son chargement
+WARMUP_BATCH_SIZE = 1
+
+# Nombre de lignes de la matrice de descripteurs traitées à la fois pour les
+# métriques qui ne se ramènent pas à un produit matriciel (chi-carré, ...)
+SCORING_CHUNK_ROWS = 8192
+
+# Paramètres du pipeline d'indexation
+INDEXING_BATCH_SIZE = int(os.environ.get('INDEXING_BATCH_SIZE', 32))
+# Nombre de processus qui décodent les images en parallèle du modèle
+INDEXING_NUM_WORKERS = int(os.environ.get('INDEXING_NUM_WORKERS', min(4, os.cpu_count() or 1)))
+# Nombre de threads utilisés par PyTorch (None : valeur par défaut de PyTorch)
+INDEXING_NUM_THREADS = int(os.environ['INDEXING_NUM_THREADS']) if 'INDEXING_NUM_THREADS' in os.environ else None
+
+# Version du pré-traitement des images. À incrémenter à chaque modification du
+# pré-traitement : les descripteurs mis en cache avec une autre version sont ignorés,
+# et l'indexation incrémentale ré-extrait toutes les images (version enregistrée dans
+# le manifeste, comme PREPROCESS_DRAFT).
+PREPROCESS_VERSION = 2
+# Décodage JPEG à échelle réduite (mode draft de PIL) au plus près de la taille
+# utile, avant le redimensionnement
+PREPROCESS_DRAFT = os.environ.get('PREPROCESS_DRAFT', '1') == '1'
+# Similarité cosinus minimale tolérée entre les descripteurs du pré-traitement
+# rapide et ceux du pipeline torchvision d'origine (run_evaluation.py --preprocessing)
+PREPROCESS_MIN_COSINE = 0.99
+
+# Cache des descripteurs des images requêtes (clé : empreinte du contenu, modèle, version)
+EMBEDDING_CACHE_ENABLED = os.environ.get('EMBEDDING_CACHE_ENABLED', '1') == '1'
+# Dossier du cache sur disque, partagé par les workers gunicorn
+EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH', os.path.join('app', 'cache', 'embeddings'))
+# Nombre de descripteurs gardés en mémoire par processus
+EMBEDDING_CACHE_MEMORY_ITEMS = 256
+# Taille maximale du cache sur disque (en octets)
+EMBEDDING_CACHE_DISK_BYTES = int(os.environ.get('EMBEDDING_CACHE_DISK_BYTES', 256 * 1024 * 1024))
+
+# Graphe des plus proches voisins pré-calculé pour les images de la base
+KNN_GRAPH_K = 50  # Nombre de voisins conservés par image (>= plus grand Top N proposé)
+KNN_GRAPH_METRICS = ['euclidean', 'chi_square', 'correlation', 'bhattacharyya', 'cosine']
+# Nombre d'images requêtes traitées ensemble lors de la construction du graphe
+KNN_GRAPH_BLOCK_SIZE = 256
+
+# Index approximatif IVF (inverted file) : les images sont réparties en listes
+# autour de centroïdes k-means, et une requête n'est comparée qu'aux images des
+# `nprobe` listes les plus proches.
+SEARCH_EXACT = os.environ.get('SEARCH_EXACT', '1') == '1'  # Recherche exhaustive par défaut
+IVF_METRICS = ['euclidean', 'cosine']
+IVF_N_LISTS = None  # Nombre de listes (None : environ 4 * racine du nombre d'images)
+IVF_NPROBE = int(os.environ.get('IVF_NPROBE', 8))
+IVF_TRAINING_SAMPLES = 100000  # Nombre maximal d'images utilisées pour entraîner le k-means
+
+# Stockage quantifié optionnel des descripteurs, par modèle : 'float16' ou 'int8'
+# (int8 : quantification par dimension avec échelle et décalage stockés).
+# Exemple : QUANTIZED_MODELS = {'vgg16': 'int8', 'resnet50': 'float16'}
+QUANTIZED_MODELS = {}
+# Nombre de meilleurs candidats dont la distance est recalculée sur les
+# descripteurs float32 d'origine (0 : pas de re-classement)
+QUANTIZATION_RERANK = 100
+
+# Réduction de dimension optionnelle (ACP) des descripteurs, par modèle :
+# dimension cible. La projection est apprise à l'indexation et appliquée aux requêtes.
+# Exemple : REDUCTION_DIMS = {'vgg16': 256}
+REDUCTION_DIMS = {}
+# Blanchiment : chaque composante est divisée par son écart-type
+REDUCTION_WHITEN = False
+
+# Vignettes des images de la base, générées à l'indexation et nommées par
+# l'empreinte de leur contenu (servies avec un cache navigateur permanent)
+THUMBNAIL_PATH = os.path.join('app', 'static', 'thumbnails')
+THUMBNAIL_SIZE = 320  # Plus grand côté, en pixels
+THUMBNAIL_FORMAT = os.environ.get('THUMBNAIL_FORMAT', 'webp')  # 'webp' ou 'jpeg'
+THUMBNAIL_QUALITY = 80
+# Durée de mise en cache des vignettes par le navigateur (en secondes)
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+
+# Nombre maximal d'images par appel à l'API de recherche par lot (/api/search)
+API_MAX_IMAGES = int(os.environ.get('API_MAX_IMAGES', '64'))
+
+# Stockage des résultats de recherche (consultés par la page de résultats)
+# Base sqlite partagée par les workers gunicorn
+RESULT_STORE_PATH = os.environ.get('RESULT_STORE_PATH', os.path.join('app', 'cache', 'results.sqlite'))
+# Nombre de résultats gardés en mémoire par processus
+RESULT_STORE_MEMORY_ITEMS = 128
+# Durée de conservation d'un résultat (en secondes)
+RESULT_STORE_TTL = int(os.environ.get('RESULT_STORE_TTL', 3600))
+# Nombre maximal de résultats conservés dans la base
+RESULT_STORE_MAX_ROWS = int(os.environ.get('RESULT_STORE_MAX_ROWS', 10000))
+# Intervalle entre deux passes d'éviction en arrière-plan (en secondes)
+RESULT_STORE_EVICTION_INTERVAL = 60
+
+# Regroupement des images requêtes de requêtes concurrentes en un seul passage du modèle.
+# Désactivé par défaut dans les workers web : un worker ne traite que peu de requêtes à la
+# fois, chaque image attendrait INFERENCE_MAX_WAIT_MS sans être regroupée. Le service
+# d'inférence partagé, qui reçoit les requêtes de tous les workers, l'active (SIDECAR_INFERENCE_BATCHING).
+INFERENCE_BATCHING = os.environ.get('INFERENCE_BATCHING', '0') == '1'
+# Nombre maximal d'images par passage du modèle
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', 16))
+# Attente maximale (en millisecondes) d'autres images avant de lancer un batch incomplet
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 5))
+
+# Service d'inférence et de recherche partagé (optionnel, voir run_sidecar.py) :
+# chemin de la socket Unix. Sans socket configurée, chaque worker calcule lui-même.
+SIDECAR_SOCKET = os.environ.get('SIDECAR_SOCKET')
+# Regroupement des images requêtes en batchs dans le service (voir INFERENCE_BATCHING)
+SIDECAR_INFERENCE_BATCHING = os.environ.get('SIDECAR_INFERENCE_BATCHING', '1') == '1'
+# Nombre de threads PyTorch du service (par défaut : nombre de cœurs disponibles)
+SIDECAR_NUM_THREADS = int(os.environ['SIDECAR_NUM_THREADS']) if os.environ.get('SIDECAR_NUM_THREADS') else None
+# Délai maximal d'une réponse du service (en secondes)
+SIDECAR_TIMEOUT = 30
+# Après un échec de connexion, délai avant de réessayer le service (en secondes)
+SIDECAR_RETRY_INTERVAL = 5
+
+# Instrumentation : durée de chaque étape d'une requête (histogrammes exposés au
+# format Prometheus sur /metrics, et en-tête Server-Timing des réponses)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Dossier où chaque processus (workers gunicorn, service d'inférence) écrit ses
+# compteurs, agrégés par /metrics. À vider au redémarrage du déploiement.
+METRICS_PATH = os.environ.get('METRICS_PATH', os.path.join('app', 'cache', 'metrics'))
+# Intervalle minimal entre deux écritures des compteurs d'un processus (en secondes)
+METRICS_FLUSH_INTERVAL = 1.0
+# Bornes des histogrammes de durée (en secondes)
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Profilage par échantillonnage des requêtes lentes : durée (en millisecondes) au-delà
+# de laquelle les piles échantillonnées d'une requête sont sauvegardées (None : désactivé)
+PROFILE_SLOW_REQUESTS_MS = float(os.environ['PROFILE_SLOW_REQUESTS_MS']) if os.environ.get('PROFILE_SLOW_REQUESTS_MS') else None
+PROFILER_INTERVAL_MS = 5
+# Dossier des profils (format « folded », lisible par flamegraph.pl ou speedscope)
+PROFILES_PATH = os.environ.get('PROFILES_PATH', os.path.join('app', 'cache', 'profiles'))
@@ -0,0 +1,136 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+# --- Local imports ---
+from src.config import (PREPROCESS_VERSION, PREPROCESS_DRAFT, EMBEDDING_CACHE_PATH,
+                        EMBEDDING_CACHE_MEMORY_ITEMS, EMBEDDING_CACHE_DISK_BYTES)
+from src.backends import configured_backend
+
+class EmbeddingCache:
+    """
+    Cache à deux niveaux des descripteurs des images requêtes :
+      - un LRU en mémoire, propre à chaque processus ;
+      - un dossier de fichiers .npy partagé par tous les workers, borné en taille
+        (les fichiers les moins récemment utilisés sont supprimés en premier).
+    """
+
+    # Nombre d'écritures entre deux vérifications de la taille du cache disque
+    DISK_CHECK_INTERVAL = 32
+
+    def __init__(self, directory=EMBEDDING_CACHE_PATH, max_memory_items=EMBEDDING_CACHE_MEMORY_ITEMS,
+                 max_disk_bytes=EMBEDDING_CACHE_DISK_BYTES):
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_check = self.DISK_CHECK_INTERVAL
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+                      'memory_evictions': 0, 'disk_evictions': 0}
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash, model_name, version=PREPROCESS_VERSION, draft=PREPROCESS_DRAFT, backend=None):
+        """
+        Clé d'un descripteur : empreinte du contenu, modèle, backend d'inférence
+        (configuré par défaut), version du pré-traitement et décodage JPEG à échelle
+        réduite (les descripteurs diffèrent légèrement).
+        """
+        backend = backend or configured_backend(model_name)
+        return f"{model_name}-{backend}-v{version}{'-draft' if draft else ''}-{content_hash}"
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key):
+        """Retourne le descripteur associé à `key`, ou None s'il n'est pas en cache."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return self._memory[key]
+
+        path = self._disk_path(key)
+        try:
+            embedding = np.load(path)
+            # Met à jour la date d'accès utilisée pour l'éviction LRU du disque
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+
+        with self._lock:
+            self.stats['disk_hits'] += 1
+            self._remember(key, embedding)
+        return embedding
+
+    def put(self, key, embedding):
+        """Ajoute un descripteur au cache mémoire et au cache disque."""
+        embedding = np.array(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, embedding)
+            self._puts_since_check += 1
+            check_disk = self._puts_since_check >= self.DISK_CHECK_INTERVAL
+            if check_disk:
+                self._puts_since_check = 0
+
+        # Écriture atomique : un autre worker ne lit jamais un fichier incomplet
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, embedding)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Attention : impossible d'écrire dans le cache des descripteurs ({e})")
+            return
+
+        if check_disk:
+            self._evict_disk()
+
+    def _remember(self, key, embedding):
+        # Le même tableau est partagé entre les appelants : on le protège en écriture
+        embedding.flags.writeable = False
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.stats['memory_evictions'] += 1
+
+    def _evict_disk(self):
+        """Supprime les fichiers les moins récemment utilisés jusqu'à repasser sous 90 % de la limite."""
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        if total_size <= self.max_disk_bytes:
+            return
+        target = 0.9 * self.max_disk_bytes
+        for _, size, path in sorted(entries):
+            if total_size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            with self._lock:
+                self.stats['disk_evictions'] += 1
+
+_cache = None
+
+def get_embedding_cache():
+    """Retourne le cache de descripteurs du processus."""
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache()
+    return _cache
@@ -0,0 +1,424 @@
+import hashlib
+import numpy as np
+# --- Local imports ---
+from src.config import SCORING_CHUNK_ROWS
+
+# Même epsilon que les fonctions de distance scalaires de src/retrieval.py
+EPS = 1e-10
+
+SUPPORTED_METRICS = ('euclidean', 'chi_square', 'correlation', 'bhattacharyya', 'cosine')
+
+# 1. INDEX DE DESCRIPTEURS
+# ==============================================================================
+def paths_fingerprint(paths):
+    """Empreinte d'une table des chemins, pour détecter un fichier dérivé devenu obsolète."""
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(path.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class FeatureIndex:
+    """
+    Descripteurs d'un modèle stockés sous forme d'une matrice float32 contiguë
+    (une ligne par image) accompagnée de la liste des chemins correspondants.
+
+    Les grandeurs dont chaque métrique a besoin (normes, moyennes, racines des
+    vecteurs normalisés...) sont calculées une seule fois, à la première
+    utilisation, puis conservées : chaque distance se ramène alors à un produit
+    matrice-vecteur (ou matrice-matrice pour plusieurs requêtes).
+    """
+
+    def __init__(self, paths, matrix):
+        self.paths = list(paths)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if self.matrix.ndim != 2 or self.matrix.shape[0] != len(self.paths):
+            raise ValueError("La matrice de descripteurs ne correspond pas à la liste des chemins.")
+        self._cache = {}
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Construit un index à partir de l'ancien format : liste de tuples (chemin, vecteur)."""
+        paths = [img_path for img_path, _ in pairs]
+        if not paths:
+            return cls([], np.empty((0, 0), dtype=np.float32))
+        matrix = np.stack([np.asarray(vector, dtype=np.float32).ravel() for _, vector in pairs])
+        return cls(paths, matrix)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __iter__(self):
+        # Compatibilité avec l'ancien format (liste de tuples (chemin, vecteur))
+        return zip(self.paths, self.matrix)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    @property
+    def fingerprint(self):
+        """Empreinte de la table des chemins (voir paths_fingerprint)."""
+        return self._cached('fingerprint', lambda: paths_fingerprint(self.paths))
+
+    def row_of(self, path):
+        """Ligne de la matrice correspondant à `path`, ou None si l'image n'est pas indexée."""
+        if '_rows' not in self._cache:
+            self._cache['_rows'] = {img_path: row for row, img_path in enumerate(self.paths)}
+        return self._cache['_rows'].get(path)
+
+    # --- Grandeurs pré-calculées ---
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _row_reduce(self, fn):
+        """Applique `fn` par blocs de lignes pour ne jamais copier toute la matrice."""
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCORING_CHUNK_ROWS):
+            block = self.matrix[start:start + SCORING_CHUNK_ROWS]
+            out[start:start + len(block)] = fn(block)
+        return out
+
+    @property
+    def sq_norms(self):
+        """Carré de la norme L2 de chaque ligne."""
+        return self._cached('sq_norms', lambda: self._row_reduce(
+            lambda block: np.einsum('ij,ij->i', block, block)))
+
+    @property
+    def norms(self):
+        return self._cached('norms', lambda: np.sqrt(self.sq_norms))
+
+    @property
+    def row_means(self):
+        return self._cached('row_means', lambda: self._row_reduce(
+            lambda block: block.mean(axis=1)))
+
+    @property
+    def centered_sq_norms(self):
+        """Carré de la norme de chaque ligne centrée (x - moyenne(x))."""
+        def compute(block):
+            centered = block - block.mean(axis=1, keepdims=True)
+            return np.einsum('ij,ij->i', centered, centered)
+        return self._cached('centered_sq_norms', lambda: self._row_reduce(compute))
+
+    @property
+    def bhattacharyya_roots(self):
+        """
+        Racine carrée des lignes normalisées L1, si elles ont été pré-calculées à
+        l'indexation (fichier ouvert en mmap, voir attach_bhattacharyya_roots),
+        sinon None : les racines sont alors calculées par blocs à chaque requête.
+        Elles ne sont jamais calculées en mémoire ici, ce qui garderait une copie
+        privée de toute la matrice dans chaque worker.
+        """
+        return self._cache.get('bhattacharyya_roots')
+
+    def attach_bhattacharyya_roots(self, roots):
+        """Utilise des racines pré-calculées (de même forme que la matrice) pour Bhattacharyya."""
+        if roots.shape != self.matrix.shape:
+            raise ValueError("Les racines ne correspondent pas à la matrice de descripteurs.")
+        self._cache['bhattacharyya_roots'] = roots
+
+    def take(self, rows):
+        """
+        Sous-index restreint aux lignes `rows`. Les grandeurs déjà pré-calculées sont
+        reprises pour ces lignes au lieu d'être recalculées.
+        """
+        subset = FeatureIndex([self.paths[row] for row in rows], self.matrix[rows])
+        for key, value in self._cache.items():
+            if isinstance(value, np.ndarray):
+                subset._cache[key] = value[rows]
+            elif value is None:
+                subset._cache[key] = None
+        return subset
+
+    def prepare(self, metrics=SUPPORTED_METRICS):
+        """
+        Pré-calcule les grandeurs nécessaires aux métriques données (une valeur par
+        ligne ; les racines de Bhattacharyya sont pré-calculées à l'indexation).
+        """
+        for metric in metrics:
+            if metric in ('euclidean', 'cosine'):
+                self.norms
+            elif metric == 'correlation':
+                self.row_means
+                self.centered_sq_norms
+        return self
+
+    # --- Calcul des distances ---
+    def scores(self, queries, metric='euclidean'):
+        """
+        Calcule la distance entre une ou plusieurs requêtes et toutes les images.
+
+        Args:
+            queries (np.ndarray): Vecteur (D,) ou matrice (Q, D) de requêtes
+            metric (str): Métrique de distance ('euclidean', 'chi_square', etc.)
+
+        Returns:
+            np.ndarray: Distances de forme (N,) ou (Q, N), en float32
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        single = queries.ndim == 1
+        queries = np.atleast_2d(queries)
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Dimension de la requête ({queries.shape[1]}) incompatible avec l'index ({self.dim}).")
+
+        if metric == 'euclidean':
+            distances = self._euclidean(queries)
+        elif metric == 'chi_square':
+            distances = self._chi_square(queries)
+        elif metric == 'correlation':
+            distances = self._correlation(queries)
+        elif metric == 'bhattacharyya':
+            distances = self._bhattacharyya(queries)
+        elif metric == 'cosine':
+            distances = self._cosine(queries)
+        else:
+            raise ValueError(f"Métrique de distance '{metric}' non supportée.")
+        return distances[0] if single else distances
+
+    def _dot(self, queries):
+        return queries @ self.matrix.T
+
+    def _euclidean(self, queries):
+        # ||x - q||² = ||x||² + ||q||² - 2 x.q
+        query_sq_norms = np.einsum('ij,ij->i', queries, queries)
+        distances = self._dot(queries)
+        distances *= -2.0
+        distances += query_sq_norms[:, None]
+        distances += self.sq_norms[None, :]
+        np.maximum(distances, 0.0, out=distances)
+        return np.sqrt(distances, out=distances)
+
+    def _cosine(self, queries):
+        query_norms = np.sqrt(np.einsum('ij,ij->i', queries, queries))
+        similarity = self._dot(queries)
+        similarity /= query_norms[:, None] * self.norms[None, :] + EPS
+        return 1.0 - similarity
+
+    def _correlation(self, queries):
+        # (x - mx).(q - mq) = x.(q - mq) - mx * somme(q - mq) : inutile de centrer la matrice
+        centered = queries - queries.mean(axis=1, keepdims=True)
+        numerator = self._dot(centered)
+        numerator -= self.row_means[None, :] * centered.sum(axis=1)[:, None]
+        query_sq_norms = np.einsum('ij,ij->i', centered, centered)
+        denominator = np.sqrt(query_sq_norms[:, None] * self.centered_sq_norms[None, :]) + EPS
+        return 1.0 - numerator / denominator
+
+    def _bhattacharyya(self, queries):
+        normalized = queries / (queries.sum(axis=1, keepdims=True) + EPS)
+        roots = self.bhattacharyya_roots
+        if roots is not None and normalized.min() >= 0:
+            coefficients = np.sqrt(normalized) @ roots.T
+        else:
+            # Racines non pré-calculées : traitement par blocs de lignes. Les blocs
+            # contenant des valeurs négatives sont calculés élément par élément,
+            # comme la version scalaire.
+            coefficients = np.empty((len(queries), len(self)), dtype=np.float32)
+            query_roots = np.sqrt(normalized) if normalized.min() >= 0 else None
+            for start in range(0, len(self), SCORING_CHUNK_ROWS):
+                block = self.matrix[start:start + SCORING_CHUNK_ROWS]
+                block = block / (block.sum(axis=1, keepdims=True) + EPS)
+                if query_roots is not None and block.min() >= 0:
+                    coefficients[:, start:start + len(block)] = query_roots @ np.sqrt(block).T
+                    continue
+                with np.errstate(invalid='ignore'):
+                    for i, query in enumerate(normalized):
+                        coefficients[i, start:start + len(block)] = np.sqrt(block * query).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return -np.log(coefficients + EPS)
+
+    def _chi_square(self, queries):
+        distances = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), SCORING_CHUNK_ROWS):
+            block = self.matrix[start:start + SCORING_CHUNK_ROWS]
+            for i, query in enumerate(queries):
+                diff = block - query
+                diff *= diff
+                diff /= block + query + EPS
+                distances[i, start:start + len(block)] = 0.5 * diff.sum(axis=1)
+        return distances
+
+def compute_bhattacharyya_roots(matrix, out):
+    """
+    Écrit dans `out` (par exemple un fichier ouvert en mmap) la racine carrée des
+    lignes de `matrix` normalisées L1, par blocs de lignes.
+
+    Returns:
+        bool: False si la matrice contient des valeurs négatives (la décomposition
+        sqrt(a*b) = sqrt(a)*sqrt(b) n'est alors plus valable)
+    """
+    for start in range(0, len(matrix), SCORING_CHUNK_ROWS):
+        block = np.asarray(matrix[start:start + SCORING_CHUNK_ROWS], dtype=np.float32)
+        block = block / (block.sum(axis=1, keepdims=True) + EPS)
+        if block.size and block.min() < 0:
+            return False
+        out[start:start + len(block)] = np.sqrt(block)
+    return True
+
+# 2. SÉLECTION DES MEILLEURS RÉSULTATS
+# ==============================================================================
+def top_k(scores, k):
+    """
+    Retourne les indices des `k` plus petites distances, triés par distance croissante.
+    Utilise np.argpartition (O(N)) puis ne trie que les `k` candidats retenus.
+    """
+    n = scores.shape[0]
+    k = max(0, min(k, n))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        candidates = np.argpartition(scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(scores[candidates], kind='stable')]
+
+# 3. CLASSEMENT RÉUTILISABLE
+# ==============================================================================
+class Ranking:
+    """
+    Résultat d'une recherche : conserve le descripteur de la requête et la distance
+    à chaque image de l'index, pour pouvoir en tirer plusieurs vues (top N, pages,
+    classement complet) sans ré-extraire ni recalculer les distances.
+
+    Se comporte comme une liste de tuples (chemin, distance) des `size` premiers
+    résultats, triés par distance croissante.
+    """
+
+    def __init__(self, index, distances, query_features=None, size=None):
+        self.index = index
+        self._distances = distances
+        self.query_features = query_features
+        self.size = len(index) if size is None else max(0, min(size, len(index)))
+        self._order = None
+        self._top = np.empty(0, dtype=np.intp)
+
+    @property
+    def distances(self):
+        """Distance de la requête à chaque image de l'index."""
+        return self._distances
+
+    @property
+    def order(self):
+        """Classement complet (indices de l'index), calculé à la première demande."""
+        if self._order is None:
+            self._order = np.argsort(self.distances, kind='stable')
+        return self._order
+
+    def top_indices(self, n):
+        """Indices (dans l'index) des `n` meilleurs résultats."""
+        n = max(0, min(n, len(self.index)))
+        if self._order is not None:
+            return self._order[:n]
+        if n > len(self._top):
+            self._top = top_k(self.distances, n)
+        return self._top[:n]
+
+    def top(self, n):
+        """Liste des `n` meilleurs résultats sous forme de tuples (chemin, distance)."""
+        return self._items(self.top_indices(n))
+
+    def top_ids(self, n):
+        """
+        Identifiants (lignes de l'index) et distances des `n` meilleurs résultats,
+        sous forme de tableaux, sans passer par les chemins.
+        """
+        indices = self.top_indices(n)
+        return indices, np.asarray(self._distances_of(indices), dtype=np.float32)
+
+    def page(self, page, per_page):
+        """Résultats de la page `page` (numérotée à partir de 0)."""
+        start = page * per_page
+        return self._items(self.top_indices(start + per_page)[start:])
+
+    def _items(self, indices):
+        paths = self.index.paths
+        distances = self._distances_of(indices)
+        return [(paths[i], distance) for i, distance in zip(indices, distances)]
+
+    def _distances_of(self, indices):
+        return self.distances[indices]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.top(self.size))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            if step > 0:
+                return self._items(self.top_indices(stop)[start:stop:step])
+            return self._items(self.order[:self.size][key])
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError("Indice de résultat hors limites.")
+        return self._items(self.top_indices(key + 1)[key:])[0]
+
+
+class NeighbourRanking(Ranking):
+    """
+    Classement d'une image déjà indexée, servi par le graphe pré-calculé de ses plus
+    proches voisins : tant que la profondeur demandée ne dépasse pas celle du graphe,
+    aucune distance n'est calculée. Au-delà, les distances à toute la base sont
+    calculées une fois à partir du descripteur stocké.
+    """
+
+    def __init__(self, index, neighbours, neighbour_distances, query_features, metric, size=None):
+        super().__init__(index, None, query_features, size)
+        self.metric = metric
+        self._neighbours = np.asarray(neighbours, dtype=np.intp)
+        self._known = dict(zip(self._neighbours.tolist(), np.asarray(neighbour_distances)))
+
+    @property
+    def distances(self):
+        if self._distances is None:
+            self._distances = self.index.scores(self.query_features, self.metric)
+        return self._distances
+
+    def top_indices(self, n):
+        if self._order is None and self._distances is None and n <= len(self._neighbours):
+            return self._neighbours[:max(0, n)]
+        return super().top_indices(n)
+
+    def _distances_of(self, indices):
+        if self._distances is None and all(i in self._known for i in indices):
+            return [self._known[i] for i in indices]
+        return super()._distances_of(indices)
+
+
+class CandidateRanking(Ranking):
+    """
+    Classement limité à des candidats (images des listes sondées d'un index IVF) :
+    seules leurs distances sont calculées, les autres images ne font pas partie du
+    classement. Aucun tableau de la taille de la base n'est alloué.
+    """
+
+    def __init__(self, index, rows, distances, query_features=None, size=None):
+        rows = np.asarray(rows, dtype=np.intp)
+        distances = np.asarray(distances, dtype=np.float32)
+        positions = np.argsort(rows, kind='stable')
+        super().__init__(index, distances[positions], query_features)
+        self.rows = rows[positions]
+        self.size = len(self.rows) if size is None else max(0, min(size, len(self.rows)))
+
+    @property
+    def order(self):
+        if self._order is None:
+            self._order = self.rows[np.argsort(self._distances, kind='stable')]
+        return self._order
+
+    def top_indices(self, n):
+        n = max(0, min(n, len(self.rows)))
+        if self._order is not None:
+            return self._order[:n]
+        if n > len(self._top):
+            self._top = self.rows[top_k(self._distances, n)]
+        return self._top[:n]
+
+    def _distances_of(self, indices):
+        return self._distances[np.searchsorted(self.rows, indices)]
@@ -66,3 +66,104 @@ def calculate_average_precision(ranked_list, query_class, total_relevant_docs):
     average_precision = sum_precisions / hits
     
     return average_precision, (recall_points, precision_points)
+
+
+# Évaluation vectorisée
+# ==============================================================================
+def get_image_classes(image_paths):
+    """Classes d'une liste d'images (tableau d'entiers, -1 si la classe est inconnue)."""
+    classes = [get_image_class(path) for path in image_paths]
+    return np.array([-1 if image_class is None else image_class for image_class in classes], dtype=np.int64)
+
+def rank_rows(distances, depth=None):
+    """
+    Classe chaque ligne d'une matrice de distances (requêtes x base) par distance
+    croissante et retourne les indices des `depth` premiers résultats de chaque ligne.
+    """
+    n = distances.shape[1]
+    depth = n if depth is None else max(0, min(depth, n))
+    if depth < n:
+        candidates = np.argpartition(distances, depth - 1, axis=1)[:, :depth]
+    else:
+        candidates = np.broadcast_to(np.arange(n), distances.shape)
+    order = np.argsort(np.take_along_axis(distances, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+def relevance_matrix(rankings, query_classes, corpus_classes):
+    """Matrice booléenne : le résultat de rang j de la requête i est-il de la même classe ?"""
+    query_classes = np.asarray(query_classes)
+    return (corpus_classes[rankings] == query_classes[:, None]) & (query_classes[:, None] >= 0)
+
+def average_precisions(relevant):
+    """
+    AP de chaque requête à partir de sa matrice de pertinence, calculée comme
+    `calculate_average_precision` : moyenne des précisions aux rangs pertinents.
+    """
+    hits = np.cumsum(relevant, axis=1)
+    precisions = hits / np.arange(1, relevant.shape[1] + 1)
+    total_hits = hits[:, -1] if relevant.shape[1] else np.zeros(len(relevant))
+    sums = np.where(relevant, precisions, 0.0).sum(axis=1)
+    return np.divide(sums, total_hits, out=np.zeros(len(relevant)), where=total_hits > 0)
+
+def r_precisions(relevant, total_relevant_docs):
+    """R-précision de chaque requête : précision au rang R = nombre de documents pertinents."""
+    depth = min(total_relevant_docs, relevant.shape[1])
+    if depth == 0:
+        return np.zeros(len(relevant))
+    return relevant[:, :depth].sum(axis=1) / total_relevant_docs
+
+def precision_recall_points(relevant, total_relevant_docs):
+    """
+    Points (rappel, précision) de chaque requête aux rangs pertinents, au format
+    retourné par `calculate_average_precision` (en commençant par (0, 1)).
+    """
+    curves = []
+    for row in relevant:
+        ranks = np.flatnonzero(row) + 1
+        if len(ranks) == 0:
+            curves.append(([], []))
+            continue
+        hits = np.arange(1, len(ranks) + 1)
+        curves.append(([0.0] + (hits / total_relevant_docs).tolist(), [1.0] + (hits / ranks).tolist()))
+    return curves
+
+def interpolated_precisions(relevant, total_relevant_docs, n_points=11):
+    """
+    Précision interpolée de chaque requête aux `n_points` niveaux de rappel
+    0, 1/(n-1), ..., 1 : la meilleure précision obtenue à un rappel au moins égal
+    (0 si ce rappel n'est jamais atteint).
+
+    Returns:
+        tuple: (niveaux de rappel, matrice requêtes x niveaux)
+    """
+    recall_levels = np.linspace(0.0, 1.0, n_points)
+    if relevant.shape[1] == 0 or total_relevant_docs == 0:
+        return recall_levels, np.zeros((len(relevant), n_points))
+
+    hits = np.cumsum(relevant, axis=1)
+    recalls = hits / total_relevant_docs
+    precisions = hits / np.arange(1, relevant.shape[1] + 1)
+    # Maximum des précisions des rangs suivants (le rappel ne fait qu'augmenter avec le rang)
+    best_after = np.maximum.accumulate(precisions[:, ::-1], axis=1)[:, ::-1]
+
+    # Premier rang atteignant chaque niveau de rappel : rang du h-ième résultat
+    # pertinent, avec h le nombre de résultats pertinents nécessaires
+    needed = np.ceil(recall_levels * total_relevant_docs - 1e-9).astype(np.int64)
+    counts = relevant.sum(axis=1)
+    rows, columns = np.nonzero(relevant)
+    starts = np.cumsum(counts) - counts
+    reached = needed[None, :] <= counts[:, None]
+    positions = np.clip(starts[:, None] + needed[None, :] - 1, 0, max(len(columns) - 1, 0))
+    first_rank = np.where(needed[None, :] > 0, columns[positions] if len(columns) else 0, 0)
+    interpolated = np.take_along_axis(best_after, first_rank, axis=1)
+    return recall_levels, np.where(reached, interpolated, 0.0)
+
+def average_precision_from_labels(result_labels, query_class, total_relevant_docs):
+    """
+    Équivalent de `calculate_average_precision` à partir des classes des résultats
+    classés (tableau d'entiers) plutôt que de leurs chemins.
+    """
+    relevant = (np.asarray(result_labels) == query_class)[None, :]
+    if total_relevant_docs == 0:
+        return 0.0, ([0.0], [1.0])
+    return float(average_precisions(relevant)[0]), precision_recall_points(relevant, total_relevant_docs)[0]
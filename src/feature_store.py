@@ -0,0 +1,244 @@
+import hashlib
+import io
+import json
+import os
+import pickle
+import re
+import sys
+import time
+import uuid
+import numpy as np
+# --- Local imports ---
+from src.config import FEATURES_PATH
+from src.engine import FeatureIndex, compute_bhattacharyya_roots
+
+# Format sur disque d'un modèle :
+#   - {modèle}.{génération}.npy : matrice float32 (une ligne par image)
+#   - {modèle}_paths.json       : {"matrix": nom du fichier de la matrice, "paths": table
+#     des chemins}, la ligne i de la matrice correspond au chemin i
+#   - {modèle}_bhattacharyya_roots.npy / .json : racines des lignes normalisées L1
+#     (distance de Bhattacharyya) et empreinte du store dont elles sont issues
+# Une réécriture crée une nouvelle génération de la matrice puis remplace la table :
+# ce seul renommage atomique bascule vers le nouveau store, un lecteur ne peut donc
+# jamais associer la nouvelle matrice à l'ancienne table (ou l'inverse). L'ancien
+# format ({modèle}.npy + liste des chemins) est encore lu.
+# Les matrices sont ouvertes avec np.load(mmap_mode='r') : tous les workers gunicorn
+# partagent alors la même copie en cache de pages au lieu d'en garder une chacun.
+
+# Nombre de tentatives de lecture d'un store remplacé pendant son ouverture
+LOAD_ATTEMPTS = 5
+
+def get_store_paths(model_name, features_path=FEATURES_PATH):
+    """Retourne les chemins (matrice de l'ancien format, table des chemins) du store d'un modèle."""
+    return (os.path.join(features_path, f"{model_name}.npy"),
+            os.path.join(features_path, f"{model_name}_paths.json"))
+
+def read_table(model_name, features_path=FEATURES_PATH):
+    """
+    Lit la table d'un store.
+
+    Returns:
+        tuple: (chemin de la matrice référencée, liste des chemins des images)
+    """
+    legacy_path, table_path = get_store_paths(model_name, features_path)
+    with open(table_path) as f:
+        table = json.load(f)
+    if isinstance(table, list):
+        return legacy_path, table
+    return os.path.join(features_path, table['matrix']), table['paths']
+
+def write_table(model_name, matrix_path, paths, features_path=FEATURES_PATH):
+    """Remplace atomiquement la table d'un store (et donc la matrice qu'elle référence)."""
+    table_path = get_store_paths(model_name, features_path)[1]
+    with open(table_path + '.tmp', 'w') as f:
+        json.dump({'matrix': os.path.basename(matrix_path), 'paths': list(paths)}, f)
+    os.replace(table_path + '.tmp', table_path)
+
+def feature_store_exists(model_name, features_path=FEATURES_PATH):
+    """Indique si le store d'un modèle est présent sur disque."""
+    return os.path.exists(get_store_paths(model_name, features_path)[1])
+
+def remove_old_generations(model_name, current_path, features_path=FEATURES_PATH):
+    """
+    Supprime les matrices d'un modèle qui ne sont plus référencées par sa table.
+    Les processus qui les ont déjà ouvertes en mmap continuent de les lire.
+    """
+    pattern = re.compile(re.escape(model_name) + r'(\.[0-9a-f]+)?\.npy')
+    for filename in os.listdir(features_path):
+        path = os.path.join(features_path, filename)
+        if pattern.fullmatch(filename) and path != current_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def save_feature_store(model_name, paths, matrix, features_path=FEATURES_PATH):
+    """
+    Sauvegarde la matrice de descripteurs et la table des chemins d'un modèle.
+    La matrice est écrite dans une nouvelle génération, puis la table qui la
+    référence est remplacée : le changement de store est atomique.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] != len(paths):
+        raise ValueError("La matrice de descripteurs ne correspond pas à la liste des chemins.")
+
+    os.makedirs(features_path, exist_ok=True)
+    matrix_path = os.path.join(features_path, f"{model_name}.{uuid.uuid4().hex[:12]}.npy")
+    with open(matrix_path + '.tmp', 'wb') as f:
+        np.save(f, matrix)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(matrix_path + '.tmp', matrix_path)
+
+    write_table(model_name, matrix_path, paths, features_path)
+    remove_old_generations(model_name, matrix_path, features_path)
+    return matrix_path
+
+def load_feature_store(model_name, features_path=FEATURES_PATH, mmap=True):
+    """
+    Ouvre le store d'un modèle et retourne un FeatureIndex prêt pour le moteur de
+    recherche. Avec `mmap=True`, la matrice n'est pas copiée en mémoire.
+    Si le store est remplacé pendant la lecture (matrice référencée déjà supprimée),
+    la lecture est reprise avec la nouvelle table.
+    """
+    for attempt in range(LOAD_ATTEMPTS):
+        matrix_path, paths = read_table(model_name, features_path)
+        try:
+            matrix = np.load(matrix_path, mmap_mode='r' if mmap else None)
+        except FileNotFoundError:
+            if attempt == LOAD_ATTEMPTS - 1:
+                raise
+            time.sleep(0.05)
+            continue
+        if matrix.ndim != 2 or matrix.shape[0] < len(paths):
+            raise ValueError(f"Store de '{model_name}' incohérent : {matrix.shape[0]} lignes pour {len(paths)} chemins.")
+        # Un ajout en place peut avoir écrit des lignes pas encore référencées par la table
+        return FeatureIndex([sys.intern(path) for path in paths], matrix[:len(paths)])
+
+def convert_pickle(pkl_path, model_name, features_path=FEATURES_PATH):
+    """Convertit un ancien fichier .pkl (liste de tuples (chemin, vecteur)) en store."""
+    with open(pkl_path, 'rb') as f:
+        index = FeatureIndex.from_pairs(pickle.load(f))
+    return save_feature_store(model_name, index.paths, index.matrix, features_path)
+
+def append_to_feature_store(model_name, paths, matrix, features_path=FEATURES_PATH):
+    """
+    Ajoute des lignes à la fin de la matrice d'un store existant sans la réécrire.
+    Les lignes sont écrites d'abord, puis l'en-tête .npy, puis la table des chemins
+    (qui référence toujours la même matrice) : un lecteur qui ouvre le store
+    entre-temps ignore les lignes non référencées.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    matrix_path, old_paths = read_table(model_name, features_path)
+
+    with open(matrix_path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        header_size = f.tell()
+        if fortran_order or dtype != np.float32 or shape[1] != matrix.shape[1]:
+            raise ValueError("Le store existant n'est pas compatible avec les lignes à ajouter.")
+
+        new_shape = (len(old_paths) + len(matrix), shape[1])
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(
+            header, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': new_shape})
+        header_fits = len(header.getvalue()) == header_size
+
+        if header_fits:
+            # Les lignes orphelines d'un ajout interrompu sont écrasées
+            f.seek(header_size + len(old_paths) * shape[1] * matrix.itemsize)
+            f.write(matrix.tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(header.getvalue())
+
+    if not header_fits:
+        # L'en-tête ne tient plus dans l'espace réservé : on réécrit tout le store
+        old = load_feature_store(model_name, features_path)
+        return save_feature_store(model_name, old.paths + list(paths),
+                                  np.concatenate([old.matrix, matrix]), features_path)
+
+    write_table(model_name, matrix_path, old_paths + list(paths), features_path)
+    return matrix_path
+
+def update_feature_store(model_name, new_paths, new_matrix, removed_paths=(), features_path=FEATURES_PATH):
+    """
+    Met à jour le store d'un modèle : les lignes de `removed_paths` et celles des
+    chemins ré-extraits sont retirées, puis les nouvelles lignes sont ajoutées.
+    Sans suppression ni remplacement, les lignes sont simplement ajoutées en fin
+    de fichier ; sinon le store est compacté (réécrit sans les lignes obsolètes).
+    """
+    if not feature_store_exists(model_name, features_path):
+        return save_feature_store(model_name, new_paths, new_matrix, features_path)
+
+    existing = load_feature_store(model_name, features_path)
+    obsolete = set(removed_paths) | set(new_paths)
+    keep = np.array([path not in obsolete for path in existing.paths], dtype=bool)
+
+    if keep.all():
+        if len(new_paths) == 0:
+            return read_table(model_name, features_path)[0]
+        return append_to_feature_store(model_name, new_paths, new_matrix, features_path)
+
+    kept_paths = [path for path, kept in zip(existing.paths, keep) if kept]
+    matrix = existing.matrix[keep]
+    if len(new_paths):
+        matrix = np.concatenate([matrix, np.asarray(new_matrix, dtype=np.float32)])
+    return save_feature_store(model_name, kept_paths + list(new_paths), matrix, features_path)
+
+def store_checksum(index):
+    """Empreinte de la table des chemins et de quelques lignes de la matrice d'un store."""
+    rows = sorted({0, len(index) // 2, len(index) - 1}) if len(index) else []
+    digest = hashlib.sha1(index.fingerprint.encode('ascii'))
+    for row in rows:
+        digest.update(np.ascontiguousarray(index.matrix[row], dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+def get_roots_paths(model_name, features_path=FEATURES_PATH):
+    prefix = os.path.join(features_path, f"{model_name}_bhattacharyya_roots")
+    return prefix + '.npy', prefix + '.json'
+
+def save_bhattacharyya_roots(model_name, index, features_path=FEATURES_PATH):
+    """
+    Pré-calcule les racines de Bhattacharyya du store d'un modèle, écrites par blocs
+    dans un fichier ouvert ensuite en mmap par les workers. Rien n'est écrit (et
+    l'ancien fichier est supprimé) si les descripteurs ont des valeurs négatives.
+    """
+    roots_path, info_path = get_roots_paths(model_name, features_path)
+    roots = np.lib.format.open_memmap(roots_path + '.tmp', mode='w+', dtype=np.float32,
+                                      shape=(len(index), index.dim))
+    valid = compute_bhattacharyya_roots(index.matrix, roots)
+    roots.flush()
+    del roots
+    if not valid:
+        for path in (roots_path + '.tmp', roots_path, info_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return None
+    with open(info_path + '.tmp', 'w') as f:
+        json.dump({'checksum': store_checksum(index)}, f)
+    os.replace(roots_path + '.tmp', roots_path)
+    os.replace(info_path + '.tmp', info_path)
+    return roots_path
+
+def load_bhattacharyya_roots(model_name, index, features_path=FEATURES_PATH):
+    """
+    Associe à `index` ses racines de Bhattacharyya pré-calculées (en mmap), si elles
+    existent et correspondent au store. Retourne True si elles sont utilisées.
+    """
+    roots_path, info_path = get_roots_paths(model_name, features_path)
+    if not (os.path.exists(roots_path) and os.path.exists(info_path)):
+        return False
+    with open(info_path) as f:
+        if json.load(f).get('checksum') != store_checksum(index):
+            return False
+    roots = np.load(roots_path, mmap_mode='r')
+    if roots.shape != index.matrix.shape:
+        return False
+    index.attach_bhattacharyya_roots(roots)
+    return True
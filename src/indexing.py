@@ -1,49 +1,218 @@
 import os
-import pickle
+import time
+import numpy as np
 # --- PyTorch specific imports ---
 import torch
-import torchvision.transforms as transforms
-from PIL import Image
+from torch.utils.data import Dataset, DataLoader
 # --- Local imports ---
-from src.config import IMAGE_DATASET_PATH, FEATURES_PATH
+from src.config import (IMAGE_DATASET_PATH, INDEXING_BATCH_SIZE, INDEXING_NUM_WORKERS, INDEXING_NUM_THREADS,
+                        IVF_METRICS, KNN_GRAPH_METRICS)
+from src.feature_store import (feature_store_exists, load_feature_store, save_bhattacharyya_roots, save_feature_store,
+                               update_feature_store)
+from src.backends import build_backend
+from src.ivf import build_ivf_indexes, update_ivf_indexes
+from src.knn_graph import build_knn_graphs, update_knn_graphs
+from src.metadata import build_metadata
+from src.manifest import diff_manifests, load_manifest, manifest_is_current, save_manifest, scan_images
+from src.models import build_model, get_device
+from src.preprocessing import load_tensor, normalize_batch
+from src.quantization import build_quantized_store
+from src.reduction import applicable_metrics, build_reduction
+from src.thumbnails import build_thumbnails
 
-def extract_features_pytorch(model, model_name):
+class ImageDataset(Dataset):
     """
-    Extrait les caractéristiques de toutes les images du dataset avec un modèle PyTorch.
+    Dataset qui charge et pré-traite les images à partir de leurs chemins. Les
+    images sont rendues en uint8 (moins de données échangées avec les processus de
+    décodage) ; la normalisation est faite ensuite par batch.
     """
-    # Définir la transformation d'image pour PyTorch
-    transform = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ])
 
-    # Utiliser le GPU du Mac (MPS) si disponible
-    device = torch.device("mps" if torch.backends.mps.is_available() else "cpu")
-    model.to(device)
-    model.eval() # Mode évaluation
+    def __init__(self, image_paths, transform=load_tensor):
+        self.image_paths = image_paths
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, idx):
+        return self.transform(self.image_paths[idx])
 
-    features_list = []
+def list_dataset_images():
+    """Retourne la liste triée des chemins des images du dataset."""
     image_files = sorted([f for f in os.listdir(IMAGE_DATASET_PATH) if f.endswith('.jpg')])
+    return [os.path.join(IMAGE_DATASET_PATH, img_name) for img_name in image_files]
+
+def compute_features_multi(models, image_paths, batch_size=INDEXING_BATCH_SIZE,
+                           num_workers=INDEXING_NUM_WORKERS, num_threads=INDEXING_NUM_THREADS):
+    """
+    Calcule les caractéristiques d'une liste d'images par batchs, pour plusieurs
+    modèles à la fois : chaque image n'est décodée et pré-traitée qu'une seule fois,
+    puis le même batch est donné à chaque modèle.
+    Les images sont décodées en parallèle par `num_workers` processus pendant que
+    les modèles traitent le batch précédent. Chaque modèle est exécuté avec son
+    backend d'inférence (INFERENCE_BACKENDS), comme pour les images requêtes.
+
+    Args:
+        models (dict): Dictionnaire {nom du modèle: modèle PyTorch}
+
+    Returns:
+        dict: {nom du modèle: matrice float32 (une ligne par image, dans l'ordre de `image_paths`)}
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    device = get_device()
+    models = {model_name: build_backend(model_name, model, device) for model_name, model in models.items()}
+
+    loader = DataLoader(
+        ImageDataset(image_paths),
+        batch_size=batch_size,
+        num_workers=num_workers,
+        # Buffers en mémoire verrouillée : transferts asynchrones vers le GPU
+        pin_memory=device.type == 'cuda',
+    )
+
+    # Les matrices de sortie sont allouées dès que la dimension des descripteurs est connue
+    features = {model_name: None for model_name in models}
+    offset = 0
+    with torch.inference_mode():
+        for images in loader:
+            images = normalize_batch(images.to(device, non_blocking=True))
+            for model_name, model in models.items():
+                output = model(images)
+                if features[model_name] is None:
+                    features[model_name] = np.empty((len(image_paths), output.shape[1]), dtype=np.float32)
+                features[model_name][offset:offset + len(images)] = output.cpu().numpy()
+            offset += len(images)
+
+    return {model_name: matrix if matrix is not None else np.empty((0, 0), dtype=np.float32)
+            for model_name, matrix in features.items()}
+
+def compute_features(model, image_paths, batch_size=INDEXING_BATCH_SIZE,
+                     num_workers=INDEXING_NUM_WORKERS, num_threads=INDEXING_NUM_THREADS):
+    """
+    Calcule les caractéristiques d'une liste d'images par batchs avec un seul modèle.
+
+    Returns:
+        np.ndarray: Matrice float32 (une ligne par image, dans l'ordre de `image_paths`)
+    """
+    return compute_features_multi({'model': model}, image_paths, batch_size, num_workers, num_threads)['model']
+
+def extract_features_pytorch(model, model_name, batch_size=INDEXING_BATCH_SIZE,
+                             num_workers=INDEXING_NUM_WORKERS, num_threads=INDEXING_NUM_THREADS):
+    """
+    Extrait les caractéristiques de toutes les images du dataset avec un modèle PyTorch.
+    """
+    extract_features_multi({model_name: model}, batch_size, num_workers, num_threads)
+
+def extract_features_multi(models, batch_size=INDEXING_BATCH_SIZE,
+                           num_workers=INDEXING_NUM_WORKERS, num_threads=INDEXING_NUM_THREADS):
+    """
+    Extrait les caractéristiques de toutes les images du dataset avec plusieurs
+    modèles PyTorch en une seule lecture des images. Chaque modèle a son propre store.
+
+    Args:
+        models (dict): Dictionnaire {nom du modèle: modèle PyTorch}
+    """
+    image_paths = list_dataset_images()
+
+    start_time = time.perf_counter()
+    all_features = compute_features_multi(models, image_paths, batch_size, num_workers, num_threads)
+    duration = time.perf_counter() - start_time
+
+    # Sauvegarder les caractéristiques (matrice float32 + table des chemins) et le manifeste
+    manifest = scan_images(image_paths)
+    throughput = len(image_paths) / duration if duration > 0 else 0.0
+    for model_name, features in all_features.items():
+        output_path = save_feature_store(model_name, image_paths, features)
+        save_manifest(model_name, manifest)
+        print(f"Indexation pour {model_name} terminée. Fichier sauvegardé : {output_path}")
+        build_search_structures(model_name)
+    print(f"{len(image_paths)} images indexées pour {len(models)} modèle(s) en {duration:.1f}s "
+          f"({throughput:.1f} images/s).")
+    build_thumbnails(manifest)
+
+def build_search_structures(model_name):
+    """
+    Construit les structures dérivées du store d'un modèle : métadonnées (classes
+    des images), racines de Bhattacharyya, projection ACP et store réduit (si configurés), puis, sur les
+    descripteurs utilisés pour la recherche, graphes des plus proches voisins,
+    index IVF et store quantifié.
+    """
+    index = load_feature_store(model_name)
+    build_metadata(model_name, index)
+    save_bhattacharyya_roots(model_name, index)
+    reduced = build_reduction(model_name, index)
+    # Sur des descripteurs réduits, pas de graphe ni d'index pour le chi-carré et Bhattacharyya
+    build_knn_graphs(model_name, reduced, applicable_metrics(KNN_GRAPH_METRICS, reduced is not index))
+    build_ivf_indexes(model_name, reduced, applicable_metrics(IVF_METRICS, reduced is not index))
+    build_quantized_store(model_name, reduced)
+
+def update_features_pytorch(model_names, batch_size=INDEXING_BATCH_SIZE,
+                            num_workers=INDEXING_NUM_WORKERS, num_threads=INDEXING_NUM_THREADS):
+    """
+    Indexation incrémentale : compare le dataset au manifeste de chaque modèle,
+    n'extrait que les images nouvelles ou modifiées et retire les images supprimées
+    des stores. Les images à traiter pour l'ensemble des modèles sont décodées une
+    seule fois. Les modèles indexés avec d'autres réglages (voir indexing_settings)
+    sont entièrement réindexés.
+    """
+    stale = [model_name for model_name in model_names
+             if feature_store_exists(model_name) and not manifest_is_current(model_name)]
+    if stale:
+        print(f"Réglages d'indexation modifiés pour {', '.join(stale)} : réindexation complète.")
+        extract_features_multi({model_name: build_model(model_name) for model_name in stale},
+                               batch_size, num_workers, num_threads)
+        model_names = [model_name for model_name in model_names if model_name not in stale]
+        if not model_names:
+            return
+
+    image_paths = list_dataset_images()
+    manifests = {}
+    removed = {}
+    to_extract = set()
+    scanned = {}
+    for model_name in model_names:
+        previous = load_manifest(model_name) if feature_store_exists(model_name) else {}
+        # Les empreintes déjà calculées pour un autre modèle sont réutilisées
+        manifests[model_name] = scan_images(image_paths, {**previous, **scanned})
+        scanned = manifests[model_name]
+        added, changed, removed[model_name] = diff_manifests(previous, manifests[model_name])
+        to_extract.update(added + changed)
+        print(f"{model_name} : {len(added)} image(s) ajoutée(s), {len(changed)} modifiée(s), "
+              f"{len(removed[model_name])} supprimée(s).")
+    to_extract = sorted(to_extract)
+
+    start_time = time.perf_counter()
+    all_features = {}
+    if to_extract:
+        # Les modèles ne sont construits que s'il y a des images à traiter
+        models = {model_name: build_model(model_name) for model_name in model_names}
+        all_features = compute_features_multi(models, to_extract, batch_size, num_workers, num_threads)
+
+    for model_name in model_names:
+        if to_extract or removed[model_name]:
+            old_paths = load_feature_store(model_name).paths if feature_store_exists(model_name) else []
+            features = all_features.get(model_name, np.empty((0, 0), dtype=np.float32))
+            output_path = update_feature_store(model_name, to_extract, features, removed[model_name])
+            print(f"Mise à jour de {model_name} terminée. Fichier sauvegardé : {output_path}")
+
+            # Les images ré-extraites déjà présentes dans le store sont à traiter comme modifiées
+            indexed = set(old_paths)
+            replaced = [path for path in to_extract if path in indexed]
+            # La projection ACP existante est conservée : les graphes restent cohérents
+            index = load_feature_store(model_name)
+            build_metadata(model_name, index)
+            save_bhattacharyya_roots(model_name, index)
+            reduced = build_reduction(model_name, index, refit=False)
+            update_knn_graphs(model_name, old_paths, reduced, replaced,
+                              applicable_metrics(KNN_GRAPH_METRICS, reduced is not index))
+            update_ivf_indexes(model_name, reduced, applicable_metrics(IVF_METRICS, reduced is not index))
+            build_quantized_store(model_name, reduced)
+        save_manifest(model_name, manifests[model_name])
+    # Le dernier manifeste calculé couvre toutes les images du dataset
+    build_thumbnails(scanned)
 
-    with torch.no_grad(): # Désactiver le calcul du gradient
-        for img_name in image_files:
-            img_path = os.path.join(IMAGE_DATASET_PATH, img_name)
-            
-            # Charger et pré-traiter l'image
-            image = Image.open(img_path).convert('RGB')
-            image = transform(image).unsqueeze(0) # Ajouter une dimension de batch
-            image = image.to(device)
-
-            # Extraire les caractéristiques
-            feature = model(image)
-            feature = feature.cpu().numpy().flatten() # Renvoyer au CPU et convertir en array numpy
-            features_list.append((img_path, feature))
-
-    # Sauvegarder les caractéristiques
-    output_path = os.path.join(FEATURES_PATH, f"{model_name}.pkl")
-    with open(output_path, "wb") as f:
-        pickle.dump(features_list, f)
-    
-    print(f"Indexation pour {model_name} terminée. Fichier sauvegardé : {output_path}")
+    if to_extract:
+        duration = time.perf_counter() - start_time
+        print(f"{len(to_extract)} image(s) ré-extraite(s) en {duration:.1f}s.")
@@ -0,0 +1,179 @@
+import os
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
+# --- Local imports ---
+from src.config import FEATURES_PATH, IVF_METRICS, IVF_N_LISTS, IVF_NPROBE, IVF_TRAINING_SAMPLES
+from src.engine import EPS
+
+# Au-delà de ce nombre d'images d'entraînement, on utilise le k-means par mini-batchs
+MINIBATCH_THRESHOLD = 20000
+# Nombre de lignes projetées / affectées à la fois
+BLOCK_ROWS = 8192
+
+def get_ivf_path(model_name, metric, features_path=FEATURES_PATH):
+    return os.path.join(features_path, f"{model_name}_{metric}_ivf.npz")
+
+def to_ivf_space(vectors, metric):
+    """
+    Projette des vecteurs dans l'espace où la distance euclidienne entre centroïdes
+    et vecteurs suit l'ordre de la métrique demandée :
+      - cosinus : vecteurs normalisés L2 ;
+      - corrélation : vecteurs centrés puis normalisés L2 ;
+      - Bhattacharyya : racine des vecteurs normalisés L1 (si positifs) ;
+      - euclidienne, chi-carré : vecteurs bruts.
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    if metric == 'correlation':
+        vectors = vectors - vectors.mean(axis=1, keepdims=True)
+    if metric in ('cosine', 'correlation'):
+        return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + EPS)
+    if metric == 'bhattacharyya' and vectors.min() >= 0:
+        return np.sqrt(vectors / (vectors.sum(axis=1, keepdims=True) + EPS))
+    return vectors
+
+class IVFIndex:
+    """
+    Index approximatif par listes inversées pour un couple (modèle, métrique).
+    Les lignes du store sont rangées liste par liste : les lignes de la liste i
+    sont `rows[offsets[i]:offsets[i + 1]]`.
+    """
+
+    def __init__(self, metric, centroids, offsets, rows, fingerprint):
+        self.metric = metric
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.fingerprint = fingerprint
+        self._centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    # --- Construction ---
+    @classmethod
+    def build(cls, index, metric, n_lists=IVF_N_LISTS, seed=0):
+        """
+        Entraîne le quantificateur k-means sur les descripteurs de `index` et construit les listes.
+        Le nombre de listes est ramené au nombre de descripteurs d'entraînement ; un
+        index vide ne donne pas d'index IVF (None).
+        """
+        n = len(index)
+        if n == 0:
+            return None
+        if n_lists is None:
+            n_lists = int(4 * np.sqrt(n))
+
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, size=min(n, IVF_TRAINING_SAMPLES), replace=False))
+        n_lists = max(1, min(n_lists, len(sample)))
+        training = to_ivf_space(index.matrix[sample], metric)
+        if len(training) > MINIBATCH_THRESHOLD:
+            kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=seed, n_init=3)
+        else:
+            kmeans = KMeans(n_clusters=n_lists, random_state=seed, n_init=1)
+        kmeans.fit(training)
+
+        ivf = cls(metric, kmeans.cluster_centers_.astype(np.float32),
+                  np.zeros(n_lists + 1, dtype=np.int64), np.empty(0, dtype=np.int64), index.fingerprint)
+        return ivf.assign(index)
+
+    def assign(self, index):
+        """
+        (Ré)affecte toutes les lignes de `index` aux centroïdes existants, sans
+        réentraîner le k-means. Utilisé après une indexation incrémentale.
+        """
+        assignments = np.empty(len(index), dtype=np.int64)
+        for start in range(0, len(index), BLOCK_ROWS):
+            block = to_ivf_space(index.matrix[start:start + BLOCK_ROWS], self.metric)
+            assignments[start:start + len(block)] = self._nearest_lists(block, 1)[:, 0]
+
+        self.rows = np.argsort(assignments, kind='stable')
+        self.offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=self.n_lists), out=self.offsets[1:])
+        self.fingerprint = index.fingerprint
+        return self
+
+    def _nearest_lists(self, vectors, nprobe):
+        """Indices des `nprobe` centroïdes les plus proches de chaque vecteur (déjà projeté)."""
+        distances = self._centroid_sq_norms[None, :] - 2.0 * (vectors @ self.centroids.T)
+        nprobe = min(nprobe, self.n_lists)
+        if nprobe == self.n_lists:
+            return np.broadcast_to(np.arange(self.n_lists), (len(vectors), nprobe))
+        return np.argpartition(distances, nprobe - 1, axis=1)[:, :nprobe]
+
+    # --- Recherche ---
+    def candidates(self, query, nprobe=IVF_NPROBE):
+        """Lignes du store appartenant aux `nprobe` listes les plus proches de la requête."""
+        lists = self._nearest_lists(to_ivf_space(query, self.metric), nprobe)[0]
+        return np.sort(np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in lists]))
+
+    def search(self, index, query, nprobe=IVF_NPROBE):
+        """
+        Distances exactes de la requête aux seules images des listes sondées : les
+        autres images ne sont pas classées.
+
+        Returns:
+            tuple: (lignes candidates triées, distances correspondantes)
+        """
+        rows = self.candidates(query, nprobe)
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+        return rows, index.take(rows).scores(query, self.metric)
+
+    # --- Persistance ---
+    def save(self, model_name, features_path=FEATURES_PATH):
+        path = get_ivf_path(model_name, self.metric, features_path)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, centroids=self.centroids, offsets=self.offsets, rows=self.rows,
+                     metric=self.metric, fingerprint=self.fingerprint)
+        os.replace(path + '.tmp', path)
+        return path
+
+    @classmethod
+    def load(cls, model_name, metric, paths_fingerprint=None, dim=None, features_path=FEATURES_PATH):
+        """
+        Charge l'index IVF d'un modèle. Retourne None s'il n'existe pas ou s'il ne
+        correspond plus au store : empreinte de la table des chemins différente, ou
+        centroïdes d'une autre dimension que `dim` (store réduit par ACP ou non).
+        """
+        path = get_ivf_path(model_name, metric, features_path)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            fingerprint = str(data['fingerprint'])
+            if paths_fingerprint is not None and fingerprint != paths_fingerprint:
+                return None
+            if dim is not None and data['centroids'].shape[1] != dim:
+                return None
+            return cls(str(data['metric']), data['centroids'], data['offsets'], data['rows'], fingerprint)
+
+# CONSTRUCTION / MISE À JOUR POUR TOUTES LES MÉTRIQUES
+# ==============================================================================
+def build_ivf_indexes(model_name, index, metrics=IVF_METRICS, n_lists=IVF_N_LISTS):
+    """Entraîne et sauvegarde un index IVF par métrique pour un modèle."""
+    if len(index) == 0:
+        print(f"Attention : aucun descripteur pour {model_name}, index IVF non construits.")
+        return
+    for metric in metrics:
+        ivf = IVFIndex.build(index, metric, n_lists)
+        ivf.save(model_name)
+    if metrics:
+        print(f"Index IVF construits pour {model_name} ({', '.join(metrics)}).")
+
+def update_ivf_indexes(model_name, index, metrics=IVF_METRICS):
+    """
+    Après une indexation incrémentale, réaffecte les images aux centroïdes existants.
+    Un index absent ou construit sur des descripteurs d'une autre dimension est
+    construit entièrement.
+    """
+    if len(index) == 0:
+        print(f"Attention : aucun descripteur pour {model_name}, index IVF non mis à jour.")
+        return
+    for metric in metrics:
+        ivf = IVFIndex.load(model_name, metric, dim=index.dim)
+        if ivf is None:
+            ivf = IVFIndex.build(index, metric)
+        else:
+            ivf.assign(index)
+        ivf.save(model_name)
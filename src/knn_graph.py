@@ -0,0 +1,175 @@
+import json
+import os
+import numpy as np
+# --- Local imports ---
+from src.config import FEATURES_PATH, KNN_GRAPH_K, KNN_GRAPH_METRICS, KNN_GRAPH_BLOCK_SIZE
+from src.engine import FeatureIndex, paths_fingerprint
+
+# Format sur disque du graphe d'un couple (modèle, métrique) :
+#   - {modèle}_{métrique}_knn.npy      : indices (lignes du store) des K plus proches voisins
+#   - {modèle}_{métrique}_knn_dist.npy : distances correspondantes
+#   - {modèle}_{métrique}_knn.json     : K, empreinte de la table des chemins du store et
+#     dimension des descripteurs (le store réduit par ACP a la même table des chemins)
+# Chaque image est son propre premier voisin (distance nulle), comme dans search().
+
+def get_graph_paths(model_name, metric, features_path=FEATURES_PATH):
+    prefix = os.path.join(features_path, f"{model_name}_{metric}_knn")
+    return prefix + '.npy', prefix + '_dist.npy', prefix + '.json'
+
+class KnnGraph:
+    """K plus proches voisins de chaque image indexée, pour une métrique donnée."""
+
+    def __init__(self, neighbours, distances, fingerprint, dim=None):
+        self.neighbours = neighbours
+        self.distances = distances
+        self.fingerprint = fingerprint
+        self.dim = dim
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    def save(self, model_name, metric, features_path=FEATURES_PATH):
+        neighbours_path, distances_path, meta_path = get_graph_paths(model_name, metric, features_path)
+        for path, array in ((neighbours_path, self.neighbours), (distances_path, self.distances)):
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(path + '.tmp', path)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({'k': self.k, 'fingerprint': self.fingerprint, 'dim': self.dim}, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    @classmethod
+    def load(cls, model_name, metric, paths=None, dim=None, features_path=FEATURES_PATH):
+        """
+        Charge le graphe d'un modèle (en mmap). Retourne None s'il n'existe pas, s'il
+        ne correspond plus à la table des chemins `paths` du store, ou s'il a été
+        construit sur des descripteurs d'une autre dimension que `dim` (store réduit
+        par ACP ou non).
+        """
+        neighbours_path, distances_path, meta_path = get_graph_paths(model_name, metric, features_path)
+        if not all(os.path.exists(path) for path in (neighbours_path, distances_path, meta_path)):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if paths is not None and meta['fingerprint'] != paths_fingerprint(paths):
+            return None
+        if dim is not None and meta.get('dim') != dim:
+            return None
+        return cls(np.load(neighbours_path, mmap_mode='r'), np.load(distances_path, mmap_mode='r'),
+                   meta['fingerprint'], meta.get('dim'))
+
+# 1. CONSTRUCTION
+# ==============================================================================
+def _row_top_k(distances, k):
+    """Top k (trié) de chaque ligne d'une matrice de distances."""
+    k = min(k, distances.shape[1])
+    if k < distances.shape[1]:
+        candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+    candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+    order = np.argsort(candidate_distances, axis=1, kind='stable')
+    return (np.take_along_axis(candidates, order, axis=1).astype(np.int32),
+            np.take_along_axis(candidate_distances, order, axis=1).astype(np.float32))
+
+def _neighbours_of_rows(index, rows, metric, k, block_size):
+    """Calcule les k plus proches voisins des lignes `rows` parmi toute la matrice."""
+    k = min(k, len(index))
+    neighbours = np.empty((len(rows), k), dtype=np.int32)
+    distances = np.empty((len(rows), k), dtype=np.float32)
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        block_distances = np.atleast_2d(index.scores(index.matrix[block], metric))
+        # Les distances NaN sont classées en dernier, comme dans search()
+        neighbours[start:start + len(block)], distances[start:start + len(block)] = \
+            _row_top_k(np.where(np.isnan(block_distances), np.inf, block_distances), k)
+    return neighbours, distances
+
+def build_knn_graph(index, metric, k=KNN_GRAPH_K, block_size=KNN_GRAPH_BLOCK_SIZE):
+    """Construit le graphe des k plus proches voisins de toutes les images de `index`."""
+    neighbours, distances = _neighbours_of_rows(index, np.arange(len(index)), metric, k, block_size)
+    return KnnGraph(neighbours, distances, index.fingerprint, index.dim)
+
+def patch_knn_graph(graph, old_paths, index, metric, changed_paths=(), block_size=KNN_GRAPH_BLOCK_SIZE):
+    """
+    Met à jour un graphe après une indexation incrémentale, sans tout recalculer.
+
+    Args:
+        graph (KnnGraph): Graphe correspondant à l'ancienne table des chemins `old_paths`
+        index (FeatureIndex): Index après mise à jour
+        changed_paths (iterable): Chemins présents avant et après, mais ré-extraits
+
+    Les images nouvelles ou modifiées sont recalculées entièrement, ainsi que celles
+    dont un voisin a disparu. Pour les autres, on fusionne les voisins existants
+    avec les distances aux seules images nouvelles ou modifiées.
+    """
+    k = graph.k
+    changed_paths = set(changed_paths)
+    new_row = {path: row for row, path in enumerate(index.paths)}
+    # Correspondance ancienne ligne -> nouvelle ligne (-1 : image supprimée ou modifiée)
+    old_to_new = np.array([-1 if path in changed_paths else new_row.get(path, -1) for path in old_paths],
+                          dtype=np.int64)
+
+    fresh = np.zeros(len(index), dtype=bool)
+    fresh[[new_row[path] for path in index.paths if path in changed_paths]] = True
+    kept_old_rows = np.flatnonzero(old_to_new >= 0)
+    fresh[np.setdiff1d(np.arange(len(index)), old_to_new[kept_old_rows])] = True
+    fresh_rows = np.flatnonzero(fresh)
+
+    neighbours = np.empty((len(index), min(k, len(index))), dtype=np.int32)
+    distances = np.empty(neighbours.shape, dtype=np.float32)
+    recompute = list(fresh_rows)
+
+    remapped = old_to_new[np.asarray(graph.neighbours[kept_old_rows])]
+    valid = (remapped >= 0).all(axis=1)
+    recompute.extend(old_to_new[kept_old_rows[~valid]])
+
+    merge_old_rows = kept_old_rows[valid]
+    merge_new_rows = old_to_new[merge_old_rows]
+    merge_neighbours = remapped[valid]
+    if len(merge_new_rows):
+        if len(fresh_rows):
+            fresh_index = FeatureIndex([index.paths[row] for row in fresh_rows], index.matrix[fresh_rows])
+        for start in range(0, len(merge_new_rows), block_size):
+            rows = merge_new_rows[start:start + block_size]
+            candidates = merge_neighbours[start:start + block_size]
+            candidate_distances = np.asarray(graph.distances[merge_old_rows[start:start + block_size]])
+            if len(fresh_rows):
+                fresh_distances = np.atleast_2d(fresh_index.scores(index.matrix[rows], metric))
+                fresh_distances = np.where(np.isnan(fresh_distances), np.inf, fresh_distances)
+                candidates = np.concatenate([candidates, np.broadcast_to(fresh_rows, fresh_distances.shape)], axis=1)
+                candidate_distances = np.concatenate([candidate_distances, fresh_distances], axis=1)
+            positions, top_distances = _row_top_k(candidate_distances, neighbours.shape[1])
+            neighbours[rows] = np.take_along_axis(candidates, positions.astype(np.int64), axis=1)
+            distances[rows] = top_distances
+
+    if recompute:
+        recompute = np.array(sorted(set(recompute)), dtype=np.int64)
+        neighbours[recompute], distances[recompute] = _neighbours_of_rows(
+            index, recompute, metric, neighbours.shape[1], block_size)
+
+    return KnnGraph(neighbours, distances, index.fingerprint, index.dim)
+
+# 2. CONSTRUCTION / MISE À JOUR POUR TOUTES LES MÉTRIQUES
+# ==============================================================================
+def build_knn_graphs(model_name, index, metrics=KNN_GRAPH_METRICS, k=KNN_GRAPH_K):
+    """Construit et sauvegarde le graphe de chaque métrique pour un modèle."""
+    for metric in metrics:
+        build_knn_graph(index, metric, k).save(model_name, metric)
+    print(f"Graphes des {k} plus proches voisins construits pour {model_name} ({', '.join(metrics)}).")
+
+def update_knn_graphs(model_name, old_paths, index, changed_paths=(), metrics=KNN_GRAPH_METRICS, k=KNN_GRAPH_K):
+    """
+    Met à jour le graphe de chaque métrique après une indexation incrémentale.
+    Un graphe absent, ne correspondant pas à `old_paths` ou construit sur des
+    descripteurs d'une autre dimension est reconstruit entièrement.
+    """
+    for metric in metrics:
+        graph = KnnGraph.load(model_name, metric, old_paths, index.dim)
+        if graph is None or graph.k != min(k, len(old_paths)):
+            graph = build_knn_graph(index, metric, k)
+        else:
+            graph = patch_knn_graph(graph, old_paths, index, metric, changed_paths)
+        graph.save(model_name, metric)
+    print(f"Graphes des plus proches voisins mis à jour pour {model_name}.")
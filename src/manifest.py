@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+# --- Local imports ---
+from src.config import FEATURES_PATH, PREPROCESS_DRAFT, PREPROCESS_VERSION
+from src.backends import configured_backend
+
+# Le manifeste d'un modèle ({modèle}_manifest.json) décrit chaque image indexée :
+# taille, date de modification et empreinte du contenu. Il permet de ne
+# ré-extraire que les images ajoutées ou modifiées depuis la dernière indexation.
+# Il enregistre aussi les réglages dont dépendent les descripteurs (pré-traitement,
+# backend d'inférence) :
+# s'ils ont changé, toutes les images sont à ré-extraire.
+
+def get_manifest_path(model_name, features_path=FEATURES_PATH):
+    return os.path.join(features_path, f"{model_name}_manifest.json")
+
+def indexing_settings(model_name):
+    """Réglages dont dépendent les descripteurs d'un modèle, enregistrés dans son manifeste."""
+    return {'preprocess_version': PREPROCESS_VERSION, 'preprocess_draft': PREPROCESS_DRAFT,
+            'backend': configured_backend(model_name)}
+
+def load_manifest(model_name, features_path=FEATURES_PATH):
+    """Retourne le manifeste d'un modèle ({chemin: infos}), vide s'il n'existe pas."""
+    path = get_manifest_path(model_name, features_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)['images']
+
+def save_manifest(model_name, manifest, features_path=FEATURES_PATH):
+    path = get_manifest_path(model_name, features_path)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': 1, 'settings': indexing_settings(model_name), 'images': manifest}, f)
+    os.replace(path + '.tmp', path)
+
+def manifest_is_current(model_name, features_path=FEATURES_PATH):
+    """
+    Indique si le manifeste d'un modèle a été enregistré avec les réglages actuels
+    (False pour un manifeste absent ou antérieur à l'enregistrement des réglages).
+    """
+    path = get_manifest_path(model_name, features_path)
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        return json.load(f).get('settings') == indexing_settings(model_name)
+
+def file_hash(path, chunk_size=1 << 20):
+    """Empreinte SHA-256 du contenu d'un fichier."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def scan_images(image_paths, previous=None):
+    """
+    Construit le manifeste des images données. L'empreinte d'une image n'est
+    recalculée que si sa taille ou sa date de modification a changé.
+    """
+    previous = previous or {}
+    manifest = {}
+    for img_path in image_paths:
+        stat = os.stat(img_path)
+        entry = previous.get(img_path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': file_hash(img_path)}
+        manifest[img_path] = entry
+    return manifest
+
+def diff_manifests(previous, current):
+    """
+    Compare deux manifestes.
+
+    Returns:
+        tuple: (images ajoutées, images modifiées, images supprimées), chacune triée
+    """
+    added = sorted(path for path in current if path not in previous)
+    changed = sorted(path for path in current
+                     if path in previous and previous[path]['sha256'] != current[path]['sha256'])
+    removed = sorted(path for path in previous if path not in current)
+    return added, changed, removed
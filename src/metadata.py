@@ -0,0 +1,97 @@
+import os
+import numpy as np
+# --- Local imports ---
+from src.config import FEATURES_PATH
+from src.evaluation import get_image_classes
+
+# Format sur disque : {modèle}_meta.npz (classe de chaque ligne du store, empreinte des chemins).
+# L'identifiant d'une image est sa ligne dans le store : les chemins ne sont plus
+# analysés à chaque requête, seule la table des classes est consultée.
+
+class DatasetMetadata:
+    """
+    Métadonnées des images indexées : identifiant entier (ligne du store), chemin,
+    classe (-1 si inconnue) et nombre d'images par classe.
+    """
+
+    def __init__(self, paths, labels, fingerprint=None):
+        self.paths = paths
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.fingerprint = fingerprint
+        if len(self.labels) != len(self.paths):
+            raise ValueError("La table des classes ne correspond pas à la liste des chemins.")
+        known = self.labels[self.labels >= 0]
+        self.class_counts = np.bincount(known) if len(known) else np.zeros(0, dtype=np.int64)
+        # Identifiants de toutes les images (calculés une fois) ; la table chemin -> identifiant
+        # n'est construite qu'au premier appel de `id_of`
+        self.ids = np.arange(len(self.paths))
+        self.ids.flags.writeable = False
+        self._id_by_path = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def from_index(cls, index):
+        """Construit les métadonnées d'un FeatureIndex (les noms de fichiers sont analysés une seule fois)."""
+        return cls(index.paths, get_image_classes(index.paths), index.fingerprint)
+
+    def id_of(self, path):
+        """Identifiant d'une image à partir de son chemin, ou None si elle n'est pas indexée."""
+        if self._id_by_path is None:
+            self._id_by_path = {path: i for i, path in enumerate(self.paths)}
+        return self._id_by_path.get(path)
+
+    def label_of(self, image_id):
+        """Classe d'une image (None si elle est inconnue)."""
+        label = int(self.labels[image_id])
+        return label if label >= 0 else None
+
+    def class_count(self, label):
+        """Nombre d'images indexées de la classe `label`."""
+        if label is None or not 0 <= label < len(self.class_counts):
+            return 0
+        return int(self.class_counts[label])
+
+    def save(self, model_name, features_path=FEATURES_PATH):
+        path = get_metadata_path(model_name, features_path)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, labels=self.labels, fingerprint=self.fingerprint)
+        os.replace(path + '.tmp', path)
+        return path
+
+    @classmethod
+    def load(cls, model_name, index, features_path=FEATURES_PATH):
+        """Charge les métadonnées d'un modèle, ou None si elles ne correspondent plus à `index`."""
+        path = get_metadata_path(model_name, features_path)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if str(data['fingerprint']) != index.fingerprint:
+                return None
+            return cls(index.paths, data['labels'], index.fingerprint)
+
+def get_metadata_path(model_name, features_path=FEATURES_PATH):
+    return os.path.join(features_path, f"{model_name}_meta.npz")
+
+def build_metadata(model_name, index):
+    """Construit et sauvegarde les métadonnées du store d'un modèle."""
+    metadata = DatasetMetadata.from_index(index)
+    metadata.save(model_name)
+    return metadata
+
+# Métadonnées déjà chargées, par modèle
+_metadata = {}
+
+def get_metadata(model_name, index):
+    """
+    Retourne les métadonnées correspondant aux descripteurs chargés d'un modèle.
+    Si le fichier est absent ou obsolète, elles sont reconstruites en mémoire.
+    """
+    cached = _metadata.get(model_name)
+    if cached is None or cached.fingerprint != index.fingerprint:
+        cached = DatasetMetadata.load(model_name, index)
+        if cached is None:
+            cached = DatasetMetadata.from_index(index)
+        _metadata[model_name] = cached
+    return cached
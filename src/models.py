@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+# --- PyTorch specific imports ---
+import torch
+import torchvision.models as models
+# --- Local imports ---
+from src.backends import build_backend
+from src.config import MAX_RESIDENT_MODELS, WARMUP_BATCH_SIZE, INFERENCE_DEVICE
+from src.telemetry import span
+
+# 1. CONSTRUCTION DES BACKBONES
+# ==============================================================================
+def get_device():
+    """
+    Retourne le périphérique de calcul à utiliser : INFERENCE_DEVICE s'il est
+    défini, sinon un GPU CUDA, le GPU du Mac (MPS) ou, à défaut, le CPU.
+    """
+    if INFERENCE_DEVICE:
+        return torch.device(INFERENCE_DEVICE)
+    if torch.cuda.is_available():
+        return torch.device("cuda")
+    return torch.device("mps" if torch.backends.mps.is_available() else "cpu")
+
+def build_model(model_name):
+    """
+    Construit un backbone pré-entraîné dont la tête de classification a été retirée,
+    afin qu'il retourne directement le vecteur de caractéristiques.
+    """
+    if model_name == 'vgg16':
+        model = models.vgg16(weights=models.VGG16_Weights.DEFAULT)
+        # On enlève la dernière couche (le classifieur) pour obtenir le vecteur de features
+        model.classifier = torch.nn.Sequential(*list(model.classifier.children())[:-1])
+    elif model_name == 'resnet50':
+        model = models.resnet50(weights=models.ResNet50_Weights.DEFAULT)
+        # On enlève la dernière couche (fully connected)
+        model.fc = torch.nn.Identity()
+    elif model_name == 'vit_b_16':
+        model = models.vit_b_16(weights=models.ViT_B_16_Weights.DEFAULT)
+        # On enlève la tête de classification
+        model.heads.head = torch.nn.Identity()
+    else:
+        raise ValueError("Modèle non supporté.")
+    return model
+
+# 2. REGISTRE DES MODÈLES
+# ==============================================================================
+class ModelRegistry:
+    """
+    Garde en mémoire les modèles déjà construits, préparés avec leur backend
+    d'inférence (voir src/backends.py), pour ne les charger qu'une fois par
+    processus. Le nombre de modèles résidents est borné : le moins récemment
+    utilisé est libéré lorsque la limite est dépassée.
+    """
+
+    def __init__(self, max_resident=MAX_RESIDENT_MODELS):
+        self.max_resident = max(1, max_resident)
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        # Temps de chargement / préchauffage et compteurs par modèle
+        self.stats = {}
+
+    def get(self, model_name):
+        """Retourne le modèle demandé, en le chargeant si nécessaire."""
+        with self._lock:
+            if model_name in self._models:
+                self._models.move_to_end(model_name)
+                self.stats[model_name]['hits'] += 1
+                return self._models[model_name]
+
+            with span('model_load'):
+                model = self._load(model_name)
+            self._models[model_name] = model
+
+            # Éviction LRU si trop de modèles sont résidents
+            while len(self._models) > self.max_resident:
+                evicted_name, _ = self._models.popitem(last=False)
+                self.stats[evicted_name]['evictions'] += 1
+                print(f"Modèle '{evicted_name}' libéré de la mémoire (LRU).")
+            return model
+
+    def _load(self, model_name):
+        """Construit, prépare (backend d'inférence) et préchauffe un modèle."""
+        start_time = time.perf_counter()
+        model = build_backend(model_name, build_model(model_name), get_device())
+        load_time = time.perf_counter() - start_time
+
+        # Préchauffage avec un batch factice pour ne pas pénaliser la première requête
+        start_time = time.perf_counter()
+        model(torch.zeros(WARMUP_BATCH_SIZE, 3, 224, 224))
+        warmup_time = time.perf_counter() - start_time
+
+        model_stats = self.stats.setdefault(model_name, {'loads': 0, 'hits': 0, 'evictions': 0})
+        model_stats['loads'] += 1
+        model_stats['load_time'] = load_time
+        model_stats['warmup_time'] = warmup_time
+        model_stats['backend'] = model.name
+        print(f"Modèle '{model_name}' chargé en {load_time:.2f}s (backend {model.name}, "
+              f"préchauffage : {warmup_time:.2f}s).")
+        return model
+
+    def resident_models(self):
+        """Liste des modèles actuellement en mémoire, du moins au plus récemment utilisé."""
+        with self._lock:
+            return list(self._models.keys())
+
+    def clear(self):
+        """Libère tous les modèles."""
+        with self._lock:
+            self._models.clear()
+
+# Registre partagé par tout le processus
+_registry = ModelRegistry()
+
+def get_model(model_name):
+    """Retourne le modèle `model_name` (backend d'inférence) depuis le registre du processus."""
+    return _registry.get(model_name)
+
+def get_model_stats():
+    """Retourne les temps de chargement/préchauffage et compteurs de chaque modèle."""
+    return {name: dict(stats) for name, stats in _registry.stats.items()}
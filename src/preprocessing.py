@@ -0,0 +1,115 @@
+import io
+import numpy as np
+# --- PyTorch specific imports ---
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+# --- Local imports ---
+from src.config import PREPROCESS_DRAFT
+
+# Géométrie et normalisation attendues par les backbones (statistiques ImageNet)
+RESIZE_SIZE = 256
+CROP_SIZE = 224
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+# Pipeline torchvision d'origine : référence pour vérifier le chemin rapide
+REFERENCE_TRANSFORM = transforms.Compose([
+    transforms.Resize(RESIZE_SIZE),
+    transforms.CenterCrop(CROP_SIZE),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=MEAN, std=STD),
+])
+
+# Normalisation fusionnée : (x / 255 - mean) / std = x * scale - shift
+_SCALE = torch.tensor([1.0 / (255.0 * s) for s in STD]).reshape(1, 3, 1, 1)
+_SHIFT = torch.tensor([m / s for m, s in zip(MEAN, STD)]).reshape(1, 3, 1, 1)
+
+# 1. DÉCODAGE
+# ==============================================================================
+def open_image(source, draft=PREPROCESS_DRAFT):
+    """
+    Ouvre une image (chemin, octets, fichier ou image PIL) en RGB. Avec `draft`,
+    un JPEG est décodé directement à une échelle réduite (1/2, 1/4 ou 1/8, dans
+    le domaine DCT) tant que son petit côté reste d'au moins RESIZE_SIZE pixels :
+    une grande image n'est jamais décodée en pleine résolution.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    image = source if isinstance(source, Image.Image) else Image.open(source)
+    if draft and image.format == 'JPEG':
+        # Plus petite échelle dont les deux côtés restent >= RESIZE_SIZE
+        image.draft('RGB', (RESIZE_SIZE, RESIZE_SIZE))
+    return image.convert('RGB')
+
+def resize_and_crop(image):
+    """
+    Redimensionne le petit côté à RESIZE_SIZE puis découpe le carré central de
+    CROP_SIZE pixels, avec les mêmes arrondis que Resize / CenterCrop de torchvision.
+    """
+    width, height = image.size
+    if width <= height:
+        size = (RESIZE_SIZE, int(RESIZE_SIZE * height / width))
+    else:
+        size = (int(RESIZE_SIZE * width / height), RESIZE_SIZE)
+    if size != image.size:
+        image = image.resize(size, Image.BILINEAR)
+    left = int(round((size[0] - CROP_SIZE) / 2.0))
+    top = int(round((size[1] - CROP_SIZE) / 2.0))
+    return image.crop((left, top, left + CROP_SIZE, top + CROP_SIZE))
+
+def load_tensor(source, draft=PREPROCESS_DRAFT):
+    """
+    Image pré-traitée sous forme de tenseur uint8 3xCROP_SIZExCROP_SIZE (4 fois
+    plus léger que le float32 ; la normalisation est faite par batch, voir
+    `normalize_batch`).
+    """
+    image = resize_and_crop(open_image(source, draft))
+    return torch.from_numpy(np.asarray(image).copy()).permute(2, 0, 1)
+
+# 2. NORMALISATION PAR BATCH
+# ==============================================================================
+def normalize_batch(batch):
+    """
+    Convertit un batch uint8 Nx3xHxW en float32 normalisé en une seule passe
+    (une conversion et une multiplication-soustraction pour tout le batch).
+    """
+    if batch.dtype != torch.uint8:
+        return batch
+    scale, shift = _SCALE.to(batch.device), _SHIFT.to(batch.device)
+    return batch.float().mul_(scale).sub_(shift)
+
+def preprocess_batch(sources, draft=PREPROCESS_DRAFT):
+    """Batch float32 normalisé prêt pour le modèle, à partir de plusieurs images."""
+    return normalize_batch(torch.stack([load_tensor(source, draft) for source in sources]))
+
+# 3. VÉRIFICATION
+# ==============================================================================
+def compare_with_reference(model, sources, batch_size=16, draft=PREPROCESS_DRAFT):
+    """
+    Compare les descripteurs obtenus avec le chemin rapide (décodage réduit si
+    `draft`, uint8, normalisation fusionnée) à ceux du pipeline torchvision
+    d'origine. `model` est un backend d'inférence (voir src/backends.py).
+
+    Returns:
+        dict: similarité cosinus minimale / moyenne et erreur relative maximale
+        (norme de l'écart / norme de la référence) entre les deux descripteurs
+    """
+    similarities, errors = [], []
+    with torch.inference_mode():
+        for start in range(0, len(sources), batch_size):
+            chunk = sources[start:start + batch_size]
+            reference = torch.stack([REFERENCE_TRANSFORM(Image.open(source).convert('RGB')) for source in chunk])
+            fast = preprocess_batch(chunk, draft)
+            reference = model(reference).cpu().numpy()
+            fast = model(fast).cpu().numpy()
+            norms = np.linalg.norm(reference, axis=1)
+            similarities.append(np.einsum('ij,ij->i', reference, fast) / (norms * np.linalg.norm(fast, axis=1) + 1e-12))
+            errors.append(np.linalg.norm(reference - fast, axis=1) / (norms + 1e-12))
+    similarities, errors = np.concatenate(similarities), np.concatenate(errors)
+    return {
+        'images': len(similarities),
+        'min_cosine': float(similarities.min()),
+        'mean_cosine': float(similarities.mean()),
+        'max_relative_error': float(errors.max()),
+    }
@@ -0,0 +1,181 @@
+import os
+import numpy as np
+# --- Local imports ---
+from src.config import FEATURES_PATH, SCORING_CHUNK_ROWS, QUANTIZED_MODELS, QUANTIZATION_RERANK
+from src.engine import FeatureIndex, top_k
+
+QUANTIZATION_MODES = ('float16', 'int8')
+
+# Format sur disque (la table des chemins {modèle}_paths.json est partagée avec le store float32) :
+#   - {modèle}_{mode}.npy         : codes quantifiés (float16 ou int8)
+#   - {modèle}_{mode}_params.npz  : échelle et décalage par dimension (int8), empreinte des chemins
+
+# 1. QUANTIFICATION
+# ==============================================================================
+def quantize(matrix, mode):
+    """
+    Quantifie une matrice de descripteurs.
+
+    Returns:
+        tuple: (codes, scale, offset) ; pour 'int8', x ≈ codes * scale + offset
+        (par dimension), pour 'float16' scale et offset valent None
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if mode == 'float16':
+        return matrix.astype(np.float16), None, None
+    if mode != 'int8':
+        raise ValueError(f"Mode de quantification '{mode}' non supporté.")
+
+    minimum = matrix.min(axis=0)
+    scale = (matrix.max(axis=0) - minimum) / 255.0
+    scale[scale == 0] = 1.0
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    for start in range(0, len(matrix), SCORING_CHUNK_ROWS):
+        block = (matrix[start:start + SCORING_CHUNK_ROWS] - minimum) / scale
+        codes[start:start + len(block)] = np.clip(np.rint(block) - 128, -128, 127)
+    offset = minimum + 128.0 * scale
+    return codes, scale.astype(np.float32), offset.astype(np.float32)
+
+class DequantizedRows:
+    """Vue en lecture des codes quantifiés : chaque accès retourne des lignes float32."""
+
+    def __init__(self, codes, scale, offset):
+        self.codes = codes
+        self.scale = scale
+        self.offset = offset
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        rows = np.asarray(self.codes[key], dtype=np.float32)
+        if self.scale is not None:
+            rows *= self.scale
+            rows += self.offset
+        return rows
+
+    def __iter__(self):
+        for start in range(0, len(self), SCORING_CHUNK_ROWS):
+            yield from self[start:start + SCORING_CHUNK_ROWS]
+
+# 2. INDEX QUANTIFIÉ
+# ==============================================================================
+class QuantizedFeatureIndex(FeatureIndex):
+    """
+    FeatureIndex dont la matrice est stockée quantifiée. Les distances sont
+    calculées directement sur les codes, par blocs de lignes convertis en float32 :
+    la mémoire résidente et la bande passante lue sont divisées par 2 (float16) ou
+    4 (int8). Si un index float32 exact est fourni, les `rerank` meilleurs
+    candidats sont re-classés avec leurs descripteurs d'origine.
+    """
+
+    def __init__(self, paths, codes, mode, scale=None, offset=None, exact_index=None, rerank=QUANTIZATION_RERANK):
+        self.paths = list(paths)
+        self.codes = codes
+        self.mode = mode
+        self.scale = scale
+        self.offset = offset
+        self.matrix = DequantizedRows(codes, scale, offset)
+        self.exact_index = exact_index
+        self.rerank = rerank
+        if codes.ndim != 2 or codes.shape[0] != len(self.paths):
+            raise ValueError("La matrice de codes ne correspond pas à la liste des chemins.")
+        self._cache = {}
+
+    @classmethod
+    def from_index(cls, index, mode, rerank=QUANTIZATION_RERANK):
+        """Quantifie un FeatureIndex float32 (qui sert ensuite au re-classement)."""
+        codes, scale, offset = quantize(index.matrix, mode)
+        return cls(index.paths, codes, mode, scale, offset, exact_index=index, rerank=rerank)
+
+    @property
+    def bhattacharyya_roots(self):
+        # Pas de copie float32 de la matrice : les racines sont calculées par blocs
+        return None
+
+    def _dot(self, queries):
+        products = np.empty((len(queries), len(self)), dtype=np.float32)
+        if self.scale is not None:
+            # x.q = codes.(q * échelle) + décalage.q
+            scaled_queries = queries * self.scale
+            bias = queries @ self.offset
+        for start in range(0, len(self), SCORING_CHUNK_ROWS):
+            block = np.asarray(self.codes[start:start + SCORING_CHUNK_ROWS], dtype=np.float32)
+            if self.scale is None:
+                products[:, start:start + len(block)] = queries @ block.T
+            else:
+                products[:, start:start + len(block)] = scaled_queries @ block.T + bias[:, None]
+        return products
+
+    def scores(self, queries, metric='euclidean'):
+        distances = super().scores(queries, metric)
+        if self.exact_index is None or not self.rerank:
+            return distances
+
+        # Re-classement exact des meilleurs candidats
+        queries = np.asarray(queries, dtype=np.float32)
+        for query, query_distances in zip(np.atleast_2d(queries), np.atleast_2d(distances)):
+            candidates = top_k(query_distances, self.rerank)
+            query_distances[candidates] = self.exact_index.take(np.sort(candidates)).scores(query, metric)[
+                np.argsort(np.argsort(candidates))]
+        return distances
+
+    def take(self, rows):
+        if self.exact_index is not None:
+            return self.exact_index.take(rows)
+        return FeatureIndex([self.paths[row] for row in rows], self.matrix[rows])
+
+# 3. PERSISTANCE
+# ==============================================================================
+def get_quantized_paths(model_name, mode, features_path=FEATURES_PATH):
+    prefix = os.path.join(features_path, f"{model_name}_{mode}")
+    return prefix + '.npy', prefix + '_params.npz'
+
+def save_quantized_store(model_name, mode, index, features_path=FEATURES_PATH):
+    """Quantifie le store float32 d'un modèle et sauvegarde les codes à côté."""
+    codes, scale, offset = quantize(index.matrix, mode)
+    codes_path, params_path = get_quantized_paths(model_name, mode, features_path)
+    with open(codes_path + '.tmp', 'wb') as f:
+        np.save(f, codes)
+    params = {'fingerprint': index.fingerprint}
+    if scale is not None:
+        params.update(scale=scale, offset=offset)
+    with open(params_path + '.tmp', 'wb') as f:
+        np.savez(f, **params)
+    os.replace(codes_path + '.tmp', codes_path)
+    os.replace(params_path + '.tmp', params_path)
+    print(f"Store quantifié ({mode}) sauvegardé pour {model_name} : {codes_path}")
+    return codes_path
+
+def load_quantized_store(model_name, mode, exact_index, features_path=FEATURES_PATH, rerank=QUANTIZATION_RERANK):
+    """
+    Ouvre (en mmap) le store quantifié d'un modèle. Retourne None s'il n'existe
+    pas ou s'il ne correspond plus au store float32 `exact_index`.
+    """
+    codes_path, params_path = get_quantized_paths(model_name, mode, features_path)
+    if not (os.path.exists(codes_path) and os.path.exists(params_path)):
+        return None
+    with np.load(params_path) as params:
+        if str(params['fingerprint']) != exact_index.fingerprint:
+            return None
+        scale = params['scale'] if 'scale' in params else None
+        offset = params['offset'] if 'offset' in params else None
+    codes = np.load(codes_path, mmap_mode='r')
+    if codes.shape != (len(exact_index), exact_index.dim):
+        return None
+    return QuantizedFeatureIndex(exact_index.paths, codes, mode, scale, offset,
+                                 exact_index=exact_index, rerank=rerank)
+
+def build_quantized_store(model_name, index, quantized_models=QUANTIZED_MODELS):
+    """
+    (Re)construit le store quantifié d'un modèle s'il est configuré. La
+    quantification est linéaire en taille : elle est refaite entièrement après
+    une indexation incrémentale (l'échelle int8 peut changer).
+    """
+    mode = quantized_models.get(model_name)
+    if mode:
+        save_quantized_store(model_name, mode, index)
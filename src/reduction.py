@@ -0,0 +1,146 @@
+import os
+import numpy as np
+# --- Local imports ---
+from src.config import FEATURES_PATH, SCORING_CHUNK_ROWS, REDUCTION_DIMS, REDUCTION_WHITEN
+from src.engine import EPS, FeatureIndex
+from src.feature_store import feature_store_exists, load_feature_store, save_feature_store
+
+# Format sur disque :
+#   - {modèle}_pca.npz                       : moyenne, composantes, échelles, empreinte des chemins
+#   - {modèle}_pca.npy / {modèle}_pca_paths.json : store des descripteurs réduits
+# Le store float32 d'origine est conservé : il sert à ré-apprendre la projection.
+
+# Métriques applicables aux descripteurs réduits : les composantes ACP sont signées,
+# alors que le chi-carré et Bhattacharyya comparent des histogrammes positifs
+REDUCED_METRICS = ('euclidean', 'cosine', 'correlation')
+
+def applicable_metrics(metrics, reduced):
+    """Métriques de `metrics` utilisables sur des descripteurs réduits (`reduced`) ou non."""
+    return [metric for metric in metrics if not reduced or metric in REDUCED_METRICS]
+
+# 1. PROJECTION
+# ==============================================================================
+class Projection:
+    """Projection ACP (éventuellement blanchie) : y = ((x - mean) @ components.T) * scales."""
+
+    def __init__(self, mean, components, scales, whiten=False, fingerprint=None):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.scales = np.asarray(scales, dtype=np.float32)
+        self.whiten = bool(whiten)
+        self.fingerprint = fingerprint
+
+    @property
+    def dim(self):
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, index, dim, whiten=False):
+        """
+        Apprend la projection sur les descripteurs d'un FeatureIndex. La matrice de
+        covariance est accumulée par blocs de lignes (la matrice n'est pas copiée).
+        """
+        n_rows, n_dims = len(index), index.dim
+        if dim > min(n_rows, n_dims):
+            print(f"Dimension cible {dim} ramenée à {min(n_rows, n_dims)} (rang maximal des descripteurs).")
+            dim = min(n_rows, n_dims)
+
+        mean = np.zeros(n_dims, dtype=np.float64)
+        for start in range(0, n_rows, SCORING_CHUNK_ROWS):
+            mean += np.asarray(index.matrix[start:start + SCORING_CHUNK_ROWS], dtype=np.float64).sum(axis=0)
+        mean /= n_rows
+        covariance = np.zeros((n_dims, n_dims), dtype=np.float64)
+        for start in range(0, n_rows, SCORING_CHUNK_ROWS):
+            block = np.asarray(index.matrix[start:start + SCORING_CHUNK_ROWS], dtype=np.float64) - mean
+            covariance += block.T @ block
+        covariance /= max(n_rows - 1, 1)
+
+        # Vecteurs propres par valeur propre décroissante
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1][:dim]
+        components = eigenvectors[:, order].T
+        if whiten:
+            scales = 1.0 / np.sqrt(np.maximum(eigenvalues[order], 0) + EPS)
+        else:
+            scales = np.ones(dim)
+        return cls(mean, components, scales, whiten, index.fingerprint)
+
+    def transform(self, vectors):
+        """Projette un vecteur (1D) ou une matrice de vecteurs (une ligne par vecteur)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return ((vectors - self.mean) @ self.components.T) * self.scales
+
+    def transform_index(self, index):
+        """Retourne un FeatureIndex des descripteurs projetés, calculé par blocs de lignes."""
+        reduced = np.empty((len(index), self.dim), dtype=np.float32)
+        for start in range(0, len(index), SCORING_CHUNK_ROWS):
+            block = index.matrix[start:start + SCORING_CHUNK_ROWS]
+            reduced[start:start + len(block)] = self.transform(block)
+        return FeatureIndex(index.paths, reduced)
+
+    def save(self, model_name, features_path=FEATURES_PATH):
+        path = get_projection_path(model_name, features_path)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, mean=self.mean, components=self.components, scales=self.scales,
+                     whiten=self.whiten, fingerprint=self.fingerprint)
+        os.replace(path + '.tmp', path)
+        return path
+
+    @classmethod
+    def load(cls, model_name, features_path=FEATURES_PATH):
+        """Charge la projection d'un modèle, ou None si elle est absente."""
+        path = get_projection_path(model_name, features_path)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data['mean'], data['components'], data['scales'],
+                       bool(data['whiten']), str(data['fingerprint']))
+
+# 2. STORE RÉDUIT
+# ==============================================================================
+def get_projection_path(model_name, features_path=FEATURES_PATH):
+    return os.path.join(features_path, f"{model_name}_pca.npz")
+
+def get_reduced_store_name(model_name):
+    return f"{model_name}_pca"
+
+def build_reduction(model_name, index, reduction_dims=REDUCTION_DIMS, whiten=REDUCTION_WHITEN, refit=True):
+    """
+    Apprend (ou réutilise, avec `refit=False`) la projection d'un modèle configuré
+    dans REDUCTION_DIMS et sauvegarde le store des descripteurs réduits.
+
+    Returns:
+        FeatureIndex: index réduit, ou `index` inchangé si le modèle n'est pas configuré
+    """
+    dim = reduction_dims.get(model_name)
+    if not dim:
+        return index
+
+    projection = None if refit else Projection.load(model_name)
+    if projection is None or projection.whiten != whiten or projection.dim != min(dim, len(index), index.dim):
+        projection = Projection.fit(index, dim, whiten)
+    # L'empreinte identifie les chemins du store réduit correspondant
+    projection.fingerprint = index.fingerprint
+
+    reduced = projection.transform_index(index)
+    save_feature_store(get_reduced_store_name(model_name), reduced.paths, reduced.matrix)
+    projection.save(model_name)
+    print(f"Projection ACP ({index.dim} -> {projection.dim}{', blanchie' if whiten else ''}) sauvegardée pour {model_name}.")
+    return load_feature_store(get_reduced_store_name(model_name))
+
+def load_reduced_store(model_name, index):
+    """
+    Ouvre le store réduit d'un modèle et sa projection. Retourne (None, None) s'ils
+    sont absents ou ne correspondent plus au store d'origine `index`.
+
+    Returns:
+        tuple: (FeatureIndex réduit, Projection)
+    """
+    projection = Projection.load(model_name)
+    if projection is None or projection.fingerprint != index.fingerprint \
+            or not feature_store_exists(get_reduced_store_name(model_name)):
+        return None, None
+    reduced = load_feature_store(get_reduced_store_name(model_name))
+    if reduced.fingerprint != index.fingerprint or reduced.dim != projection.dim:
+        return None, None
+    return reduced, projection
@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+# --- Local imports ---
+from src.config import (RESULT_STORE_PATH, RESULT_STORE_MEMORY_ITEMS, RESULT_STORE_TTL,
+                        RESULT_STORE_MAX_ROWS, RESULT_STORE_EVICTION_INTERVAL)
+
+class ResultStore:
+    """
+    Stockage borné des classements produits par les recherches, consultés ensuite
+    par la page de résultats à partir de leur `search_id` :
+      - un LRU en mémoire, propre à chaque processus ;
+      - une base sqlite partagée par tous les workers, où chaque classement est
+        stocké sous forme de deux tableaux compacts (identifiants int32, distances
+        float32), avec l'empreinte du store dont les identifiants sont les lignes.
+    Un classement lu par un worker qui a chargé un autre store (réindexation
+    incrémentale, workers redémarrés à des moments différents) est considéré comme
+    expiré : ses identifiants désigneraient d'autres images.
+    Les résultats expirent après `ttl` secondes et la base est limitée à `max_rows`
+    résultats ; l'éviction est faite par un thread en arrière-plan.
+    """
+
+    def __init__(self, path=RESULT_STORE_PATH, max_memory_items=RESULT_STORE_MEMORY_ITEMS, ttl=RESULT_STORE_TTL,
+                 max_rows=RESULT_STORE_MAX_ROWS, eviction_interval=RESULT_STORE_EVICTION_INTERVAL):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.eviction_interval = eviction_interval
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._eviction_pid = None
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'expired': 0, 'stale': 0, 'evictions': 0}
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS results (
+                    search_id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    ids BLOB NOT NULL,
+                    scores BLOB NOT NULL,
+                    fingerprint TEXT NOT NULL DEFAULT ''
+                )
+            ''')
+            # Base créée avant l'enregistrement de l'empreinte du store
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(results)')]
+            if 'fingerprint' not in columns:
+                conn.execute("ALTER TABLE results ADD COLUMN fingerprint TEXT NOT NULL DEFAULT ''")
+            conn.execute('CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at)')
+
+    def _connect(self):
+        # Une connexion par thread (et par processus : une connexion ne survit pas au fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def put(self, search_id, ids, scores, fingerprint=''):
+        """
+        Enregistre le classement d'une recherche (identifiants et distances, dans
+        l'ordre) et l'empreinte du store dont les identifiants sont les lignes.
+        """
+        ids = np.ascontiguousarray(ids, dtype=np.int32)
+        scores = np.ascontiguousarray(scores, dtype=np.float32)
+        if len(ids) != len(scores):
+            raise ValueError("Les identifiants et les distances n'ont pas la même longueur.")
+        created_at = time.time()
+        with self._lock:
+            self._remember(search_id, (created_at, ids, scores, fingerprint))
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO results (search_id, created_at, ids, scores, fingerprint) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         (search_id, created_at, ids.tobytes(), scores.tobytes(), fingerprint))
+        self._start_eviction()
+
+    def get(self, search_id, fingerprint=''):
+        """
+        Retourne le classement d'une recherche sous forme de tableaux (identifiants,
+        distances), ou None s'il est inconnu, expiré, ou enregistré pour un autre
+        store que celui d'empreinte `fingerprint`.
+        """
+        with self._lock:
+            entry = self._memory.get(search_id)
+            if entry is not None:
+                self._memory.move_to_end(search_id)
+
+        if entry is None:
+            row = self._connect().execute(
+                'SELECT created_at, ids, scores, fingerprint FROM results WHERE search_id = ?', (search_id,)
+            ).fetchone()
+            if row is None:
+                with self._lock:
+                    self.stats['misses'] += 1
+                return None
+            entry = (row[0], np.frombuffer(row[1], dtype=np.int32), np.frombuffer(row[2], dtype=np.float32), row[3])
+            with self._lock:
+                self.stats['db_hits'] += 1
+                self._remember(search_id, entry)
+        else:
+            with self._lock:
+                self.stats['memory_hits'] += 1
+
+        created_at, ids, scores, stored_fingerprint = entry
+        if time.time() - created_at > self.ttl:
+            with self._lock:
+                self._memory.pop(search_id, None)
+                self.stats['expired'] += 1
+            return None
+        if stored_fingerprint != fingerprint:
+            with self._lock:
+                self.stats['stale'] += 1
+            return None
+        return ids, scores
+
+    def _remember(self, search_id, entry):
+        # Les tableaux sont partagés entre les appelants : on les protège en écriture
+        for array in entry[1:3]:
+            array.flags.writeable = False
+        self._memory[search_id] = entry
+        self._memory.move_to_end(search_id)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def evict(self):
+        """Supprime les résultats expirés, puis les plus anciens au-delà de `max_rows`."""
+        with self._connect() as conn:
+            removed = conn.execute('DELETE FROM results WHERE created_at < ?', (time.time() - self.ttl,)).rowcount
+            removed += conn.execute('''
+                DELETE FROM results WHERE search_id IN (
+                    SELECT search_id FROM results ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_rows,)).rowcount
+        with self._lock:
+            self.stats['evictions'] += removed
+        return removed
+
+    def _start_eviction(self):
+        """Démarre le thread d'éviction du processus (un thread ne survit pas au fork des workers)."""
+        if self._eviction_pid == os.getpid():
+            return
+        with self._lock:
+            if self._eviction_pid == os.getpid():
+                return
+            self._eviction_pid = os.getpid()
+        threading.Thread(target=self._eviction_loop, name='result-store-eviction', daemon=True).start()
+
+    def _eviction_loop(self):
+        while True:
+            try:
+                self.evict()
+            except sqlite3.Error as e:
+                print(f"Attention : échec de l'éviction des résultats de recherche ({e})")
+            time.sleep(self.eviction_interval)
+
+_store = None
+
+def get_result_store():
+    """Retourne le stockage des résultats de recherche du processus."""
+    global _store
+    if _store is None:
+        _store = ResultStore()
+    return _store
@@ -1,14 +1,24 @@
+import hashlib
 import os
 import pickle
 import numpy as np
 # --- Local imports ---
-from src.config import FEATURES_PATH, MODELS_TO_INDEX
+from src.config import (FEATURES_PATH, MODELS_TO_INDEX, EMBEDDING_CACHE_ENABLED, SEARCH_EXACT, IVF_NPROBE,
+                        QUANTIZED_MODELS, REDUCTION_DIMS, INFERENCE_BATCHING)
+from src.batching import InferenceScheduler
+from src.embedding_cache import EmbeddingCache, get_embedding_cache
+from src.engine import CandidateRanking, FeatureIndex, NeighbourRanking, Ranking, SUPPORTED_METRICS
+from src.feature_store import feature_store_exists, load_bhattacharyya_roots, load_feature_store
+from src.ivf import IVFIndex
+from src.knn_graph import KnnGraph
+from src.manifest import file_hash
+from src.models import get_model, get_model_stats
+from src.preprocessing import load_tensor, normalize_batch
+from src.quantization import load_quantized_store
+from src.reduction import REDUCED_METRICS, load_reduced_store
+from src.telemetry import get_metrics_registry, span
 # --- PyTorch specific imports ---
 import torch
-import torchvision.models as models
-import torchvision.transforms as transforms
-from torchvision.models import vit_b_16, ViT_B_16_Weights
-from PIL import Image
 
 # 1. FONCTIONS DE SIMILARITÉ
 # ==============================================================================
@@ -63,103 +73,330 @@ def cosine_distance(feature1, feature2):
 
 # 2. CHARGEMENT DES DONNÉES
 # ==============================================================================
+# Projections ACP à appliquer aux requêtes, pour les modèles dont les descripteurs
+# réduits ont été chargés par load_features
+_projections = {}
+
 def load_features():
-    """Charge tous les fichiers de caractéristiques .pkl du dossier."""
+    """
+    Charge les descripteurs de chaque modèle.
+    Le store mmap (.npy + table des chemins) est utilisé s'il existe ; sinon on se
+    rabat sur l'ancien fichier .pkl, chargé entièrement en mémoire.
+    Pour les modèles de REDUCTION_DIMS, les descripteurs réduits par ACP sont utilisés
+    (et la projection est appliquée aux requêtes). Pour les modèles de QUANTIZED_MODELS,
+    les distances sont calculées sur le store quantifié s'il est à jour (le store
+    float32 ne sert qu'au re-classement).
+    """
     features_data = {}
+    _projections.clear()
     for model_name in MODELS_TO_INDEX.keys():
         path = os.path.join(FEATURES_PATH, f"{model_name}.pkl")
-        if os.path.exists(path):
+        if feature_store_exists(model_name):
+            features_data[model_name] = load_feature_store(model_name)
+            print(f"Descripteurs pour '{model_name}' chargés (mmap).")
+            if not load_bhattacharyya_roots(model_name, features_data[model_name]):
+                print(f"Racines de Bhattacharyya non pré-calculées pour '{model_name}' : calcul par blocs.")
+            if REDUCTION_DIMS.get(model_name):
+                reduced, projection = load_reduced_store(model_name, features_data[model_name])
+                if reduced is not None:
+                    features_data[model_name] = reduced
+                    _projections[model_name] = projection
+                    print(f"Descripteurs réduits par ACP ({projection.dim} dimensions) utilisés pour '{model_name}'.")
+                else:
+                    print(f"Attention : projection ACP absente ou obsolète pour '{model_name}' : lancez 'python run_indexing.py --reduce'.")
+            mode = QUANTIZED_MODELS.get(model_name)
+            quantized = load_quantized_store(model_name, mode, features_data[model_name]) if mode else None
+            if quantized is not None:
+                features_data[model_name] = quantized
+                print(f"Descripteurs quantifiés ({mode}) utilisés pour '{model_name}'.")
+            elif mode:
+                print(f"Attention : store quantifié ({mode}) absent ou obsolète pour '{model_name}'.")
+        elif os.path.exists(path):
             with open(path, 'rb') as f:
-                features_data[model_name] = pickle.load(f)
-            print(f"Descripteurs pour '{model_name}' chargés.")
+                features_data[model_name] = FeatureIndex.from_pairs(pickle.load(f))
+            print(f"Descripteurs pour '{model_name}' chargés depuis l'ancien format .pkl.")
         else:
-            print(f"Attention : Fichier de descripteurs introuvable pour '{model_name}' à l'emplacement {path}")
+            print(f"Attention : Fichier de descripteurs introuvable pour '{model_name}' à l'emplacement {FEATURES_PATH}")
     return features_data
 
+def supported_metrics(model_name):
+    """
+    Métriques utilisables pour un modèle : le chi-carré et Bhattacharyya ne
+    s'appliquent pas aux descripteurs réduits par ACP (composantes signées).
+    """
+    return REDUCED_METRICS if model_name in _projections else SUPPORTED_METRICS
+
+# Graphes des plus proches voisins déjà chargés, par (modèle, métrique)
+_knn_graphs = {}
+
+def get_knn_graph(model_name, distance_metric, dataset_features):
+    """
+    Retourne le graphe des plus proches voisins pré-calculé pour un modèle et une
+    métrique, ou None s'il est absent ou ne correspond plus aux descripteurs chargés
+    (table des chemins ou dimension : store réduit par ACP ou non).
+    """
+    key = (model_name, distance_metric)
+    space = (dataset_features.fingerprint, dataset_features.dim)
+    if key not in _knn_graphs or _knn_graphs[key][0] != space:
+        _knn_graphs[key] = (space, KnnGraph.load(model_name, distance_metric, dataset_features.paths,
+                                                 dataset_features.dim))
+    return _knn_graphs[key][1]
+
+# Index IVF déjà chargés, par (modèle, métrique)
+_ivf_indexes = {}
+
+def get_ivf_index(model_name, distance_metric, dataset_features):
+    """
+    Retourne l'index IVF d'un modèle et d'une métrique, ou None s'il est absent
+    ou ne correspond plus aux descripteurs chargés (table des chemins ou dimension).
+    """
+    key = (model_name, distance_metric)
+    space = (dataset_features.fingerprint, dataset_features.dim)
+    if key not in _ivf_indexes or _ivf_indexes[key][0] != space:
+        _ivf_indexes[key] = (space, IVFIndex.load(model_name, distance_metric, *space))
+    return _ivf_indexes[key][1]
+
 # 3. EXTRACTION DE CARACTÉRISTIQUES POUR UNE IMAGE REQUÊTE
 # ==============================================================================
 def extract_query_features(image_path, model_name):
     """
-    Extrait les caractéristiques d'une seule image requête avec un modèle PyTorch.
-    """
-    # 1. Charger le bon modèle
-    if model_name == 'vgg16':
-        model = models.vgg16(weights=models.VGG16_Weights.DEFAULT)
-        model.classifier = torch.nn.Sequential(*list(model.classifier.children())[:-1])
-    elif model_name == 'resnet50':
-        model = models.resnet50(weights=models.ResNet50_Weights.DEFAULT)
-        model.fc = torch.nn.Identity()
-    elif model_name == 'vit_b_16':
-        model = models.vit_b_16(weights=models.ViT_B_16_Weights.DEFAULT)
-        model.heads.head = torch.nn.Identity()
-    else:
-        raise ValueError("Modèle non supporté.")
+    Extrait les caractéristiques d'une seule image requête (chemin ou octets) avec un
+    modèle PyTorch. Les descripteurs sont mis en cache selon le contenu de l'image : une image déjà
+    soumise (même sous un autre nom) ne repasse pas par le modèle.
+    Si les descripteurs de la base sont réduits par ACP, la même projection est
+    appliquée (le cache conserve les descripteurs bruts).
+    """
+    cache_key = None
+    feature = None
+    if EMBEDDING_CACHE_ENABLED:
+        with span('hash'):
+            digest = hashlib.sha256(image_path).hexdigest() if isinstance(image_path, (bytes, bytearray)) \
+                else file_hash(image_path)
+            cache_key = EmbeddingCache.make_key(digest, model_name)
+        with span('cache'):
+            feature = get_embedding_cache().get(cache_key)
+
+    if feature is None:
+        feature = compute_query_features(image_path, model_name)
+        if cache_key is not None:
+            with span('cache'):
+                get_embedding_cache().put(cache_key, feature)
+
+    projection = _projections.get(model_name)
+    if projection is not None:
+        with span('projection'):
+            feature = projection.transform(feature)
+    return feature
+
+def compute_query_features(image_path, model_name):
+    """
+    Calcule les caractéristiques d'une image requête avec un modèle PyTorch, sans cache.
+    """
+    return compute_query_features_batch([image_path], model_name)[0]
+
+def compute_query_features_batch(images, model_name):
+    """
+    Calcule les caractéristiques de plusieurs images requêtes (chemins ou octets),
+    sans cache. Les images sont décodées et pré-traitées (tenseurs uint8, même
+    pré-traitement qu'à l'indexation) dans le thread appelant ; si le regroupement est
+    activé (voir set_inference_batching), le passage du modèle est confié à
+    l'ordonnanceur, qui les regroupe avec celles des autres requêtes en cours.
+
+    Returns:
+        np.ndarray: Matrice float32 (une ligne par image)
+    """
+    with span('decode'):
+        tensors = [load_tensor(image) for image in images]
+    # Attente du batch et passage du modèle
+    with span('inference'):
+        if _inference_batching:
+            scheduler = get_inference_scheduler()
+            futures = [scheduler.submit(model_name, tensor) for tensor in tensors]
+            return np.stack([future.result() for future in futures])
+        return run_query_model(model_name, tensors)
+
+def run_query_model(model_name, tensors):
+    """
+    Un seul passage du modèle sur un batch d'images pré-traitées (tenseurs uint8
+    3x224x224), normalisé en float32 en une seule fois.
+    """
+    # Récupérer le modèle depuis le registre (construit une seule fois par processus)
+    model = get_model(model_name)
 
-    # 2. Appliquer les transformations
-    transform = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ])
+    with span('forward'), torch.inference_mode():
+        batch = normalize_batch(torch.stack(tensors).to(model.device))
+        return model(batch).cpu().numpy()
 
-    device = torch.device("mps" if torch.backends.mps.is_available() else "cpu")
-    model.to(device)
-    model.eval()
+_scheduler = None
+# Regroupement des passages du modèle (INFERENCE_BATCHING, activé par le service d'inférence)
+_inference_batching = INFERENCE_BATCHING
 
-    # 3. Extraire et retourner les features
-    with torch.no_grad():
-        image = Image.open(image_path).convert('RGB')
-        image = transform(image).unsqueeze(0).to(device)
-        feature = model(image)
-        return feature.cpu().numpy().flatten()
+def set_inference_batching(enabled):
+    """Active ou désactive le regroupement des images requêtes du processus en batchs."""
+    global _inference_batching
+    _inference_batching = enabled
+
+def get_inference_scheduler():
+    """Retourne l'ordonnanceur des passages du modèle pour les images requêtes."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = InferenceScheduler(run_query_model)
+    return _scheduler
+
+def inference_metrics():
+    """Indicateurs de l'ordonnanceur et du registre des modèles exportés sur /metrics."""
+    samples = []
+    scheduler_metrics = _scheduler.metrics() if _scheduler is not None else {}
+    for model_name, stats in scheduler_metrics.items():
+        labels = {'model': model_name}
+        samples += [
+            ('image_search_inference_queue_depth', 'gauge', labels, stats['queue_depth'],
+             "Images en attente d'un passage du modèle"),
+            ('image_search_inference_submitted_total', 'counter', labels, stats['submitted'],
+             "Images soumises à l'ordonnanceur"),
+            ('image_search_inference_batches_total', 'counter', labels, stats['batches'],
+             "Passages du modèle effectués par l'ordonnanceur"),
+            ('image_search_inference_errors_total', 'counter', labels, stats['errors'],
+             "Passages du modèle en erreur"),
+        ]
+    for model_name, stats in get_model_stats().items():
+        samples.append(('image_search_model_loads_total', 'counter', {'model': model_name}, stats['loads'],
+                        "Chargements des modèles (y compris après une éviction)"))
+    return samples
+
+get_metrics_registry().register_collector(inference_metrics)
+
+def extract_query_features_batch(images_data, model_name):
+    """
+    Extrait les caractéristiques de plusieurs images requêtes données par leur
+    contenu (octets). Les images absentes du cache des descripteurs sont décodées
+    puis traitées par le modèle en un seul batch.
+
+    Returns:
+        np.ndarray: Matrice float32 (une ligne par image, dans l'ordre de `images_data`)
+    """
+    features = [None] * len(images_data)
+    cache_keys = [None] * len(images_data)
+    if EMBEDDING_CACHE_ENABLED:
+        with span('hash'):
+            cache_keys = [EmbeddingCache.make_key(hashlib.sha256(data).hexdigest(), model_name)
+                          for data in images_data]
+        with span('cache'):
+            features = [get_embedding_cache().get(cache_key) for cache_key in cache_keys]
+
+    missing = [i for i, feature in enumerate(features) if feature is None]
+    if missing:
+        images = [images_data[i] for i in missing]
+        for i, feature in zip(missing, compute_query_features_batch(images, model_name)):
+            features[i] = feature
+            if cache_keys[i] is not None:
+                with span('cache'):
+                    get_embedding_cache().put(cache_keys[i], feature)
+
+    features = np.stack(features)
+    projection = _projections.get(model_name)
+    if projection is not None:
+        with span('projection'):
+            features = projection.transform(features)
+    return features
 
 
 # 4. FONCTION DE RECHERCHE PRINCIPALE
 # ==============================================================================
-def search(query_path, model_name, all_features, distance_metric='euclidean', top_n=10):
+def search(query_path, model_name, all_features, distance_metric='euclidean', top_n=10, exact=None, nprobe=None):
     """
     Recherche les images les plus similaires à l'image requête.
     
     Args:
-        query_path (str): Chemin vers l'image requête
+        query_path (str ou bytes): Chemin vers l'image requête, ou son contenu
         model_name (str): Nom du modèle à utiliser
         all_features (dict): Dictionnaire contenant les caractéristiques extraites
         distance_metric (str): Métrique de distance à utiliser ('euclidean', 'chi_square', etc.)
         top_n (int): Nombre de résultats à retourner
+        exact (bool): Recherche exhaustive (True) ou approximative avec l'index IVF
+            (False). Par défaut : SEARCH_EXACT
+        nprobe (int): Nombre de listes IVF sondées en recherche approximative
         
     Returns:
-        list: Liste des chemins des images les plus similaires avec leur score
+        Ranking: Classement se comportant comme la liste des `top_n` meilleurs
+        résultats (chemin, score), et permettant d'obtenir d'autres vues
+        (`top(n)`, pages, classement complet) sans nouvelle recherche
     """
-    # Extraire les caractéristiques de l'image requête
-    query_features = extract_query_features(query_path, model_name)
-    
-    # Sélectionner la fonction de distance appropriée
-    if distance_metric == 'euclidean':
-        distance_fn = euclidean_distance
-    elif distance_metric == 'chi_square':
-        distance_fn = chi_square_distance
-    elif distance_metric == 'correlation':
-        distance_fn = correlation_distance
-    elif distance_metric == 'bhattacharyya':
-        distance_fn = bhattacharyya_distance
-    elif distance_metric == 'cosine':
-        distance_fn = cosine_distance
-    else:
+    # Vérifier la métrique de distance demandée
+    if distance_metric not in SUPPORTED_METRICS:
         print(f"Métrique de distance '{distance_metric}' non reconnue. Utilisation de la distance euclidienne par défaut.")
-        distance_fn = euclidean_distance
+        distance_metric = 'euclidean'
+    if distance_metric not in supported_metrics(model_name):
+        raise ValueError(f"La métrique '{distance_metric}' ne s'applique pas aux descripteurs réduits par ACP de '{model_name}'.")
 
     # Récupérer les caractéristiques de la base de données pour le modèle choisi
     dataset_features = all_features.get(model_name)
     if not dataset_features:
         raise ValueError(f"Aucun descripteur chargé pour le modèle '{model_name}'.")
+    if not isinstance(dataset_features, FeatureIndex):
+        # Ancien format : liste de tuples (chemin, vecteur)
+        dataset_features = FeatureIndex.from_pairs(dataset_features)
+
+    row = dataset_features.row_of(query_path) if isinstance(query_path, str) else None
+    if row is not None:
+        # Image de la base : son descripteur est déjà indexé, pas besoin du modèle
+        query_features = dataset_features.matrix[row]
+        graph = get_knn_graph(model_name, distance_metric, dataset_features)
+        if graph is not None:
+            # Les meilleurs résultats sont lus directement dans le graphe des voisins
+            return NeighbourRanking(dataset_features, graph.neighbours[row], graph.distances[row],
+                                    query_features, distance_metric, size=top_n)
+    else:
+        # Extraire les caractéristiques de l'image requête
+        query_features = extract_query_features(query_path, model_name)
+
+    if exact is None:
+        exact = SEARCH_EXACT
+    if not exact:
+        ivf = get_ivf_index(model_name, distance_metric, dataset_features)
+        if ivf is not None:
+            # Seules les images des listes les plus proches sont comparées à la requête
+            with span('scoring'):
+                rows, distances = ivf.search(dataset_features, query_features, nprobe or IVF_NPROBE)
+            return CandidateRanking(dataset_features, rows, distances, query_features, size=top_n)
+        print(f"Aucun index IVF à jour pour '{model_name}' ({distance_metric}) : recherche exhaustive.")
 
-    # Calculer les distances
-    results = []
-    for img_path, feature_vector in dataset_features:
-        dist = distance_fn(query_features, feature_vector)
-        results.append((img_path, dist))
+    # Calculer toutes les distances en une seule opération matricielle
+    with span('scoring'):
+        distances = dataset_features.scores(query_features, distance_metric)
+
+    # Le tri n'est effectué qu'à la demande, pour le nombre de résultats demandé
+    return Ranking(dataset_features, distances, query_features, size=top_n)
+
+def search_batch(images_data, model_name, all_features, distance_metric='euclidean', top_n=10):
+    """
+    Recherche les images les plus similaires à plusieurs images requêtes à la fois :
+    une seule inférence par batch, puis un seul produit matrice-matrice pour comparer
+    toutes les requêtes à la base.
+
+    Args:
+        images_data (list): Contenu (octets) de chaque image requête
+        model_name (str): Nom du modèle à utiliser
+        all_features (dict): Dictionnaire contenant les caractéristiques extraites
+        distance_metric (str): Métrique de distance à utiliser
+        top_n (int): Nombre de résultats par requête
+
+    Returns:
+        list: Un Ranking par image requête, dans l'ordre de `images_data`
+    """
+    if distance_metric not in SUPPORTED_METRICS:
+        raise ValueError(f"Métrique de distance '{distance_metric}' non reconnue.")
+    if distance_metric not in supported_metrics(model_name):
+        raise ValueError(f"La métrique '{distance_metric}' ne s'applique pas aux descripteurs réduits par ACP de '{model_name}'.")
+
+    dataset_features = all_features.get(model_name)
+    if not dataset_features:
+        raise ValueError(f"Aucun descripteur chargé pour le modèle '{model_name}'.")
+    if not isinstance(dataset_features, FeatureIndex):
+        dataset_features = FeatureIndex.from_pairs(dataset_features)
 
-    # Trier par distance et retourner le top N
-    results.sort(key=lambda x: x[1])
-    return results[:top_n]
+    queries = extract_query_features_batch(images_data, model_name)
+    with span('scoring'):
+        distances = dataset_features.scores(queries, distance_metric)
+    return [Ranking(dataset_features, query_distances, query_features, size=top_n)
+            for query_features, query_distances in zip(queries, distances)]
@@ -0,0 +1,273 @@
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import numpy as np
+# --- Local imports ---
+from src.config import SIDECAR_SOCKET, SIDECAR_TIMEOUT, SIDECAR_RETRY_INTERVAL
+from src.telemetry import get_metrics_registry
+
+# Protocole binaire entre les workers web et le service, sur une socket Unix.
+# Chaque message est précédé de sa longueur (uint32, big-endian).
+#   Requête : [uint8 opération][données]
+#   Réponse : [uint8 statut][données] ; statuts 1 (erreur) et 2 (store différent) :
+#   message en UTF-8
+# Opérations :
+#   PING          : -                                         -> [uint32 pid]
+#   SEARCH        : modèle, métrique, empreinte, [uint32 n], [uint32 profondeur],
+#                   [int32 ligne], [uint32 taille][octets de l'image]
+#                                                              -> classement
+#   SEARCH_IMAGES : modèle, métrique, empreinte, [uint32 n], [uint16 k],
+#                   k x ([uint32 taille][octets de l'image])   -> [uint16 k], k x classement
+# Une requête SEARCH désigne une image de la base par sa ligne dans le store (ligne >= 0,
+# sans octets), et toute autre image par son contenu : le service n'a pas besoin de
+# partager le dossier de travail des workers.
+# L'empreinte est celle de la table des chemins du store du worker : les identifiants
+# retournés sont des lignes de ce store, le service refuse donc (statut 2) les requêtes
+# d'un worker qui n'a pas chargé le même store que lui.
+# Classement : [uint32 n][n x int32 identifiants][n x float32 distances]
+# Chaînes : [uint8 ou uint16 longueur][UTF-8]
+OP_PING, OP_SEARCH, OP_SEARCH_IMAGES = 0, 1, 2
+STATUS_OK, STATUS_ERROR, STATUS_STALE = 0, 1, 2
+
+class SidecarUnavailable(Exception):
+    """Le service n'est pas lancé (socket absente ou connexion refusée)."""
+
+class SidecarStale(SidecarUnavailable):
+    """Le service n'a pas chargé le même store que le worker (réindexation sans redémarrage)."""
+
+class SidecarBusy(Exception):
+    """
+    Le service est lancé mais n'a pas répondu (délai dépassé, connexion interrompue) :
+    l'appelant ne doit pas se rabattre sur le calcul dans son processus, ce qui y
+    chargerait les modèles au moment où le service est surchargé.
+    """
+
+class SidecarError(Exception):
+    """Le service a traité la requête mais a retourné une erreur."""
+
+# 1. ENCODAGE
+# ==============================================================================
+def _pack_str(text, length_format='B'):
+    data = text.encode('utf-8')
+    return struct.pack(f'>{length_format}', len(data)) + data
+
+def _unpack_str(payload, offset, length_format='B'):
+    (length,) = struct.unpack_from(f'>{length_format}', payload, offset)
+    offset += struct.calcsize(length_format)
+    return payload[offset:offset + length].decode('utf-8'), offset + length
+
+def _pack_ranking(ids, scores):
+    ids = np.ascontiguousarray(ids, dtype='>i4')
+    scores = np.ascontiguousarray(scores, dtype='>f4')
+    return struct.pack('>I', len(ids)) + ids.tobytes() + scores.tobytes()
+
+def _unpack_ranking(payload, offset):
+    (n,) = struct.unpack_from('>I', payload, offset)
+    offset += 4
+    ids = np.frombuffer(payload, dtype='>i4', count=n, offset=offset).astype(np.int32)
+    offset += 4 * n
+    scores = np.frombuffer(payload, dtype='>f4', count=n, offset=offset).astype(np.float32)
+    return (ids, scores), offset + 4 * n
+
+def _recv_exactly(sock, size):
+    chunks = bytearray()
+    while len(chunks) < size:
+        chunk = sock.recv(size - len(chunks))
+        if not chunk:
+            raise ConnectionError("Connexion fermée par le pair.")
+        chunks += chunk
+    return bytes(chunks)
+
+def send_message(sock, payload):
+    sock.sendall(struct.pack('>I', len(payload)) + payload)
+
+def recv_message(sock):
+    (size,) = struct.unpack('>I', _recv_exactly(sock, 4))
+    return _recv_exactly(sock, size)
+
+# 2. SERVICE
+# ==============================================================================
+class SidecarHandler(socketserver.BaseRequestHandler):
+    """Traite les requêtes d'une connexion (un worker web garde sa connexion ouverte)."""
+
+    def handle(self):
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, OSError, struct.error):
+                return
+            try:
+                response = bytes([STATUS_OK]) + self.server.dispatch(request)
+            except SidecarStale as e:
+                response = bytes([STATUS_STALE]) + str(e).encode('utf-8')
+            except Exception as e:
+                response = bytes([STATUS_ERROR]) + str(e).encode('utf-8')
+            send_message(self.request, response)
+            # Les durées des étapes mesurées ici sont exposées par le /metrics des workers web
+            get_metrics_registry().flush()
+
+class SidecarServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Service qui possède les modèles et les descripteurs : les workers web lui
+    délèguent l'inférence et le calcul des distances. Les requêtes concurrentes
+    sont traitées par des threads, et leurs images regroupées en batchs par
+    l'ordonnanceur d'inférence.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, all_features):
+        self.all_features = all_features
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, SidecarHandler)
+        os.chmod(socket_path, 0o660)
+
+    def dispatch(self, request):
+        # Import local : le module reste utilisable côté client sans PyTorch
+        from src.retrieval import search, search_batch
+
+        op, payload = request[0], request[1:]
+        if op == OP_PING:
+            return struct.pack('>I', os.getpid())
+
+        model_name, offset = _unpack_str(payload, 0)
+        metric, offset = _unpack_str(payload, offset)
+        fingerprint, offset = _unpack_str(payload, offset)
+        dataset_features = self.all_features.get(model_name)
+        if dataset_features is not None and dataset_features.fingerprint != fingerprint:
+            raise SidecarStale(f"Le service n'a pas chargé le même store que le worker pour '{model_name}' "
+                               "(redémarrez-le après une réindexation).")
+        (top_n,) = struct.unpack_from('>I', payload, offset)
+        offset += 4
+        if op == OP_SEARCH:
+            max_depth, row, size = struct.unpack_from('>IiI', payload, offset)
+            offset += 12
+            # Image de la base : son chemin dans le store (graphe des voisins, pas de modèle)
+            query = dataset_features.paths[row] if row >= 0 and dataset_features is not None \
+                else payload[offset:offset + size]
+            ranking = search(query, model_name, self.all_features, distance_metric=metric, top_n=top_n)
+            return _pack_ranking(*ranking.top_ids(max(top_n, max_depth)))
+        if op == OP_SEARCH_IMAGES:
+            (count,) = struct.unpack_from('>H', payload, offset)
+            offset += 2
+            images_data = []
+            for _ in range(count):
+                (size,) = struct.unpack_from('>I', payload, offset)
+                offset += 4
+                images_data.append(payload[offset:offset + size])
+                offset += size
+            rankings = search_batch(images_data, model_name, self.all_features, distance_metric=metric, top_n=top_n)
+            return struct.pack('>H', len(rankings)) + b''.join(
+                _pack_ranking(*ranking.top_ids(top_n)) for ranking in rankings)
+        raise ValueError(f"Opération inconnue : {op}")
+
+# 3. CLIENT
+# ==============================================================================
+class SidecarClient:
+    """
+    Client du service, utilisé par les workers web. Chaque thread garde sa propre
+    connexion ouverte. Si le service n'est pas lancé, il est considéré comme absent
+    pendant `retry_interval` secondes (SidecarUnavailable : l'appelant se rabat sur
+    le calcul dans le processus) ; s'il ne répond pas, SidecarBusy est levée.
+    """
+
+    def __init__(self, socket_path=SIDECAR_SOCKET, timeout=SIDECAR_TIMEOUT, retry_interval=SIDECAR_RETRY_INTERVAL):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._local = threading.local()
+        self._unavailable_until = 0.0
+
+    def _connection(self):
+        """Retourne (connexion du thread, True si elle vient d'être ouverte)."""
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None and self._local.pid == os.getpid():
+            return sock, False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            sock.close()
+            self._unavailable_until = time.monotonic() + self.retry_interval
+            raise SidecarUnavailable(f"Service d'inférence non lancé ({e}).")
+        except OSError as e:
+            sock.close()
+            raise SidecarBusy(f"Connexion au service d'inférence impossible ({e}).")
+        self._local.sock, self._local.pid = sock, os.getpid()
+        return sock, True
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def _call(self, request):
+        if time.monotonic() < self._unavailable_until:
+            raise SidecarUnavailable("Service d'inférence indisponible.")
+        while True:
+            sock, fresh = self._connection()
+            try:
+                send_message(sock, request)
+                response = recv_message(sock)
+                break
+            except socket.timeout:
+                self._close()
+                raise SidecarBusy(f"Pas de réponse du service d'inférence en {self.timeout}s.")
+            except (OSError, struct.error) as e:
+                self._close()
+                # Connexion gardée ouverte mais fermée par le service (redémarrage) : on
+                # réessaie une fois avec une nouvelle connexion
+                if fresh or not isinstance(e, ConnectionError):
+                    raise SidecarBusy(f"Connexion au service d'inférence interrompue ({e}).")
+        if response[0] == STATUS_STALE:
+            raise SidecarStale(response[1:].decode('utf-8', errors='replace'))
+        if response[0] != STATUS_OK:
+            raise SidecarError(response[1:].decode('utf-8', errors='replace'))
+        return response[1:]
+
+    def ping(self):
+        """Retourne le pid du service."""
+        return struct.unpack('>I', self._call(bytes([OP_PING])))[0]
+
+    def search(self, query, model_name, distance_metric, top_n, max_depth=None, fingerprint=''):
+        """
+        Classement (identifiants, distances) des max(`top_n`, `max_depth`) meilleurs
+        résultats pour une image requête.
+
+        Args:
+            query (int ou bytes): Ligne d'une image de la base dans le store, ou
+                contenu de l'image requête
+            fingerprint (str): Empreinte du store du worker (FeatureIndex.fingerprint)
+        """
+        row, data = (query, b'') if isinstance(query, int) else (-1, query)
+        request = (bytes([OP_SEARCH]) + _pack_str(model_name) + _pack_str(distance_metric) + _pack_str(fingerprint)
+                   + struct.pack('>IIiI', top_n, max_depth or top_n, row, len(data)) + data)
+        return _unpack_ranking(self._call(request), 0)[0]
+
+    def search_images(self, images_data, model_name, distance_metric, top_n, fingerprint=''):
+        """Un classement (identifiants, distances) par image requête (octets)."""
+        request = bytearray(bytes([OP_SEARCH_IMAGES]) + _pack_str(model_name) + _pack_str(distance_metric)
+                            + _pack_str(fingerprint) + struct.pack('>IH', top_n, len(images_data)))
+        for data in images_data:
+            request += struct.pack('>I', len(data)) + data
+        response = self._call(bytes(request))
+        (count,) = struct.unpack_from('>H', response, 0)
+        offset, rankings = 2, []
+        for _ in range(count):
+            ranking, offset = _unpack_ranking(response, offset)
+            rankings.append(ranking)
+        return rankings
+
+_client = None
+
+def get_sidecar_client():
+    """Retourne le client du service du processus, ou None si aucun service n'est configuré."""
+    global _client
+    if _client is None and SIDECAR_SOCKET:
+        _client = SidecarClient()
+    return _client
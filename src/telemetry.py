@@ -0,0 +1,384 @@
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+# --- Local imports ---
+from src.config import (METRICS_ENABLED, METRICS_PATH, METRICS_FLUSH_INTERVAL, METRICS_BUCKETS,
+                        PROFILE_SLOW_REQUESTS_MS, PROFILER_INTERVAL_MS, PROFILES_PATH)
+
+# Noms des métriques exposées
+STAGE_METRIC = 'image_search_stage_duration_seconds'
+REQUEST_METRIC = 'image_search_request_duration_seconds'
+HELP = {
+    STAGE_METRIC: "Durée de chaque étape du traitement d'une recherche",
+    REQUEST_METRIC: "Durée des requêtes HTTP par route",
+}
+
+# 1. COMPTEURS PAR PROCESSUS
+# ==============================================================================
+class MetricsRegistry:
+    """
+    Histogrammes de durée et compteurs d'un processus. Chaque processus écrit
+    régulièrement son état dans `{path}/{pid}.json` (après sa première écriture, un
+    thread le rafraîchit même sans requête) ; /metrics additionne les fichiers de
+    tous les processus (workers gunicorn, service d'inférence).
+    Les histogrammes et compteurs des processus terminés sont cumulés dans
+    `{path}/retired.json`, et leurs fichiers supprimés : comme pour des compteurs
+    Prometheus, les totaux ne diminuent pas quand un worker est remplacé, mais leurs
+    jauges (valeurs instantanées) ne sont plus comptées. Un processus est reconnu
+    par son pid et sa date de démarrage : un pid réutilisé par un autre processus
+    ne garde pas en vie l'état d'un worker terminé.
+    """
+
+    RETIRED_FILE = 'retired.json'
+
+    def __init__(self, path=METRICS_PATH, buckets=METRICS_BUCKETS, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.path = path
+        self.buckets = tuple(buckets)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._histograms = {}
+        self._collectors = []
+        self._last_flush = 0.0
+        self._refresher_pid = None
+        self._start_time = None
+        self._flushed_pid = None
+
+    def _check_pid(self):
+        # Après un fork (gunicorn --preload), le worker repart de compteurs vides
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._start_time = _process_start_time(self._pid)
+            self._histograms = {}
+            self._last_flush = 0.0
+
+    def observe(self, name, labels, value):
+        """Ajoute une durée (en secondes) à l'histogramme `name` pour ces étiquettes."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_pid()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            histogram['buckets'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def register_collector(self, collector):
+        """
+        Ajoute une source d'indicateurs lue à chaque écriture : collector() retourne
+        une liste de (nom, type Prometheus, étiquettes, valeur, description).
+        """
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        with self._lock:
+            self._check_pid()
+            histograms = [{'name': name, 'labels': dict(labels), **{k: (list(v) if k == 'buckets' else v)
+                                                                    for k, v in histogram.items()}}
+                          for (name, labels), histogram in self._histograms.items()]
+        samples = []
+        for collector in self._collectors:
+            try:
+                samples.extend({'name': name, 'type': kind, 'labels': labels, 'value': value, 'help': description}
+                               for name, kind, labels, value, description in collector())
+            except Exception as e:
+                print(f"Attention : indicateurs indisponibles ({e}).")
+        return {'pid': os.getpid(), 'start_time': self._start_time, 'buckets': list(self.buckets),
+                'histograms': histograms, 'samples': samples}
+
+    def flush(self, force=False):
+        """Écrit l'état du processus, au plus une fois par `flush_interval` secondes (sauf `force`)."""
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        snapshot = self.snapshot()
+        os.makedirs(self.path, exist_ok=True)
+        if self._flushed_pid != snapshot['pid']:
+            # Première écriture du processus : le fichier d'un processus terminé qui avait
+            # le même pid est cumulé avant d'être remplacé
+            self._flushed_pid = snapshot['pid']
+            with self._locked():
+                self._retire_dead_processes()
+        path = os.path.join(self.path, f"{snapshot['pid']}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+        self._ensure_refresher()
+
+    def _ensure_refresher(self):
+        # Un thread par processus ayant déjà écrit son état (relancé après un fork) : les
+        # jauges restent à jour sans requête, et le maître gunicorn n'écrit rien
+        if self._refresher_pid != os.getpid():
+            self._refresher_pid = os.getpid()
+            threading.Thread(target=self._refresh, name='metrics-refresher', daemon=True).start()
+
+    def _refresh(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush(force=True)
+            except OSError as e:
+                print(f"Attention : écriture des indicateurs impossible ({e}).")
+
+    def _read(self, filename):
+        try:
+            with open(os.path.join(self.path, filename)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None  # Fichier absent ou en cours de remplacement
+        return snapshot if tuple(snapshot['buckets']) == self.buckets else None
+
+    def _retire_dead_processes(self):
+        """
+        Cumule les histogrammes et compteurs des processus terminés dans RETIRED_FILE
+        et supprime leurs fichiers (leurs jauges sont abandonnées).
+        """
+        dead = {}
+        for filename in os.listdir(self.path):
+            if filename.endswith('.json') and filename[:-5].isdigit():
+                snapshot = self._read(filename)
+                start_time = snapshot.get('start_time') if snapshot is not None else None
+                if not _process_alive(int(filename[:-5]), start_time):
+                    dead[filename] = snapshot
+        if not dead:
+            return
+        retired = self._read(self.RETIRED_FILE) or {'pid': None, 'buckets': list(self.buckets),
+                                                    'histograms': [], 'samples': []}
+        histograms, samples = _merge([retired])
+        for snapshot in dead.values():
+            if snapshot is not None:
+                snapshot['samples'] = [sample for sample in snapshot['samples'] if sample['type'] != 'gauge']
+                histograms, samples = _merge([snapshot], histograms, samples)
+        retired['histograms'] = [{'name': name, 'labels': dict(labels), **histogram}
+                                 for (name, labels), histogram in histograms.items()]
+        retired['samples'] = list(samples.values())
+        path = os.path.join(self.path, self.RETIRED_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(retired, f)
+        os.replace(path + '.tmp', path)
+        for filename in dead:
+            os.remove(os.path.join(self.path, filename))
+
+    def collect(self):
+        """Additionne les états écrits par tous les processus (et ceux des processus terminés)."""
+        self.flush(force=True)
+        with self._locked():
+            self._retire_dead_processes()
+            snapshots = [self._read(filename) for filename in os.listdir(self.path) if filename.endswith('.json')]
+        return _merge([snapshot for snapshot in snapshots if snapshot is not None])
+
+    @contextmanager
+    def _locked(self):
+        # Verrou entre les processus qui retirent des fichiers : un fichier retiré
+        # n'est jamais compté deux fois
+        with open(os.path.join(self.path, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def render(self):
+        """Indicateurs agrégés au format texte de Prometheus."""
+        histograms, samples = self.collect()
+        lines = []
+        declared = set()
+
+        def declare(name, kind, description):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), histogram in sorted(histograms.items()):
+            declare(name, 'histogram', HELP.get(name, name))
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ['+Inf'], histogram['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+        for (name, labels), sample in sorted(samples.items()):
+            declare(name, sample['type'], sample['help'])
+            lines.append(f"{name}{_labels(labels)} {sample['value']}")
+        return '\n'.join(lines) + '\n'
+
+def _process_start_time(pid):
+    """Date de démarrage d'un processus (champ 22 de /proc/<pid>/stat), ou None hors Linux."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Le nom du processus (champ 2, entre parenthèses) peut contenir des espaces
+    return int(stat[stat.rindex(')') + 2:].split()[19])
+
+def _process_alive(pid, start_time=None):
+    """Le processus `pid` existe et, si `start_time` est connue, a démarré à cette date."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Processus d'un autre utilisateur
+    return start_time is None or _process_start_time(pid) in (None, start_time)
+
+def _merge(snapshots, histograms=None, samples=None):
+    """Additionne les histogrammes et indicateurs de plusieurs états, par nom et étiquettes."""
+    histograms = {} if histograms is None else histograms
+    samples = {} if samples is None else samples
+    for snapshot in snapshots:
+        for histogram in snapshot['histograms']:
+            key = (histogram['name'], tuple(sorted(histogram['labels'].items())))
+            total = histograms.setdefault(key, {'buckets': [0] * (len(snapshot['buckets']) + 1), 'sum': 0.0, 'count': 0})
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], histogram['buckets'])]
+            total['sum'] += histogram['sum']
+            total['count'] += histogram['count']
+        for sample in snapshot['samples']:
+            key = (sample['name'], tuple(sorted(sample['labels'].items())))
+            if key in samples:
+                samples[key]['value'] += sample['value']
+            else:
+                samples[key] = dict(sample)
+    return histograms, samples
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+# Registre partagé par tout le processus
+_registry = MetricsRegistry()
+
+def get_metrics_registry():
+    return _registry
+
+# 2. ÉTAPES ET REQUÊTES
+# ==============================================================================
+# Durées des étapes de la requête en cours, par thread (en-tête Server-Timing)
+_local = threading.local()
+
+@contextmanager
+def span(stage):
+    """
+    Mesure la durée d'une étape : elle est ajoutée à l'histogramme des étapes et
+    aux durées de la requête en cours du thread (s'il y en a une).
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start_time
+        _registry.observe(STAGE_METRIC, {'stage': stage}, duration)
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings.append((stage, duration))
+
+def start_request():
+    """Début d'une requête : les étapes suivantes du thread lui sont rattachées."""
+    _local.timings = []
+    _local.start_time = time.perf_counter()
+    if _profiler is not None:
+        _profiler.start()
+
+def end_request(endpoint, record=True):
+    """
+    Fin d'une requête : enregistre sa durée (si `record`), sauvegarde son profil
+    si elle a été lente, et écrit les compteurs du processus si l'intervalle est écoulé.
+
+    Returns:
+        tuple: (durées des étapes [(étape, secondes)], durée totale en secondes)
+    """
+    timings = getattr(_local, 'timings', None) or []
+    start_time = getattr(_local, 'start_time', None)
+    total = time.perf_counter() - start_time if start_time is not None else 0.0
+    _local.timings = _local.start_time = None
+    if _profiler is not None:
+        _profiler.stop(total * 1000, endpoint)
+    if METRICS_ENABLED and record:
+        _registry.observe(REQUEST_METRIC, {'endpoint': endpoint}, total)
+        _registry.flush()
+    return timings, total
+
+def server_timing_header(timings, total):
+    """En-tête Server-Timing : durée cumulée de chaque étape (dans l'ordre d'apparition) et totale, en ms."""
+    durations = {}
+    for stage, duration in timings:
+        durations[stage] = durations.get(stage, 0.0) + duration
+    entries = [f"{stage};dur={duration * 1000:.1f}" for stage, duration in durations.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(entries)
+
+# 3. PROFILAGE DES REQUÊTES LENTES
+# ==============================================================================
+class SamplingProfiler:
+    """
+    Profileur par échantillonnage : un thread relève toutes les `interval_ms` la
+    pile des threads qui traitent une requête. Si la requête dépasse
+    `threshold_ms`, ses piles sont sauvegardées au format « folded » (une ligne
+    par pile, de la racine à la feuille, suivie du nombre d'échantillons).
+    """
+
+    def __init__(self, threshold_ms, interval_ms=PROFILER_INTERVAL_MS, output_path=PROFILES_PATH):
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000.0
+        self.output_path = output_path
+        self._lock = threading.Lock()
+        self._active = {}
+        self._pid = None
+
+    def _ensure_thread(self):
+        # Un thread d'échantillonnage par processus (relancé après un fork)
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._active = {}
+            threading.Thread(target=self._run, name='sampling-profiler', daemon=True).start()
+
+    def start(self):
+        with self._lock:
+            self._ensure_thread()
+            self._active[threading.get_ident()] = Counter()
+
+    def stop(self, duration_ms, label):
+        """Arrête l'échantillonnage du thread courant ; retourne le fichier du profil s'il a été sauvegardé."""
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or duration_ms < self.threshold_ms:
+            return None
+        os.makedirs(self.output_path, exist_ok=True)
+        path = os.path.join(self.output_path, f"{datetime.now():%Y%m%d_%H%M%S}_{label}_{os.getpid()}.folded")
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Requête lente ({label}, {duration_ms:.0f} ms) : profil sauvegardé dans {path}")
+        return path
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[_fold(frame)] += 1
+
+def _fold(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+_profiler = SamplingProfiler(PROFILE_SLOW_REQUESTS_MS) if PROFILE_SLOW_REQUESTS_MS is not None else None
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+from PIL import Image
+# --- Local imports ---
+from src.config import THUMBNAIL_PATH, THUMBNAIL_SIZE, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY
+
+# Les vignettes sont nommées par l'empreinte SHA-256 du contenu de l'image (lue dans
+# le manifeste de l'indexation), la taille et le format : une URL de vignette ne
+# désigne jamais deux contenus différents et peut être mise en cache indéfiniment.
+# La table {chemin de l'image: fichier de la vignette} est dans index.json.
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+def get_thumbnail_index_path(thumbnail_path=THUMBNAIL_PATH):
+    return os.path.join(thumbnail_path, 'index.json')
+
+def thumbnail_name(content_hash, size=THUMBNAIL_SIZE, image_format=THUMBNAIL_FORMAT):
+    """Nom de la vignette d'un contenu (sous-dossier des deux premiers caractères de l'empreinte)."""
+    return f"{content_hash[:2]}/{content_hash}_{size}.{EXTENSIONS[image_format]}"
+
+def make_thumbnail(image_path, output_path, size=THUMBNAIL_SIZE, image_format=THUMBNAIL_FORMAT,
+                   quality=THUMBNAIL_QUALITY):
+    """
+    Génère la vignette d'une image (plus grand côté `size`). Les JPEG sont décodés
+    directement à échelle réduite par Image.thumbnail (mode draft de PIL).
+    """
+    with Image.open(image_path) as image:
+        image.thumbnail((size, size), Image.LANCZOS)
+        image = image.convert('RGB')
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path + '.tmp', 'wb') as f:
+            image.save(f, format=image_format.upper(), quality=quality)
+    os.replace(output_path + '.tmp', output_path)
+
+def build_thumbnails(manifest, thumbnail_path=THUMBNAIL_PATH, size=THUMBNAIL_SIZE, image_format=THUMBNAIL_FORMAT):
+    """
+    Génère les vignettes manquantes des images d'un manifeste d'indexation, écrit
+    la table des vignettes et supprime celles qui ne sont plus référencées.
+
+    Returns:
+        tuple: (nombre de vignettes créées, nombre de vignettes supprimées)
+    """
+    if image_format not in EXTENSIONS:
+        raise ValueError(f"Format de vignette non supporté : {image_format}")
+    names = {}
+    created = 0
+    for image_path, entry in manifest.items():
+        name = thumbnail_name(entry['sha256'], size, image_format)
+        output_path = os.path.join(thumbnail_path, name)
+        if not os.path.exists(output_path):
+            make_thumbnail(image_path, output_path, size, image_format)
+            created += 1
+        names[image_path] = name
+
+    index_path = get_thumbnail_index_path(thumbnail_path)
+    os.makedirs(thumbnail_path, exist_ok=True)
+    with open(index_path + '.tmp', 'w') as f:
+        json.dump({'version': 1, 'thumbnails': names}, f)
+    os.replace(index_path + '.tmp', index_path)
+
+    # Vignettes orphelines : images supprimées ou modifiées, autre taille ou format
+    referenced = {os.path.normpath(name) for name in names.values()}
+    removed = 0
+    for directory, _, files in os.walk(thumbnail_path, topdown=False):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            if path != index_path and os.path.relpath(path, thumbnail_path) not in referenced:
+                os.remove(path)
+                removed += 1
+        if directory != thumbnail_path and not os.listdir(directory):
+            os.rmdir(directory)
+    print(f"Vignettes : {created} créée(s), {removed} supprimée(s), {len(names)} au total.")
+    return created, removed
+
+class ThumbnailIndex:
+    """
+    Table {chemin d'une image de la base: fichier de sa vignette}, relue
+    automatiquement lorsque l'indexation la réécrit.
+    """
+
+    def __init__(self, thumbnail_path=THUMBNAIL_PATH):
+        self.path = get_thumbnail_index_path(thumbnail_path)
+        self._names = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            names = {}
+            if mtime is not None:
+                with open(self.path) as f:
+                    names = json.load(f)['thumbnails']
+            self._names, self._mtime = names, mtime
+
+    def name_of(self, image_path):
+        """Fichier de la vignette d'une image, ou None si elle n'en a pas."""
+        self._refresh()
+        return self._names.get(image_path)
+
+_thumbnail_index = None
+
+def get_thumbnail_index():
+    """Retourne la table des vignettes partagée par le processus."""
+    global _thumbnail_index
+    if _thumbnail_index is None:
+        _thumbnail_index = ThumbnailIndex()
+    return _thumbnail_index
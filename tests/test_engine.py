@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+# --- Local imports ---
+import src.engine as engine
+from src.engine import SUPPORTED_METRICS, FeatureIndex, compute_bhattacharyya_roots, top_k
+from src.retrieval import (bhattacharyya_distance, chi_square_distance, correlation_distance, cosine_distance,
+                           euclidean_distance)
+
+# Fonctions de distance scalaires d'origine (une paire de vecteurs à la fois) :
+# référence des distances vectorisées de FeatureIndex
+REFERENCE = {
+    'euclidean': euclidean_distance,
+    'chi_square': chi_square_distance,
+    'correlation': correlation_distance,
+    'bhattacharyya': bhattacharyya_distance,
+    'cosine': cosine_distance,
+}
+
+def make_index(n=40, dim=16, seed=0, signed=False):
+    """Petit index aléatoire (descripteurs positifs, comme après ReLU, sauf `signed`)."""
+    rng = np.random.default_rng(seed)
+    matrix = rng.random((n, dim), dtype=np.float32)
+    if signed:
+        matrix -= 0.5
+    return FeatureIndex([f"{i}.jpg" for i in range(n)], matrix)
+
+def reference_scores(index, query, metric):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.array([REFERENCE[metric](row, query) for row in index.matrix], dtype=np.float64)
+
+# 1. DISTANCES
+# ==============================================================================
+@pytest.mark.parametrize('metric', SUPPORTED_METRICS)
+def test_scores_match_reference(metric):
+    index = make_index()
+    query = make_index(n=1, seed=1).matrix[0]
+    np.testing.assert_allclose(index.scores(query, metric), reference_scores(index, query, metric),
+                               rtol=1e-4, atol=1e-5)
+
+@pytest.mark.parametrize('metric', SUPPORTED_METRICS)
+def test_batch_scores_match_single_queries(metric):
+    index = make_index()
+    queries = make_index(n=3, seed=2).matrix
+    batch = index.scores(queries, metric)
+    assert batch.shape == (3, len(index))
+    for query, scores in zip(queries, batch):
+        np.testing.assert_allclose(scores, index.scores(query, metric), rtol=1e-5, atol=1e-6)
+
+@pytest.mark.parametrize('metric', ['chi_square', 'bhattacharyya'])
+def test_chunked_scores_match_reference(monkeypatch, metric):
+    # Blocs plus petits que l'index (et un dernier bloc incomplet)
+    monkeypatch.setattr(engine, 'SCORING_CHUNK_ROWS', 7)
+    index = make_index(n=40)
+    queries = make_index(n=2, seed=3).matrix
+    for query, scores in zip(queries, index.scores(queries, metric)):
+        np.testing.assert_allclose(scores, reference_scores(index, query, metric), rtol=1e-4, atol=1e-5)
+
+def test_bhattacharyya_precomputed_roots_match_reference():
+    index = make_index()
+    roots = np.empty_like(index.matrix)
+    assert compute_bhattacharyya_roots(index.matrix, roots)
+    index.attach_bhattacharyya_roots(roots)
+    assert index.bhattacharyya_roots is roots
+    query = make_index(n=1, seed=4).matrix[0]
+    np.testing.assert_allclose(index.scores(query, 'bhattacharyya'),
+                               reference_scores(index, query, 'bhattacharyya'), rtol=1e-4, atol=1e-5)
+
+def test_bhattacharyya_roots_refused_for_negative_values():
+    index = make_index(signed=True)
+    assert not compute_bhattacharyya_roots(index.matrix, np.empty_like(index.matrix))
+
+def test_bhattacharyya_negative_values_match_reference(monkeypatch):
+    # Valeurs négatives : calcul élément par élément (NaN aux mêmes endroits que la version scalaire)
+    monkeypatch.setattr(engine, 'SCORING_CHUNK_ROWS', 7)
+    index = make_index(signed=True)
+    query = make_index(n=1, seed=5, signed=True).matrix[0]
+    np.testing.assert_allclose(index.scores(query, 'bhattacharyya'),
+                               reference_scores(index, query, 'bhattacharyya'), rtol=1e-4, atol=1e-5, equal_nan=True)
+
+def test_scores_reject_wrong_dimension():
+    with pytest.raises(ValueError):
+        make_index().scores(np.zeros(5, dtype=np.float32))
+
+# 2. SÉLECTION DES MEILLEURS RÉSULTATS
+# ==============================================================================
+@pytest.mark.parametrize('k', [1, 5, 39, 40, 100])
+def test_top_k_matches_full_sort(k):
+    scores = make_index(n=1, dim=40, seed=6).matrix[0]
+    np.testing.assert_array_equal(top_k(scores, k), np.argsort(scores, kind='stable')[:k])
+
+def test_top_k_with_ties():
+    scores = np.array([3.0, 1.0, 2.0, 1.0, 2.0, 1.0, 0.5], dtype=np.float32)
+    for k in range(len(scores) + 1):
+        indices = top_k(scores, k)
+        assert len(indices) == k and len(set(indices.tolist())) == k
+        # Mêmes distances que le tri complet, dans l'ordre croissant (les ex aequo
+        # à la limite du top k peuvent être n'importe lesquels d'entre eux)
+        np.testing.assert_array_equal(scores[indices], np.sort(scores)[:k])
+    # Classement complet : tri stable, les ex aequo gardent l'ordre des lignes
+    np.testing.assert_array_equal(top_k(scores, len(scores)), np.argsort(scores, kind='stable'))
+
+def test_top_k_empty():
+    assert len(top_k(np.empty(0, dtype=np.float32), 5)) == 0
+    assert len(top_k(np.ones(3, dtype=np.float32), 0)) == 0
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+# --- Local imports ---
+from src.engine import FeatureIndex
+from src.ivf import IVFIndex
+
+def make_index(n, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return FeatureIndex([f"{i}.jpg" for i in range(n)], rng.random((n, dim), dtype=np.float32))
+
+def test_build_empty_index():
+    assert IVFIndex.build(make_index(0), 'euclidean', n_lists=4) is None
+
+@pytest.mark.parametrize('n', [1, 3])
+def test_build_clamps_lists_to_rows(n):
+    ivf = IVFIndex.build(make_index(n), 'euclidean', n_lists=16)
+    assert ivf.n_lists == n
+    assert ivf.offsets[-1] == n and sorted(ivf.rows.tolist()) == list(range(n))
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+# --- PyTorch specific imports ---
+import torch
+from PIL import Image, ImageFilter
+# --- Local imports ---
+from src.backends import build_backend
+from src.config import MODELS_TO_INDEX, PREPROCESS_MIN_COSINE
+from src.models import build_model
+from src.preprocessing import (CROP_SIZE, REFERENCE_TRANSFORM, RESIZE_SIZE, compare_with_reference, open_image,
+                               preprocess_batch)
+
+# Tailles des images de test : grandes (décodage réduit 1/2, 1/4, 1/8), portrait,
+# et trop petite pour être réduite
+FIXTURE_SIZES = [(1024, 768), (600, 900), (2400, 1600), (300, 260)]
+
+@pytest.fixture(scope='module')
+def jpeg_images(tmp_path_factory):
+    """JPEG synthétiques proches de photos (dégradés, taches floues), de tailles variées."""
+    directory = tmp_path_factory.mktemp('images')
+    rng = np.random.default_rng(0)
+    paths = []
+    for i, (width, height) in enumerate(FIXTURE_SIZES):
+        y, x = np.mgrid[0:height, 0:width] / max(width, height)
+        gradients = np.stack([np.sin(6 * x + i) * 0.5 + 0.5, np.cos(5 * x * y + i) * 0.5 + 0.5, (x + y) / 2], axis=-1)
+        blobs = np.kron(rng.random((height // 16 + 1, width // 16 + 1, 3)), np.ones((16, 16, 1)))[:height, :width]
+        image = Image.fromarray(((0.7 * gradients + 0.3 * blobs) * 255).astype(np.uint8))
+        path = directory / f"{i}.jpg"
+        image.filter(ImageFilter.GaussianBlur(2)).save(path, quality=90)
+        paths.append(str(path))
+    return paths
+
+def cosine(a, b):
+    return np.einsum('ij,ij->i', a, b) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12)
+
+def test_draft_decoding_keeps_resize_size(jpeg_images):
+    for path, size in zip(jpeg_images, FIXTURE_SIZES):
+        image = open_image(path, draft=True)
+        assert min(image.size) >= min(RESIZE_SIZE, min(size))
+        assert image.size[0] <= size[0] and image.size[1] <= size[1]
+
+def test_fast_tensors_match_reference(jpeg_images):
+    # Entrées des modèles : indépendant des poids pré-entraînés
+    reference = torch.stack([REFERENCE_TRANSFORM(Image.open(path).convert('RGB')) for path in jpeg_images])
+    fast = preprocess_batch(jpeg_images, draft=True)
+    assert fast.shape == reference.shape == (len(jpeg_images), 3, CROP_SIZE, CROP_SIZE)
+    assert cosine(reference.flatten(1).numpy(), fast.flatten(1).numpy()).min() >= PREPROCESS_MIN_COSINE
+
+@pytest.mark.parametrize('model_name', list(MODELS_TO_INDEX))
+def test_draft_descriptors_within_tolerance(jpeg_images, model_name):
+    try:
+        model = build_model(model_name)
+    except OSError as e:
+        pytest.skip(f"Poids pré-entraînés de '{model_name}' indisponibles ({e})")
+    report = compare_with_reference(build_backend(model_name, model, torch.device('cpu'), 'eager'),
+                                    jpeg_images, draft=True)
+    assert report['min_cosine'] >= PREPROCESS_MIN_COSINE, report